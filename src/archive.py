@@ -0,0 +1,155 @@
+# Reading the input files straight out of a data drop archive, without unpacking it.
+#
+# Any path the importer reads may run through a .zip, .tar, .tar.gz or .tgz file as if it were a
+# directory, e.g. with CLIMO_DATA_DIR=/drops/climo_2024.tar.gz the ppt station file is read from
+#
+#   /drops/climo_2024.tar.gz/composite_station_info/ppt_composite_station_file.csv
+#
+# Each archive is indexed once, on first use, and its members are then streamed on demand. Zip and
+# plain tar members are read in place. A gzip stream can't be seeked, and the importer reads members
+# in its own order rather than the archive's, so a compressed tar is decompressed once, sequentially,
+# into an anonymous temporary file; that is still one file rather than a tree of hundreds of thousands
+# of small ones. It needs free space in the temporary directory (TMPDIR) for the whole uncompressed
+# archive, and no file can be read until it has all been decompressed; use a .zip or a plain .tar to
+# avoid both. The spool's size is logged. Archives stay open for the whole run, call
+# close_archives() once every file has been read to close them and remove their temporary files.
+#
+# Individual files may also be gzip compressed, on disk or in an archive: if `x.csv` doesn't exist,
+# `x.csv.gz` is read instead.
+
+import gzip
+import io
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from typing import IO, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+archive_suffixes = (".zip", ".tar", ".tar.gz", ".tgz")
+compressed_tar_suffixes = (".tar.gz", ".tgz")
+
+
+def is_archive(path: str) -> bool:
+    return path.rstrip("/").endswith(archive_suffixes) and os.path.isfile(path.rstrip("/"))
+
+
+def split_archive_path(path: str) -> Optional[Tuple[str, str]]:
+    """ Split a path running through an archive into the archive's path and the member's name,
+    or None if it doesn't run through one.
+    """
+    parts = path.split("/")
+    for i in range(1, len(parts)):
+        prefix = "/".join(parts[:i])
+        if prefix.endswith(archive_suffixes) and os.path.isfile(prefix):
+            return prefix, "/".join(part for part in parts[i:] if part)
+    return None
+
+
+def member_name(name: str) -> str:
+    """ Member names as they are looked up, without a leading ./ """
+    while name.startswith("./"):
+        name = name[2:]
+    return name
+
+
+class Archive():
+    """ An indexed archive of input files, opened once and read member by member. """
+    def __init__(self, path: str):
+        self.path = path
+        # the decompressed copy of a compressed tar
+        self.spool: Optional[IO[bytes]] = None
+        if path.endswith(".zip"):
+            self.zip: Optional[zipfile.ZipFile] = zipfile.ZipFile(path)
+            self.tar: Optional[tarfile.TarFile] = None
+            self.members: Dict[str, object] = {
+                member_name(info.filename): info for info in self.zip.infolist() if not info.is_dir()
+            }
+        else:
+            self.zip = None
+            if path.endswith(compressed_tar_suffixes):
+                self.spool = tempfile.TemporaryFile()
+                with gzip.open(path, "rb") as compressed:
+                    shutil.copyfileobj(compressed, self.spool, 1024 * 1024)
+                logger.info(f"Decompressed {path} into a {self.spool.tell() / 2**20:.1f} MiB temporary file")
+                self.spool.seek(0)
+                self.tar = tarfile.open(fileobj=self.spool, mode="r:")
+            else:
+                self.tar = tarfile.open(path, mode="r:")
+            self.members = {member_name(info.name): info for info in self.tar.getmembers() if info.isfile()}
+        logger.info(f"Indexed {len(self.members)} files in archive {path}")
+
+    def __repr__(self):
+        return f"Archive(path={self.path}, members={len(self.members)})"
+
+    def __contains__(self, name: str) -> bool:
+        return member_name(name) in self.members
+
+    def open(self, name: str) -> IO[bytes]:
+        info = self.members.get(member_name(name))
+        if info is None:
+            raise FileNotFoundError(f"No such file in archive {self.path}: {name}")
+        if self.zip is not None:
+            return self.zip.open(info)
+        return self.tar.extractfile(info)
+
+    def close(self) -> None:
+        if self.zip is not None:
+            self.zip.close()
+        if self.tar is not None:
+            self.tar.close()
+        if self.spool is not None:
+            self.spool.close()
+
+
+# archive path -> Archive, indexed on first use
+archives: Dict[str, Archive] = {}
+
+
+def get_archive(path: str) -> Archive:
+    archive = archives.get(path)
+    if archive is None:
+        archive = archives[path] = Archive(path)
+    return archive
+
+
+def close_archives() -> None:
+    for archive in archives.values():
+        archive.close()
+    archives.clear()
+
+
+class ClosingGzipFile(gzip.GzipFile):
+    """ A GzipFile over an already open file, which it closes too. """
+    def __init__(self, source: IO[bytes]):
+        super().__init__(fileobj=source, mode="rb")
+        self.source = source
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self.source.close()
+
+
+def open_text(path: str) -> IO[str]:
+    """ Open an input file for reading as text, whether it is on disk or in an archive, and read its
+    gzip compressed version if it doesn't exist. Raises FileNotFoundError if neither does.
+    """
+    split = split_archive_path(path)
+    if split is None:
+        try:
+            return open(path, "r")
+        except FileNotFoundError:
+            if not os.path.isfile(f"{path}.gz"):
+                raise
+            return gzip.open(f"{path}.gz", "rt")
+
+    archive_path, name = split
+    source = get_archive(archive_path)
+    if name in source:
+        return io.TextIOWrapper(source.open(name), encoding="utf-8")
+    return io.TextIOWrapper(ClosingGzipFile(source.open(f"{name}.gz")), encoding="utf-8")
@@ -0,0 +1,183 @@
+# Offline load files for `main.py --dry-run --emit DIR`. Instead of inserting through a session, the
+# import writes stations, station-history links and values as PostgreSQL COPY text files, with
+# station IDs assigned from a given offset, plus a psql script that loads them in one transaction:
+#
+#   cd DIR && psql -h dbhost -d crmp -f load.sql
+#
+# Periods and variables are referred to by their natural keys (start/end date, net_var_name) in the
+# files and resolved to IDs by the load script, so the files don't depend on IDs in the database.
+# The script only creates the periods and variables missing from the database, so load files can be
+# loaded into a database that already has them, e.g. next to an earlier load.
+
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from pycds import ClimatologicalPeriod, ClimatologicalStation, ClimatologicalStationXHistory, ClimatologicalValue, ClimatologicalVariable # type: ignore
+
+stations_file = "stations.tsv"
+station_histories_file = "station_histories.tsv"
+values_file = "values.tsv"
+load_script_file = "load.sql"
+
+
+def column_name(model, key: str) -> str:
+    """ The database column name of an ORM attribute. """
+    return sa.inspect(model).columns[key].name
+
+
+def copy_field(value: Any) -> str:
+    """ Format a value for COPY's text format. """
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def compile_statement(statement) -> str:
+    return str(statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def insert_missing(model, rows: List[Dict[str, Any]], keys: List[str]):
+    """ INSERT ... SELECT of `rows` into `model`'s table, skipping the rows whose `keys` match an existing row. """
+    columns = list(rows[0])
+    new_rows = sa.values(
+        *[sa.column(column, getattr(model, column).type) for column in columns], name="new_rows"
+    ).data([tuple(row[column] for column in columns) for row in rows])
+    # VALUES literals are text to PostgreSQL, cast them to the table's types
+    typed = {column: sa.cast(new_rows.c[column], getattr(model, column).type) for column in columns}
+    existing = sa.exists().where(*[getattr(model, key) == typed[key] for key in keys])
+    return sa.insert(model).from_select(
+        [getattr(model, column) for column in columns],
+        sa.select(*typed.values()).where(~existing),
+    )
+
+
+class LoadFileWriter():
+    """ Writes the rows of an import to COPY files in `directory`, numbering stations from
+    `first_station_id`. Call close() to finish the files and write the load script.
+    """
+    def __init__(self, directory: str, first_station_id: int = 1):
+        if first_station_id < 1:
+            raise ValueError(f"first_station_id must be positive, got {first_station_id}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.first_station_id = first_station_id
+        self.next_station_id = first_station_id
+        self.setup_statements: List[str] = []
+        self.rows: Dict[str, int] = {stations_file: 0, station_histories_file: 0, values_file: 0}
+        self.files = {name: open(os.path.join(directory, name), "w", newline="") for name in self.rows}
+        # rows held back inside a savepoint
+        self.held: Optional[List[Tuple[str, tuple]]] = None
+
+    def __repr__(self):
+        return f"LoadFileWriter(directory={self.directory}, next_station_id={self.next_station_id}, rows={self.rows})"
+
+    def write_row(self, name: str, *values) -> None:
+        if self.held is not None:
+            self.held.append((name, values))
+            return
+        self.files[name].write("\t".join(copy_field(v) for v in values) + "\n")
+        self.rows[name] += 1
+
+    @contextmanager
+    def savepoint(self) -> Iterator[None]:
+        """ Hold back the rows written in the block, writing them only if it completes, and
+        reuse the station IDs it assigned if it fails.
+        """
+        self.held = []
+        next_station_id = self.next_station_id
+        try:
+            yield
+        except BaseException:
+            self.held = None
+            self.next_station_id = next_station_id
+            raise
+        held, self.held = self.held, None
+        for name, values in held:
+            self.write_row(name, *values)
+
+    def add_periods(self, periods) -> None:
+        """ Create the given PeriodDefinitions when loading, unless they exist. """
+        self.setup_statements.append(compile_statement(insert_missing(
+            ClimatologicalPeriod,
+            [dict(start_date=datetime.fromisoformat(p.start_date), end_date=datetime.fromisoformat(p.end_date)) for p in periods],
+            ["start_date", "end_date"],
+        )))
+
+    def add_variables(self, definitions: List[Dict[str, str]]) -> None:
+        """ Create the given climatological variables when loading, unless they exist. """
+        self.setup_statements.append(compile_statement(insert_missing(ClimatologicalVariable, definitions, ["net_var_name"])))
+
+    def add_station(self, station_type: str, basin_id: Optional[int], period) -> int:
+        """ Write a station for a PeriodDefinition and return its assigned ID. """
+        station_id = self.next_station_id
+        self.next_station_id += 1
+        self.write_row(stations_file, station_id, station_type, basin_id, "", period.start_date, period.end_date)
+        return station_id
+
+    def add_station_history(self, station_id: int, history_id: int, role: str) -> None:
+        self.write_row(station_histories_file, station_id, history_id, role)
+
+    def add_value(self, station_id: int, net_var_name: str, value_time: str, value: float, num_contributing_years: int) -> None:
+        self.write_row(values_file, station_id, net_var_name, value_time, value, num_contributing_years)
+
+    def close(self) -> None:
+        for f in self.files.values():
+            f.close()
+        with open(os.path.join(self.directory, load_script_file), "w") as f:
+            f.write(self.load_script())
+
+    def load_script(self) -> str:
+        """ The psql script loading the files, run with `psql -f load.sql` from the directory holding them. """
+        period = ClimatologicalPeriod.__table__.fullname
+        period_id = column_name(ClimatologicalPeriod, "id")
+        variable = ClimatologicalVariable.__table__.fullname
+        variable_id = column_name(ClimatologicalVariable, "id")
+        station = ClimatologicalStation.__table__.fullname
+        station_id = column_name(ClimatologicalStation, "id")
+        x_hist = ClimatologicalStationXHistory.__table__.fullname
+        value = ClimatologicalValue.__table__.fullname
+
+        def cols(model, *keys):
+            return ", ".join(column_name(model, key) for key in keys)
+
+        lines = [
+            "-- Generated by main.py --dry-run, load from this directory with: psql -f load.sql",
+            f"-- {self.rows[stations_file]} stations (IDs {self.first_station_id} to {self.next_station_id - 1}), "
+            f"{self.rows[station_histories_file]} station history links, {self.rows[values_file]} values",
+            "\\set ON_ERROR_STOP on",
+            "BEGIN;",
+            "",
+        ]
+        lines += [statement + ";" for statement in self.setup_statements]
+        lines += [
+            "",
+            "-- refuse to load over existing stations",
+            "DO $$ BEGIN",
+            f"    IF EXISTS (SELECT 1 FROM {station} WHERE {station_id} >= {self.first_station_id}) THEN",
+            f"        RAISE EXCEPTION 'station IDs from {self.first_station_id} are already in use, regenerate with a higher --first-station-id';",
+            "    END IF;",
+            "END $$;",
+            "",
+            "CREATE TEMPORARY TABLE load_station (id integer, type text, basin_id integer, comments text, start_date date, end_date date) ON COMMIT DROP;",
+            f"\\copy load_station FROM '{stations_file}'",
+            f"INSERT INTO {station} ({cols(ClimatologicalStation, 'id', 'type', 'basin_id', 'comments', 'climo_period_id')})",
+            f"    SELECT s.id, s.type, s.basin_id, s.comments, p.{period_id} FROM load_station s",
+            f"    JOIN {period} p ON p.{column_name(ClimatologicalPeriod, 'start_date')} = s.start_date AND p.{column_name(ClimatologicalPeriod, 'end_date')} = s.end_date;",
+            f"SELECT setval(pg_get_serial_sequence('{station}', '{station_id}'), (SELECT max({station_id}) FROM {station}));",
+            "",
+            f"\\copy {x_hist} ({cols(ClimatologicalStationXHistory, 'climo_station_id', 'history_id', 'role')}) FROM '{station_histories_file}'",
+            "",
+            "CREATE TEMPORARY TABLE load_value (station_id integer, net_var_name text, value_time timestamp, value double precision, num_contributing_years integer) ON COMMIT DROP;",
+            f"\\copy load_value FROM '{values_file}'",
+            f"INSERT INTO {value} ({cols(ClimatologicalValue, 'climo_station_id', 'climo_variable_id', 'value_time', 'value', 'num_contributing_years')})",
+            f"    SELECT v.station_id, cv.{variable_id}, v.value_time, v.value, v.num_contributing_years FROM load_value v",
+            f"    JOIN {variable} cv ON cv.{column_name(ClimatologicalVariable, 'net_var_name')} = v.net_var_name;",
+            "",
+            "COMMIT;",
+            f"ANALYZE {station}, {x_hist}, {value};",
+        ]
+        return "\n".join(lines) + "\n"
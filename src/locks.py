@@ -0,0 +1,43 @@
+# PostgreSQL advisory locks coordinating importer runs against the same database, so that e.g. one
+# cron job per variable can run in parallel.
+#
+# The setup phase takes one global lock while it creates whatever periods and variables are missing,
+# and commits straight away to release it. Each variable's stations are then generated under that
+# variable's own lock, held until the import commits, so two runs for the same variable queue up while
+# runs for different variables proceed together. A run takes all its variable locks before importing
+# any, in sorted order, so runs sharing more than one variable can't deadlock. All locks are transaction level, released by
+# PostgreSQL on commit or rollback, even if the importer dies.
+
+import logging
+import zlib
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# first key of every lock, keeping them apart from other applications' advisory locks
+lock_namespace = zlib.crc32(b"climo-data-importer") & 0x7FFFFFFF
+
+setup_lock = "setup"
+
+
+def lock_key(name: str) -> int:
+    """ The second key of the named lock, a stable 31-bit hash of its name. """
+    return zlib.crc32(name.encode()) & 0x7FFFFFFF
+
+
+def variable_lock(variable: str) -> str:
+    return f"variable:{variable}"
+
+
+def advisory_lock(session: Session, name: str) -> None:
+    """ Take the named lock for the rest of the session's transaction, waiting for it if another
+    run holds it.
+    """
+    params = {"namespace": lock_namespace, "key": lock_key(name)}
+    acquired = session.execute(sa.text("SELECT pg_try_advisory_xact_lock(:namespace, :key)"), params).scalar()
+    if acquired is False:
+        logger.info(f"Waiting for the '{name}' lock, held by another import")
+        session.execute(sa.text("SELECT pg_advisory_xact_lock(:namespace, :key)"), params)
+    logger.info(f"Acquired the '{name}' lock")
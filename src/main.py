@@ -1,10 +1,24 @@
+import argparse
+import cProfile
 import csv
 import logging
 import os
-from pycds import ClimatologicalPeriod, ClimatologicalStation, ClimatologicalStationXHistory, ClimatologicalValue, ClimatologicalVariable # type: ignore
+import pstats
+import zlib
+from contextlib import nullcontext
+from pycds import ClimatologicalPeriod, ClimatologicalStation, ClimatologicalStationXHistory, ClimatologicalValue, ClimatologicalVariable, History # type: ignore
 import sqlalchemy as sa
 # start by reading files
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional, Set, Tuple
+
+from archive import close_archives, is_archive, open_text
+from emit import LoadFileWriter
+from locks import advisory_lock, setup_lock, variable_lock
+from metrics import ImportMetrics
+from parquet_export import ParquetExporter
+from post_load import refresh_after_load
+from quarantine import Quarantine, describe
+from shadow import prepare_shadow_tables, shadow_engine, swap_shadow_tables
 
 
 from sqlalchemy.orm import Session
@@ -22,6 +36,9 @@ logger = logging.getLogger(__name__)
 
 # csv file targets, configurable via environment variable
 basedir = os.getenv("CLIMO_DATA_DIR", "/data/")
+# CLIMO_DATA_DIR may also name an archive of the data tree, read in place, see archive.py
+if is_archive(basedir) and not basedir.endswith("/"):
+    basedir = f"{basedir}/"
 composite_station_info_dir = f"{basedir}composite_station_info/"
 
 ppt_fill = "ppt"
@@ -45,6 +62,30 @@ clim_1971_2000 = "1971_2000"
 clim_1981_2010 = "1981_2010"
 clim_1991_2020 = "1991_2020"
 
+class PeriodDefinition():
+    """ A climatology normals period: its label (as used in data file paths), date range
+    and the column prefix used for it in the composite station info files.
+    """
+    def __init__(self, label: str, start_date: str, end_date: str, column_prefix: str):
+        self.label = label
+        self.start_date = start_date
+        self.end_date = end_date
+        self.column_prefix = column_prefix
+        # column names are built once here rather than for every row parsed
+        self.monthlyyears_columns = [f"monthlyyears_{column_prefix}_{i}" for i in range(1, 13)]
+        self.joint_stations_columns = [f"joint_stations_{column_prefix}_{i}" for i in range(1, 4)]
+
+    def __repr__(self):
+        return f"PeriodDefinition(label={self.label}, start_date={self.start_date}, end_date={self.end_date}, column_prefix={self.column_prefix})"
+
+# The periods we import, in order. A new normals period only needs an entry here.
+climatology_periods: List[PeriodDefinition] = [
+    PeriodDefinition(clim_1971_2000, "1971-01-01", "2000-12-31", "1971"),
+    PeriodDefinition(clim_1981_2010, "1981-01-01", "2010-12-31", "1981"),
+    PeriodDefinition(clim_1991_2020, "1991-01-01", "2020-12-31", "1991"),
+]
+period_labels: List[str] = [period.label for period in climatology_periods]
+
 # {0} = variable (ppt, tmax, tmin)
 # {1} = climatology period (1971_2000, 1981_2010, 1991_2020)
 # {2} = station identifier (station_id)
@@ -63,25 +104,68 @@ class HistoryLine():
         self.lon: float = float(line['lon'])
         self.elev: float = float(line['elev'])
         # basin isn't always available, it'll an int id or "NaN"
-        basin_val = line['basin']
-        self.basin: int | None = None if basin_val == "NaN" or basin_val == "" else int(basin_val)
-        # some of these are empty strings, but we should have a complete set or nothing
-        self.monthlyyears_1971: list[int | None] = [int(line[f'monthlyyears_1971_{i}']) if line[f'monthlyyears_1971_{i}'] not in ["NaN", ""] else None for i in range(1, 13)]
-        self.joint_stations_1971: list[int | None] = [int(line[f'joint_stations_1971_{i}']) if line[f'joint_stations_1971_{i}'] not in ["NaN", ""] else None for i in range(1, 4)]
-        self.monthlyyears_1981: list[int | None] = [int(line[f'monthlyyears_1981_{i}']) if line[f'monthlyyears_1981_{i}'] not in ["NaN", ""] else None for i in range(1, 13)]
-        self.joint_stations_1981: list[int | None] = [int(line[f'joint_stations_1981_{i}']) if line[f'joint_stations_1981_{i}'] not in ["NaN", ""] else None for i in range(1, 4)]
-        self.monthlyyears_1991: list[int | None] = [int(line[f'monthlyyears_1991_{i}']) if line[f'monthlyyears_1991_{i}'] not in ["NaN", ""] else None for i in range(1, 13)]
-        self.joint_stations_1991: list[int | None] = [int(line[f'joint_stations_1991_{i}']) if line[f'joint_stations_1991_{i}'] not in ["NaN", ""] else None for i in range(1, 4)]
-
-        # we can do some quick existence checks based on if we have data available for each period
-        self.has_1971_data = all(self.monthlyyears_1971)
-        self.has_1981_data = all(self.monthlyyears_1981)
-        self.has_1991_data = all(self.monthlyyears_1991)
+        self.basin: int | None = parse_optional_int(line['basin'])
+        # Per period values, keyed by period label. Some of these are empty strings,
+        # but we should have a complete set or nothing
+        self.monthlyyears: Dict[str, list[int | None]] = {}
+        self.joint_stations: Dict[str, list[int | None]] = {}
+        self.has_data: Dict[str, bool] = {}
+        for period in climatology_periods:
+            monthlyyears = [parse_optional_int(line[column]) for column in period.monthlyyears_columns]
+            joint_stations = [parse_optional_int(line[column]) for column in period.joint_stations_columns]
+            # we can do some quick existence checks based on if we have data available for each period
+            has_data = all(monthlyyears)
+
+            self.monthlyyears[period.label] = monthlyyears
+            self.joint_stations[period.label] = joint_stations
+            self.has_data[period.label] = has_data
+
+    # the original per-period attributes of the three legacy periods, other periods are only in the dicts
+    @property
+    def monthlyyears_1971(self) -> list[int | None]:
+        return self.monthlyyears[clim_1971_2000]
+
+    @property
+    def joint_stations_1971(self) -> list[int | None]:
+        return self.joint_stations[clim_1971_2000]
+
+    @property
+    def has_1971_data(self) -> bool:
+        return self.has_data[clim_1971_2000]
+
+    @property
+    def monthlyyears_1981(self) -> list[int | None]:
+        return self.monthlyyears[clim_1981_2010]
+
+    @property
+    def joint_stations_1981(self) -> list[int | None]:
+        return self.joint_stations[clim_1981_2010]
+
+    @property
+    def has_1981_data(self) -> bool:
+        return self.has_data[clim_1981_2010]
+
+    @property
+    def monthlyyears_1991(self) -> list[int | None]:
+        return self.monthlyyears[clim_1991_2020]
+
+    @property
+    def joint_stations_1991(self) -> list[int | None]:
+        return self.joint_stations[clim_1991_2020]
+
+    @property
+    def has_1991_data(self) -> bool:
+        return self.has_data[clim_1991_2020]
 
     # helper to print a line when printing
     def __repr__(self):
-        return f"HistoryLine(history_id={self.history_id}, lat={self.lat}, lon={self.lon}, elev={self.elev}, basin={self.basin}, has_1971_data={self.has_1971_data}, has_1981_data={self.has_1981_data}, has_1991_data={self.has_1991_data})"
-        
+        has_data = ", ".join(f"has_{period.column_prefix}_data={self.has_data[period.label]}" for period in climatology_periods if period.label in self.has_data)
+        return f"HistoryLine(history_id={self.history_id}, lat={self.lat}, lon={self.lon}, elev={self.elev}, basin={self.basin}, {has_data})"
+
+
+def parse_optional_int(value: str) -> int | None:
+    """ Parse an integer column that may be empty or "NaN". """
+    return None if value == "" or value == "NaN" else int(value)
 
 # Deserialize line based on:
 # obs_time	datum
@@ -95,22 +179,85 @@ class StationDataLine():
         return f"StationDataLine(obs_time={self.obs_time}, datum={self.datum})"
 
 
+class ImportFilter():
+    """ Restricts an import to a subset of climatology periods and histories, e.g. to import
+    only tmax 1991_2020 for a handful of stations. The default filter includes everything.
+    Filtered imports only insert, data being reloaded has to be purged first (see purge.py).
+    """
+    def __init__(self,
+                 periods: Optional[List[str]] = None,
+                 history_ids: Optional[Set[int]] = None,
+                 history_ranges: Optional[List[Tuple[int, int]]] = None,
+                 sample_fraction: Optional[float] = None,
+                 seed: int = 0):
+        unknown = [p for p in periods or [] if p not in period_labels]
+        if unknown:
+            raise ValueError(f"Unknown climatology periods: {unknown}")
+        if sample_fraction is not None and not 0 < sample_fraction <= 1:
+            raise ValueError(f"Sample fraction must be in (0, 1], got {sample_fraction}")
+
+        self.periods: Optional[Set[str]] = set(periods) if periods else None
+        self.history_ids: Set[int] = set(history_ids or [])
+        self.history_ranges: List[Tuple[int, int]] = list(history_ranges or [])
+        self.sample_fraction = sample_fraction
+        self.seed = seed
+
+    def includes_period(self, period: str) -> bool:
+        return self.periods is None or period in self.periods
+
+    def includes_history(self, history_id: int) -> bool:
+        if self.history_ids or self.history_ranges:
+            if history_id not in self.history_ids and not any(lo <= history_id <= hi for lo, hi in self.history_ranges):
+                return False
+        if self.sample_fraction is not None:
+            # hash rather than random() so a history is sampled the same way for every variable and run
+            return zlib.crc32(f"{self.seed}:{history_id}".encode()) / 2**32 < self.sample_fraction
+        return True
+
+    def __repr__(self):
+        return f"ImportFilter(periods={self.periods}, history_ids={sorted(self.history_ids)}, history_ranges={self.history_ranges}, sample_fraction={self.sample_fraction}, seed={self.seed})"
+
+
+def parse_history_id_spec(spec: str) -> Tuple[Set[int], List[Tuple[int, int]]]:
+    """ Parse a comma separated list of history IDs and inclusive ranges, e.g. "404,406,11000-11999". """
+    history_ids: Set[int] = set()
+    history_ranges: List[Tuple[int, int]] = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            lo, hi = part.split("-", 1)
+            history_ranges.append((int(lo), int(hi)))
+        else:
+            history_ids.add(int(part))
+    return history_ids, history_ranges
+
+
 ## Utility functions to read files
 
-def read_station_info_file(variable: str) -> List[HistoryLine]:
+def read_station_info_file(variable: str, malformed: Optional[Callable[[int, Dict[str, str], Exception], None]] = None) -> List[HistoryLine]:
     """ Read the station info file for a given variable (ppt, tmax, tmin) 
     and return a list of HistoryLine objects.
+    With `malformed`, rows that can't be parsed are passed to it with their line number and skipped
+    instead of failing the whole file.
     """
     station_file = station_info_template.format(variable)
     logger.info(f"Reading station info file for variable '{variable}': {station_file}")
     
     stations: List[HistoryLine] = []
     try:
-        with open(station_file, 'r') as f:
+        with open_text(station_file) as f:
             reader = csv.DictReader(f)
             row_count = 0
             for row in reader:
-                stations.append(HistoryLine(row))
+                try:
+                    stations.append(HistoryLine(row))
+                except (ValueError, KeyError, TypeError) as e:
+                    if malformed is None:
+                        raise
+                    malformed(reader.line_num, row, e)
+                    continue
                 row_count += 1
         
         logger.info(f"Successfully read {row_count} station records for variable '{variable}'")
@@ -131,7 +278,7 @@ def read_data_file(variable: str, climatology_period: str, station_id: str) -> L
     
     data: List[StationDataLine] = []
     try:
-        with open(data_file, 'r') as f:
+        with open_text(data_file) as f:
             reader = csv.DictReader(f)
             row_count = 0
             for row in reader:
@@ -158,65 +305,76 @@ def read_data_file(variable: str, climatology_period: str, station_id: str) -> L
 # ClimatologicalValue: The actual data values, linked to station, variable
 
 def generate_climatological_periods(session: Session) -> None:
-    """ Generate the climatological periods in the database. """
+    """ Generate the climatological periods missing from the database. """
     logger.info("Creating climatological periods in database...")
     
+    existing = {(str(p.start_date)[:10], str(p.end_date)[:10]) for p in session.query(ClimatologicalPeriod)}
     periods = [
-        ClimatologicalPeriod(start_date="1971-01-01", end_date="2000-12-31"),
-        ClimatologicalPeriod(start_date="1981-01-01", end_date="2010-12-31"),
-        ClimatologicalPeriod(start_date="1991-01-01", end_date="2020-12-31"),
+        ClimatologicalPeriod(start_date=period.start_date, end_date=period.end_date)
+        for period in climatology_periods
+        if (period.start_date, period.end_date) not in existing
     ]
+    if len(periods) < len(climatology_periods):
+        logger.info(f"{len(climatology_periods) - len(periods)} climatological periods already exist")
     
     session.add_all(periods)
     session.flush()  # Flush to ensure IDs are available for foreign keys
     
     logger.info(f"Successfully created {len(periods)} climatological periods")
 
+climatological_variable_definitions: List[Dict[str, str]] = [
+    dict(
+        duration="monthly",
+        unit="mm",
+        standard_name="lwe_thickness_of_precipitation_amount",
+        display_name="Precipitation Climatology",
+        short_name="lwe_thickness_of_precipitation_amount t: sum within months t: mean over years",
+        cell_methods="t: sum within months t: mean over years",
+        net_var_name="Precip_Climatology"
+    ),
+    dict(
+        duration="monthly",
+        unit="celsius",
+        standard_name="air_temperature",
+        display_name="Temperature Climatology (Max.)",
+        short_name="air_temperature t: maximum within days t: mean within months t: mean over years",
+        cell_methods="t: maximum within days t: mean within months t: mean over years",
+        net_var_name="Tx_Climatology"
+    ),
+    dict(
+        duration="monthly",
+        unit="celsius",
+        standard_name="air_temperature",
+        display_name="Temperature Climatology (Min.)",
+        short_name="air_temperature t: minimum within days t: mean within months t: mean over years",
+        cell_methods="t: minimum within days t: mean within months t: mean over years",
+        net_var_name="Tn_Climatology"
+    ),
+
+    # This isn't used for our imported data, but exists as part of the existing PCIC climatology
+    # values in obs_raw. Create it so it makes our lives easier later.
+    dict(
+        duration="monthly",
+        unit="celsius",
+        standard_name="air_temperature",
+        display_name="Temperature Climatology (Mean)",
+        short_name="air_temperature t: mean within days t: mean within months t: mean over years",
+        cell_methods="t: mean within days t: mean within months t: mean over years",
+        net_var_name="T_mean_Climatology"
+    ),
+]
+
 def generate_climatological_variables(session: Session) -> None:
-    """ Generate the climatological variables in database. """
+    """ Generate the climatological variables missing from the database. """
     logger.info("Creating climatological variables in database...")
     
+    existing = {v.net_var_name for v in session.query(ClimatologicalVariable)}
     variables = [
-        ClimatologicalVariable(
-            duration="monthly",
-            unit="mm",
-            standard_name="lwe_thickness_of_precipitation_amount",
-            display_name="Precipitation Climatology",
-            short_name="lwe_thickness_of_precipitation_amount t: sum within months t: mean over years",
-            cell_methods="t: sum within months t: mean over years",
-            net_var_name="Precip_Climatology"
-        ),
-        ClimatologicalVariable(
-            duration="monthly",
-            unit="celsius",
-            standard_name="air_temperature",
-            display_name="Temperature Climatology (Max.)",
-            short_name="air_temperature t: maximum within days t: mean within months t: mean over years",
-            cell_methods="t: maximum within days t: mean within months t: mean over years",
-            net_var_name="Tx_Climatology"
-        ),
-        ClimatologicalVariable(
-            duration="monthly",
-            unit="celsius",
-            standard_name="air_temperature",
-            display_name="Temperature Climatology (Min.)",
-            short_name="air_temperature t: minimum within days t: mean within months t: mean over years",
-            cell_methods="t: minimum within days t: mean within months t: mean over years",
-            net_var_name="Tn_Climatology"
-        ),
-
-        # This isn't used for our imported data, but exists as part of the existing PCIC climatology
-        # values in obs_raw. Create it so it makes our lives easier later.
-        ClimatologicalVariable(
-            duration="monthly",
-            unit="celsius",
-            standard_name="air_temperature",
-            display_name="Temperature Climatology (Mean)",
-            short_name="air_temperature t: mean within days t: mean within months t: mean over years",
-            cell_methods="t: mean within days t: mean within months t: mean over years",
-            net_var_name="T_mean_Climatology"
-        ),
+        ClimatologicalVariable(**definition) for definition in climatological_variable_definitions
+        if definition["net_var_name"] not in existing
     ]
+    if len(variables) < len(climatological_variable_definitions):
+        logger.info(f"{len(climatological_variable_definitions) - len(variables)} climatological variables already exist")
     
     session.add_all(variables)
     session.flush()  # Flush to ensure IDs are available for foreign keys
@@ -234,20 +392,17 @@ def get_joint_stations_for_period(session: Session, history_line: HistoryLine, c
     start_date_str = str(period.start_date)
     end_date_str = str(period.end_date)
     
-    if start_date_str == "1971-01-01" and end_date_str == "2000-12-31":
-        return history_line.joint_stations_1971
-    elif start_date_str == "1981-01-01" and end_date_str == "2010-12-31":
-        return history_line.joint_stations_1981
-    elif start_date_str == "1991-01-01" and end_date_str == "2020-12-31":
-        return history_line.joint_stations_1991
-    else:
-        raise ValueError(f"Unknown period: {start_date_str} to {end_date_str}")
+    for climatology_period in climatology_periods:
+        if start_date_str == climatology_period.start_date and end_date_str == climatology_period.end_date:
+            return history_line.joint_stations[climatology_period.label]
+    raise ValueError(f"Unknown period: {start_date_str} to {end_date_str}")
 
-def generate_station(session: Session, history_line: HistoryLine, climo_period_id: int):
+def generate_station(session: Session, history_line: HistoryLine, climo_period_id: int, joint_stations: Optional[List[int | None]] = None):
     logger.debug(f"Creating climatological station for history_id {history_line.history_id}, period_id {climo_period_id}")
     
-    # Get the joint stations for this specific period
-    joint_stations = get_joint_stations_for_period(session, history_line, climo_period_id)
+    # Get the joint stations for this specific period, if the caller doesn't already know them
+    if joint_stations is None:
+        joint_stations = get_joint_stations_for_period(session, history_line, climo_period_id)
     
     # Composite if we use any joint stations for this specific period
     station = ClimatologicalStation(
@@ -272,7 +427,7 @@ def generate_base_station_history(session: Session, station_id: int, history_id:
     )
     session.add(base_station)
 
-def generate_station_histories(session: Session, station_id: int, joint_stations: List[int | None]):
+def generate_station_histories(session: Session, station_id: int, joint_stations: List[int | None]) -> int:
     joint_count = 0
     for joint_id in joint_stations:
         # Skip None values - some joint_stations columns may be empty
@@ -290,8 +445,74 @@ def generate_station_histories(session: Session, station_id: int, joint_stations
     
     if joint_count > 0:
         logger.debug(f"Created {joint_count} joint station history links for station_id {station_id}")
+    return joint_count
 
-def generate_value_data(session: Session, variable: str, period: str, station_id: int, history_id: str, monthlyyears: list[int | None]):
+# bound parameters per statement are limited to 65535 by the PostgreSQL protocol, 3 per link row
+max_links_per_statement = 20000
+
+def build_link_rows(station_ids: List[int], history_ids: List[int], joint_matrix: List[List[int | None]]) -> List[Dict]:
+    """ Base and joint link rows for a batch of stations, given as parallel lists of station IDs,
+    base history IDs and rows of (up to 3) joint history IDs, with the empty joint slots dropped.
+    """
+    base = [
+        {"climo_station_id": station_id, "history_id": history_id, "role": "base"}
+        for station_id, history_id in zip(station_ids, history_ids)
+    ]
+    joint = [
+        {"climo_station_id": station_id, "history_id": joint_id, "role": "joint"}
+        for station_id, joint_row in zip(station_ids, joint_matrix)
+        for joint_id in joint_row
+        if joint_id is not None
+    ]
+    return base + joint
+
+def insert_station_links(session: Session, station_ids: List[int], history_ids: List[int], joint_matrix: List[List[int | None]]) -> int:
+    """ Insert the base and joint links for a batch of stations with one multi-row INSERT
+    (more only past max_links_per_statement rows). Returns the number of links inserted.
+    """
+    rows = build_link_rows(station_ids, history_ids, joint_matrix)
+    for start in range(0, len(rows), max_links_per_statement):
+        session.execute(sa.insert(ClimatologicalStationXHistory).values(rows[start:start + max_links_per_statement]))
+    logger.debug(f"Inserted {len(rows)} station history links for {len(station_ids)} stations")
+    return len(rows)
+
+def duplicate_histories(history_id: int, joint_stations: List[int | None]) -> List[int]:
+    """ Histories a station would be linked to more than once, as a joint station repeated or equal to its base history. """
+    seen = {history_id}
+    duplicates = []
+    for joint_id in joint_stations:
+        if joint_id is None:
+            continue
+        if joint_id in seen:
+            duplicates.append(joint_id)
+        seen.add(joint_id)
+    return duplicates
+
+class StationLinkBatch():
+    """ Collects the links of the stations created in a batch, to be written by insert_station_links. """
+    def __init__(self):
+        self.station_ids: List[int] = []
+        self.history_ids: List[int] = []
+        self.joint_matrix: List[List[int | None]] = []
+
+    def __repr__(self):
+        return f"StationLinkBatch(stations={len(self.station_ids)})"
+
+    def add(self, station_id: int, history_id: int, joint_stations: List[int | None]) -> None:
+        self.station_ids.append(station_id)
+        self.history_ids.append(history_id)
+        self.joint_matrix.append(joint_stations)
+
+    def write(self, session: Session) -> int:
+        """ Insert the collected links and start a new batch. """
+        if not self.station_ids:
+            return 0
+        count = insert_station_links(session, self.station_ids, self.history_ids, self.joint_matrix)
+        self.__init__()
+        return count
+
+def generate_value_data(session: Session, variable: str, period: str, station_id: int, history_id: str, monthlyyears: list[int | None],
+                        exporter: Optional[ParquetExporter] = None) -> int:
     """Generate climatological value data for a station from CSV files.
     
     Args:
@@ -301,6 +522,10 @@ def generate_value_data(session: Session, variable: str, period: str, station_id
         station_id: Climatological station ID
         history_id: History ID for reading the data file
         monthlyyears: List of 12 values indicating contributing years for each month
+        exporter: Optional Parquet exporter the values are also written to
+
+    Returns:
+        The number of values added
     """
     logger.debug(f"Processing value data for station_id {station_id}, variable '{variable}', period '{period}', history_id {history_id}")
     
@@ -334,9 +559,12 @@ def generate_value_data(session: Session, variable: str, period: str, station_id
             num_contributing_years=num_years
         )
         session.add(value)
+        if exporter is not None:
+            exporter.add_value(variable, period, station_id, idx + 1, data_line.obs_time, data_line.datum, num_years)
         values_added += 1
     
     logger.debug(f"Successfully added {values_added} climatological values for station_id {station_id} ({variable}, {period})")
+    return values_added
 
 
 def get_period_id_by_dates(session: Session, start_date: str, end_date: str):
@@ -349,112 +577,508 @@ def get_period_id_by_dates(session: Session, start_date: str, end_date: str):
         raise ValueError(f"Period {start_date} to {end_date} not found")
     return period.id
 
-def generate_climatological_stations(session: Session, variable: str) -> None:
-    """ Generate the climatological stations in the database for a given variable. """
-    logger.info(f"Starting climatological station generation for variable '{variable}'")
-    
-    # Get period IDs
-    period_1971_id = get_period_id_by_dates(session, "1971-01-01", "2000-12-31")
-    period_1981_id = get_period_id_by_dates(session, "1981-01-01", "2010-12-31")
-    period_1991_id = get_period_id_by_dates(session, "1991-01-01", "2020-12-31")
-    
-    logger.info(f"Period IDs: 1971-2000={period_1971_id}, 1981-2010={period_1981_id}, 1991-2020={period_1991_id}")
-    
-    history_lines = read_station_info_file(variable)
-    
-    # Track statistics
-    stations_1971 = 0
-    stations_1981 = 0
-    stations_1991 = 0
-    total_processed = 0
-    
+# errors from bad input data or rows the database rejects, which a tolerant import quarantines
+tolerated_errors = (OSError, ValueError, KeyError, sa.exc.DBAPIError)
+
+# (history_id, period label, joint history ids) -> climatological station ID, see shared_station_key
+SharedStations = Dict[Tuple[int, str, Tuple[int, ...]], int]
+
+def shared_station_key(history_line: HistoryLine, period: str) -> Tuple[int, str, Tuple[int, ...]]:
+    """ Stations built from the same history, period and joint stations are the same station whatever the variable. """
+    joint_ids = tuple(sorted(joint_id for joint_id in history_line.joint_stations[period] if joint_id is not None))
+    return (history_line.history_id, period, joint_ids)
+
+class DatabaseTarget():
+    """ Writes the stations, links and values of import_station_lines through a session.
+    Station history links are collected and inserted together, see StationLinkBatch, once per variable
+    or with `batch_size` every `batch_size` history lines, when the session is also flushed and emptied.
+    With `tolerant`, each station is written under its own savepoint.
+    """
+    def __init__(self, session: Session, batch_size: Optional[int] = None, tolerant: bool = False):
+        self.session = session
+        self.batch_size = batch_size
+        self.tolerant = tolerant
+        self.period_ids: Dict[str, int] = {}
+        # links are inserted once per batch rather than as ORM objects
+        self.link_batch = StationLinkBatch()
+        # the histories of the current batch that exist, checked up front by tolerant imports
+        self.known_histories: Optional[Set[int]] = None
+
+    def __repr__(self):
+        return f"DatabaseTarget(batch_size={self.batch_size}, tolerant={self.tolerant}, period_ids={self.period_ids})"
+
+    def start(self, periods: List[PeriodDefinition]) -> None:
+        self.period_ids = {period.label: get_period_id_by_dates(self.session, period.start_date, period.end_date) for period in periods}
+        logger.info(f"Period IDs: {self.period_ids}")
+
+    def start_line(self, idx: int, history_lines: List[HistoryLine]) -> None:
+        batch_size = self.batch_size or len(history_lines)
+        if self.tolerant and (idx - 1) % batch_size == 0:
+            # links are only inserted with the batch, after the stations' savepoints, so check the batch's histories exist up front
+            self.known_histories = find_histories(self.session, history_lines[idx - 1:idx - 1 + batch_size])
+
+    def savepoint(self):
+        return self.session.begin_nested() if self.tolerant else nullcontext()
+
+    def add_station(self, line: HistoryLine, period: PeriodDefinition, joint_stations: List[int | None]) -> Tuple[int, int]:
+        """ Create a station with its history links, returning its ID and the number of links. """
+        if self.known_histories is not None:
+            missing = [h for h in [line.history_id, *joint_stations] if h is not None and h not in self.known_histories]
+            if missing:
+                raise ValueError(f"histories not found: {missing}")
+        duplicates = duplicate_histories(line.history_id, joint_stations)
+        if duplicates:
+            # the batch's link INSERT would fail on them, outside the station's savepoint
+            raise ValueError(f"histories linked more than once: {duplicates}")
+        station = generate_station(self.session, line, self.period_ids[period.label], joint_stations)
+        return station.id, 1 + sum(joint_id is not None for joint_id in joint_stations)
+
+    def station_added(self, station_id: int, line: HistoryLine, joint_stations: List[int | None]) -> None:
+        self.link_batch.add(station_id, line.history_id, joint_stations)
+
+    def add_values(self, variable: str, period: PeriodDefinition, station_id: int, line: HistoryLine,
+                   exporter: Optional[ParquetExporter]) -> int:
+        return generate_value_data(self.session, variable, period.label, station_id, str(line.history_id), line.monthlyyears[period.label], exporter)
+
+    def end_line(self, idx: int) -> None:
+        if self.batch_size and idx % self.batch_size == 0:
+            self.link_batch.write(self.session)
+            expunge_batch(self.session)
+
+    def finish(self) -> None:
+        self.link_batch.write(self.session)
+
+
+class LoadFileTarget():
+    """ Writes the stations, links and values of import_station_lines to load files, see emit.py.
+    With `tolerant`, each station's rows are held back until it is complete.
+    """
+    def __init__(self, writer: LoadFileWriter, tolerant: bool = False):
+        self.writer = writer
+        self.tolerant = tolerant
+
+    def __repr__(self):
+        return f"LoadFileTarget(writer={self.writer}, tolerant={self.tolerant})"
+
+    def start(self, periods: List[PeriodDefinition]) -> None:
+        pass
+
+    def start_line(self, idx: int, history_lines: List[HistoryLine]) -> None:
+        pass
+
+    def savepoint(self):
+        return self.writer.savepoint() if self.tolerant else nullcontext()
+
+    def add_station(self, line: HistoryLine, period: PeriodDefinition, joint_stations: List[int | None]) -> Tuple[int, int]:
+        station_id = self.writer.add_station("composite" if any(joint_stations) else "long-record", line.basin, period)
+        self.writer.add_station_history(station_id, line.history_id, "base")
+        joint_ids = [joint_id for joint_id in joint_stations if joint_id is not None]
+        for joint_id in joint_ids:
+            self.writer.add_station_history(station_id, joint_id, "joint")
+        return station_id, 1 + len(joint_ids)
+
+    def station_added(self, station_id: int, line: HistoryLine, joint_stations: List[int | None]) -> None:
+        pass
+
+    def add_values(self, variable: str, period: PeriodDefinition, station_id: int, line: HistoryLine,
+                   exporter: Optional[ParquetExporter]) -> int:
+        data_lines = read_data_file(variable, period.label, str(line.history_id))
+        monthlyyears = line.monthlyyears[period.label]
+        for month, data_line in enumerate(data_lines, 1):
+            num_years = monthlyyears[month - 1] if month <= len(monthlyyears) and monthlyyears[month - 1] is not None else 0
+            self.writer.add_value(station_id, var_map[variable], data_line.obs_time, data_line.datum, num_years)
+            if exporter is not None:
+                exporter.add_value(variable, period.label, station_id, month, data_line.obs_time, data_line.datum, num_years)
+        return len(data_lines)
+
+    def end_line(self, idx: int) -> None:
+        pass
+
+    def finish(self) -> None:
+        pass
+
+
+def import_station_lines(target, variable: str, metrics: ImportMetrics, import_filter: ImportFilter,
+                         exporter: Optional[ParquetExporter] = None, shared_stations: Optional[SharedStations] = None,
+                         quarantine: Optional[Quarantine] = None) -> Dict[str, int]:
+    """ Write a station with its links and values for every history line and period with data, through
+    `target`, a DatabaseTarget or LoadFileTarget. Returns the number of stations per period.
+    Only the periods and histories included by `import_filter` are read and written.
+    Rows are also passed to `exporter`, if given, once their station is written.
+    With `shared_stations`, stations already created for another variable with the same history, period
+    and joint stations are reused, only adding this variable's values to them. New stations are added to it.
+    With `quarantine`, a station failing with one of `tolerated_errors` is rolled back to the target's
+    savepoint and recorded there instead of aborting the import.
+    """
+    periods = [period for period in climatology_periods if import_filter.includes_period(period.label)]
+    target.start(periods)
+    history_lines = [line for line in read_station_info_file(variable) if import_filter.includes_history(line.history_id)]
+    stations_per_period = {period.label: 0 for period in periods}
+
     logger.info(f"Processing {len(history_lines)} history lines for variable '{variable}'")
-    
+
     for idx, line in enumerate(history_lines, 1):
         logger.debug(f"Processing history line {idx}/{len(history_lines)}: history_id {line.history_id}")
-        
+        target.start_line(idx, history_lines)
+
         # create a station for each period we have data for
-        if line.has_1971_data:
-            logger.debug(f"Creating 1971-2000 station for history_id {line.history_id}")
-            station = generate_station(session, line, period_1971_id)
-            generate_base_station_history(session, station.id, line.history_id)
-            generate_station_histories(session, station.id, line.joint_stations_1971)
-            generate_value_data(session, variable, "1971_2000", station.id, str(line.history_id), line.monthlyyears_1971)
-            stations_1971 += 1
-
-        if line.has_1981_data:
-            logger.debug(f"Creating 1981-2010 station for history_id {line.history_id}")
-            station = generate_station(session, line, period_1981_id)
-            generate_base_station_history(session, station.id, line.history_id)
-            generate_station_histories(session, station.id, line.joint_stations_1981)
-            generate_value_data(session, variable, "1981_2010", station.id, str(line.history_id), line.monthlyyears_1981)
-            stations_1981 += 1
-        
-        if line.has_1991_data:
-            logger.debug(f"Creating 1991-2020 station for history_id {line.history_id}")
-            station = generate_station(session, line, period_1991_id)
-            generate_base_station_history(session, station.id, line.history_id)
-            generate_station_histories(session, station.id, line.joint_stations_1991)
-            generate_value_data(session, variable, "1991_2020", station.id, str(line.history_id), line.monthlyyears_1991)
-            stations_1991 += 1
-            
-        total_processed += 1
+        for period in periods:
+            label = period.label
+            if not line.has_data[label]:
+                continue
+
+            joint_stations = line.joint_stations[label]
+            key = shared_station_key(line, label)
+            station_id = shared_stations.get(key) if shared_stations is not None else None
+            created = station_id is None
+            links = 0
+            try:
+                # the exporter's savepoint is left last, so it only exports the station once the target's has committed
+                with exporter.savepoint() if exporter is not None else nullcontext(), target.savepoint():
+                    if created:
+                        logger.debug(f"Creating {label} station for history_id {line.history_id}")
+                        station_id, links = target.add_station(line, period, joint_stations)
+                    else:
+                        logger.debug(f"Reusing {label} station {station_id} for history_id {line.history_id}")
+                    values_added = target.add_values(variable, period, station_id, line, exporter)
+            except tolerated_errors as e:
+                if isinstance(e, FileNotFoundError):
+                    metrics.record_missing_file(variable)
+                if quarantine is None:
+                    raise
+                quarantine.add(variable, label, line.history_id, describe(e))
+                metrics.record_quarantined(variable, label)
+                continue
+
+            if created:
+                target.station_added(station_id, line, joint_stations)
+                if shared_stations is not None:
+                    shared_stations[key] = station_id
+            if exporter is not None:
+                exporter.add_station(variable, label, station_id, "composite" if any(joint_stations) else "long-record", line.basin)
+                exporter.add_station_history(variable, label, station_id, line.history_id, "base")
+                for joint_id in joint_stations:
+                    if joint_id is not None:
+                        exporter.add_station_history(variable, label, station_id, joint_id, "joint")
+            metrics.record_station(variable, label, links, values_added, created=created)
+            stations_per_period[label] += 1
+
+        target.end_line(idx)
 
         # Log progress every 100 stations
         if idx % 100 == 0:
             logger.info(f"Processed {idx}/{len(history_lines)} history lines for variable '{variable}'")
-    
-    logger.info(f"Completed climatological station generation for variable '{variable}': "
-                f"{stations_1971} stations (1971-2000), {stations_1981} stations (1981-2010), "
-                f"{stations_1991} stations (1991-2020), {total_processed} total history lines processed")
 
-def main(session: Optional[Session] = None) -> None:
-    # Use provided session - it must be provided
-    if session is None:
+    target.finish()
+    return stations_per_period
+
+def generate_climatological_stations(session: Session, variable: str, metrics: Optional[ImportMetrics] = None, import_filter: Optional[ImportFilter] = None,
+                                     exporter: Optional[ParquetExporter] = None, batch_size: Optional[int] = None,
+                                     shared_stations: Optional[SharedStations] = None, quarantine: Optional[Quarantine] = None) -> None:
+    """ Generate the climatological stations in the database for a given variable, see import_station_lines.
+    With `batch_size`, the session is flushed and emptied every `batch_size` history lines so memory
+    stays flat however large the dataset; only IDs are kept between batches. The batch's station
+    history links are inserted together with one statement, see insert_station_links.
+    With `quarantine`, each station is written under its own savepoint. In batch mode links are only
+    inserted with the batch, so stations linking to histories that don't exist are quarantined up front.
+    """
+    if metrics is None:
+        metrics = ImportMetrics()
+    if import_filter is None:
+        import_filter = ImportFilter()
+    logger.info(f"Starting climatological station generation for variable '{variable}'")
+
+    target = DatabaseTarget(session, batch_size, tolerant=quarantine is not None)
+    stations_per_period = import_station_lines(target, variable, metrics, import_filter, exporter, shared_stations, quarantine)
+
+    station_counts = ", ".join(f"{count} stations ({label})" for label, count in stations_per_period.items())
+    logger.info(f"Completed climatological station generation for variable '{variable}': {station_counts}")
+
+def find_histories(session: Session, history_lines: List[HistoryLine]) -> Set[int]:
+    """ Which of the base and joint histories of `history_lines` exist, with one query. """
+    history_ids = {line.history_id for line in history_lines}
+    history_ids.update(
+        joint_id for line in history_lines for joint_stations in line.joint_stations.values()
+        for joint_id in joint_stations if joint_id is not None
+    )
+    return {history_id for (history_id,) in session.query(History.id).filter(History.id.in_(history_ids))}
+
+def expunge_batch(session: Session) -> None:
+    """ Write out everything pending and drop the written objects from the session's identity map. """
+    session.flush()
+    session.expunge_all()
+
+def emit_climatological_stations(writer: LoadFileWriter, variable: str, metrics: Optional[ImportMetrics] = None, import_filter: Optional[ImportFilter] = None,
+                                 exporter: Optional[ParquetExporter] = None, shared_stations: Optional[SharedStations] = None,
+                                 quarantine: Optional[Quarantine] = None) -> None:
+    """ Write the climatological stations, links and values for a given variable to load files
+    instead of the database, the offline counterpart of generate_climatological_stations.
+    With `quarantine`, stations whose data file can't be read are recorded there and left out.
+    """
+    if metrics is None:
+        metrics = ImportMetrics()
+    if import_filter is None:
+        import_filter = ImportFilter()
+    logger.info(f"Starting climatological station emission for variable '{variable}'")
+
+    target = LoadFileTarget(writer, tolerant=quarantine is not None)
+    stations_per_period = import_station_lines(target, variable, metrics, import_filter, exporter, shared_stations, quarantine)
+
+    station_counts = ", ".join(f"{count} stations ({label})" for label, count in stations_per_period.items())
+    logger.info(f"Completed climatological station emission for variable '{variable}': {station_counts}")
+
+def main(session: Optional[Session] = None,
+         variables: Optional[List[str]] = None,
+         metrics: Optional[ImportMetrics] = None,
+         import_filter: Optional[ImportFilter] = None,
+         skip_setup: bool = False,
+         writer: Optional[LoadFileWriter] = None,
+         exporter: Optional[ParquetExporter] = None,
+         swap_engine: Optional[Engine] = None,
+         batch_size: Optional[int] = None,
+         shared_stations: bool = False,
+         analyze: bool = True,
+         locks: bool = True,
+         quarantine: Optional[Quarantine] = None) -> None:
+    """ Run the import through `session`, or with `writer` write load files instead of touching a database.
+    With `exporter` the imported rows are also exported to Parquet. With `swap_engine` the session is
+    writing to shadow tables (see shadow.py), which are swapped in through that engine after the commit.
+    With `batch_size` the session is emptied every `batch_size` history lines, see generate_climatological_stations.
+    With `shared_stations` each history, period and set of joint stations gets one station holding the
+    values of every variable, instead of one station per variable.
+    With `analyze` the tables are analyzed and dependent materialized views refreshed after the commit,
+    see post_load.py.
+    With `locks` the import takes advisory locks so concurrent runs don't collide, see locks.py. Setup is
+    then committed on its own, releasing its lock.
+    With `quarantine` the import is tolerant: stations that fail are left out and recorded there, see quarantine.py.
+    """
+    # Use provided session - it must be provided unless we are only writing load files
+    if session is None and writer is None:
         raise ValueError("A database session must be provided")
+
+    # default to importing every variable
+    if variables is None:
+        variables = [ppt_fill, tmax_fill, tmin_fill]
+    unknown = [v for v in variables if v not in var_map]
+    if unknown:
+        raise ValueError(f"Unknown variables: {unknown}")
+    if metrics is None:
+        metrics = ImportMetrics()
+    if batch_size is not None and batch_size < 1:
+        raise ValueError(f"batch_size must be positive, got {batch_size}")
     
     logger.info("=" * 60)
     logger.info("Starting climatological data import process")
     logger.info("=" * 60)
     
     # generate periods and variables
-    logger.info("Phase 1/2: Setting up database structure...")
-    generate_climatological_periods(session)
-    generate_climatological_variables(session)
-    logger.info("Phase 1/2: Database structure setup completed")
+    if skip_setup:
+        logger.info("Phase 1/2: Skipped, using the periods and variables already in the database")
+    else:
+        logger.info("Phase 1/2: Setting up database structure...")
+        with metrics.phase("setup"):
+            if writer is not None:
+                writer.add_periods(climatology_periods)
+                writer.add_variables(climatological_variable_definitions)
+            else:
+                if locks:
+                    advisory_lock(session, setup_lock)
+                generate_climatological_periods(session)
+                generate_climatological_variables(session)
+                if locks:
+                    session.commit()
+        logger.info("Phase 1/2: Database structure setup completed")
 
     # generate stations and data for each variable
-    variables = [ppt_fill, tmax_fill, tmin_fill]
     logger.info(f"Phase 2/2: Processing data for {len(variables)} variables: {variables}")
+    station_ids: Optional[SharedStations] = {} if shared_stations else None
+    if writer is None and locks:
+        # held until the import commits, so take them all up front in one order every run agrees on
+        for variable in sorted(variables):
+            advisory_lock(session, variable_lock(variable))
     
-    for idx, variable in enumerate(variables, 1):
-        logger.info(f"Processing variable {idx}/{len(variables)}: '{variable}'")
-        try:
-            generate_climatological_stations(session, variable)
-            logger.info(f"Successfully completed processing for variable '{variable}'")
-        except Exception as e:
-            logger.error(f"Failed to process variable '{variable}': {e}")
-            raise
+    try:
+        for idx, variable in enumerate(variables, 1):
+            logger.info(f"Processing variable {idx}/{len(variables)}: '{variable}'")
+            try:
+                with metrics.phase(variable):
+                    if writer is not None:
+                        emit_climatological_stations(writer, variable, metrics, import_filter, exporter, station_ids, quarantine)
+                    else:
+                        generate_climatological_stations(session, variable, metrics, import_filter, exporter, batch_size, station_ids, quarantine)
+                logger.info(f"Successfully completed processing for variable '{variable}'")
+            except Exception as e:
+                logger.error(f"Failed to process variable '{variable}': {e}")
+                raise
+    finally:
+        # every input file has been read, release the archives they were read from
+        close_archives()
     
     # Commit all changes in one transaction
-    session.commit()
-    logger.info("All changes committed successfully")
+    with metrics.phase("commit"):
+        if writer is not None:
+            writer.close()
+        else:
+            session.commit()
+        if exporter is not None:
+            exporter.close()
+    if swap_engine is not None:
+        with metrics.phase("swap"):
+            swap_shadow_tables(swap_engine)
+    if analyze and writer is None:
+        refresh_after_load(session, metrics)
+    metrics.mark_success()
+    if writer is not None:
+        logger.info(f"Load files written to {writer.directory}, load them with: cd {writer.directory} && psql -f load.sql")
+    else:
+        logger.info("All changes committed successfully")
     
     logger.info("=" * 60)
     logger.info("Climatological data import process completed successfully")
     logger.info("=" * 60)
 
+def profile_main(session: Session, output: str, top: int = 40, **kwargs) -> None:
+    """Run main() under cProfile, writing `<output>.prof` for pstats/snakeviz and
+    `<output>.txt` with the top functions by cumulative time. Other keyword arguments are passed to main().
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        main(session=session, **kwargs)
+    finally:
+        profiler.disable()
+        profiler.dump_stats(f"{output}.prof")
+        with open(f"{output}.txt", "w") as f:
+            pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(top)
+        logger.info(f"Profile written to {output}.prof, summary of top {top} cumulative functions in {output}.txt")
+
+def add_filter_arguments(parser: argparse.ArgumentParser) -> None:
+    """ Add the variable, period and history subset options, see import_filter_from_args. """
+    parser.add_argument("--variable", choices=list(var_map), action="append", dest="variables",
+                        help="Only process the given variable, may be repeated (default: all)")
+    parser.add_argument("--period", choices=period_labels, action="append", dest="periods",
+                        help="Only process the given climatology period, may be repeated (default: all)")
+    parser.add_argument("--history-ids", metavar="SPEC",
+                        help="Only process these history IDs, a comma separated list of IDs and inclusive ranges, e.g. 404,406,11000-11999")
+    parser.add_argument("--sample", type=float, metavar="FRACTION",
+                        help="Only process a deterministic random sample of this fraction of histories")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed for --sample (default: 0)")
+
+def batch_size_arg(value: str) -> int | str:
+    return value if value == "auto" else int(value)
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Import climatological station data into the database.",
+        epilog="The data directory is read from CLIMO_DATA_DIR (default /data/), which may also be a .zip, .tar, "
+               ".tar.gz or .tgz archive of it. A .tar.gz or .tgz is first decompressed whole into a temporary "
+               "file, which needs free space in TMPDIR for the full uncompressed size.",
+    )
+    add_filter_arguments(parser)
+    parser.add_argument("--skip-setup", action="store_true",
+                        help="Reuse the periods and variables already in the database instead of creating them")
+    parser.add_argument("--profile", metavar="OUTPUT",
+                        help="Profile the import with cProfile, writing OUTPUT.prof and an OUTPUT.txt summary")
+    parser.add_argument("--profile-top", type=int, default=40,
+                        help="Number of functions to include in the profile summary (default: 40)")
+    parser.add_argument("--metrics-file", default=os.getenv("CLIMO_METRICS_FILE"),
+                        help="Write Prometheus textfile collector metrics to this .prom file "
+                             "(default: $CLIMO_METRICS_FILE, disabled if unset)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Don't connect to the database, write COPY load files and a psql script to --emit instead")
+    parser.add_argument("--emit", metavar="DIR",
+                        help="Directory for the --dry-run load files")
+    parser.add_argument("--first-station-id", type=int, default=1,
+                        help="First climatological station ID assigned by --dry-run (default: 1)")
+    parser.add_argument("--export-parquet", metavar="DIR",
+                        help="Also write the imported stations, links and values as Parquet files partitioned by variable and period (needs pyarrow)")
+    parser.add_argument("--batch-size", type=batch_size_arg, metavar="N",
+                        help="Flush and empty the session every N history lines, keeping memory flat for large imports, "
+                             "or 'auto' to use the batch size picked by plan.py")
+    parser.add_argument("--shared-stations", action="store_true",
+                        help="Create one station per history, period and joint stations for all variables, instead of one per variable")
+    parser.add_argument("--shadow", action="store_true",
+                        help="Load a full reload into shadow copies of the climatological tables and swap them in when done")
+    parser.add_argument("--no-analyze", dest="analyze", action="store_false",
+                        help="Don't ANALYZE the tables and refresh dependent materialized views after the import")
+    parser.add_argument("--no-locks", dest="locks", action="store_false",
+                        help="Don't take advisory locks against concurrent imports")
+    parser.add_argument("--quarantine", metavar="CSV",
+                        help="Skip stations whose data can't be imported, rolling back only them, and list them in this CSV file")
+    args = parser.parse_args(argv)
+    if args.dry_run != bool(args.emit):
+        parser.error("--dry-run and --emit must be used together")
+    if args.shadow and (args.dry_run or args.skip_setup or args.variables or args.periods or args.history_ids or args.sample):
+        parser.error("--shadow replaces the climatological tables whole, it can't be combined with --dry-run, --skip-setup or subset options")
+    return args
+
+def import_filter_from_args(args: argparse.Namespace) -> ImportFilter:
+    history_ids, history_ranges = parse_history_id_spec(args.history_ids) if args.history_ids else (None, None)
+    return ImportFilter(
+        periods=args.periods,
+        history_ids=history_ids,
+        history_ranges=history_ranges,
+        sample_fraction=args.sample,
+        seed=args.seed,
+    )
+
 if __name__ == "__main__":
-    logger.info("Initializing database connection...")
-    engine = sa.create_engine("postgresql://crmp@dbtest04.pcic.uvic.ca/crmp", echo=False)
-    session = Session(engine)
-    logger.info("Database connection established")
+    args = parse_args()
+
+    session = None
+    writer = None
+    engine = None
+    if args.dry_run:
+        writer = LoadFileWriter(args.emit, args.first_station_id)
+        logger.info(f"Dry run, writing load files to {args.emit}")
+    else:
+        logger.info("Initializing database connection...")
+        engine = sa.create_engine("postgresql://crmp@dbtest04.pcic.uvic.ca/crmp", echo=False)
+        if args.shadow:
+            prepare_shadow_tables(engine)
+            session = Session(shadow_engine(engine))
+        else:
+            session = Session(engine)
+        logger.info("Database connection established")
     
+    import_filter = import_filter_from_args(args)
+    batch_size = args.batch_size
+    if batch_size == "auto":
+        # plan.py imports this module, so only import it when running as a script
+        from plan import plan_import
+        batch_size = plan_import(args.variables, import_filter, args.shared_stations).batch_size
+        logger.info(f"Batch size picked by the import plan: {batch_size}")
+
+    metrics = ImportMetrics()
+    quarantine = Quarantine(args.quarantine) if args.quarantine else None
+    import_kwargs = dict(
+        variables=args.variables,
+        metrics=metrics,
+        import_filter=import_filter,
+        skip_setup=args.skip_setup,
+        writer=writer,
+        exporter=ParquetExporter(args.export_parquet) if args.export_parquet else None,
+        swap_engine=engine if args.shadow else None,
+        batch_size=batch_size,
+        shared_stations=args.shared_stations,
+        analyze=args.analyze,
+        locks=args.locks,
+        quarantine=quarantine,
+    )
     try:
-        main(session=session)
+        if args.profile:
+            profile_main(session, args.profile, top=args.profile_top, **import_kwargs)
+        else:
+            main(session=session, **import_kwargs)
     except Exception as e:
         logger.error(f"Import process failed: {e}")
         raise
     finally:
-        session.close()
-        logger.info("Database session closed")
\ No newline at end of file
+        if session is not None:
+            session.close()
+            logger.info("Database session closed")
+        if quarantine is not None:
+            quarantine.close()
+        if args.metrics_file:
+            metrics.write_textfile(args.metrics_file)
\ No newline at end of file
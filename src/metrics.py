@@ -0,0 +1,154 @@
+# Metrics collection for the importer, exported in the Prometheus textfile collector format
+# so node exporter can pick up throughput and duration trends for scheduled imports.
+# See https://github.com/prometheus/node_exporter#textfile-collector
+
+import logging
+import os
+import re
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+metric_prefix = "climo_import"
+
+
+class ImportMetrics():
+    """ Counters and timings collected over a single import run. """
+    def __init__(self):
+        # table -> rows inserted
+        self.rows_inserted: Dict[str, int] = defaultdict(int)
+        # (variable, period) -> stations created
+        self.stations: Dict[Tuple[str, str], int] = defaultdict(int)
+        # (variable, period) -> stations of another variable the values were added to, see main.py --shared-stations
+        self.stations_reused: Dict[Tuple[str, str], int] = defaultdict(int)
+        # phase -> seconds
+        self.phase_durations: Dict[str, float] = {}
+        # variable -> data files read for the stations written (quarantined ones aren't counted), and missing
+        self.files_read: Dict[str, int] = defaultdict(int)
+        self.files_missing: Dict[str, int] = defaultdict(int)
+        # (variable, period) -> stations left out by a tolerant import
+        self.stations_quarantined: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.success: bool = False
+        self.last_success: Optional[float] = None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """ Time a phase of the import, recording its duration even if it fails. """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_durations[name] = time.perf_counter() - start
+            logger.info(f"Phase '{name}' took {self.phase_durations[name]:.2f}s")
+
+    def record_station(self, variable: str, period: str, links: int, values: int, created: bool = True) -> None:
+        """ Record one station with its history links and values, read from one data file, once it
+        has been written; a station rolled back to its savepoint isn't recorded, nor is its file read.
+        `created` is False when the values were added to a station shared with another variable.
+        """
+        if created:
+            self.stations[(variable, period)] += 1
+            self.rows_inserted["climatological_station"] += 1
+        else:
+            self.stations_reused[(variable, period)] += 1
+        self.rows_inserted["climo_stn_x_hist"] += links
+        self.rows_inserted["climatological_value"] += values
+        self.files_read[variable] += 1
+
+    def record_missing_file(self, variable: str) -> None:
+        self.files_missing[variable] += 1
+
+    def record_quarantined(self, variable: str, period: str) -> None:
+        self.stations_quarantined[(variable, period)] += 1
+
+    def mark_success(self) -> None:
+        self.success = True
+        self.last_success = time.time()
+
+    def to_textfile(self) -> str:
+        """ Render the metrics in the Prometheus text exposition format. """
+        lines: List[str] = []
+
+        def gauge(name: str, help: str, samples: List[Tuple[Dict[str, str], float]]):
+            lines.append(f"# HELP {metric_prefix}_{name} {help}")
+            lines.append(f"# TYPE {metric_prefix}_{name} gauge")
+            for labels, value in samples:
+                label_str = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{metric_prefix}_{name}{{{label_str}}} {value}" if label_str else f"{metric_prefix}_{name} {value}")
+
+        gauge("rows_inserted", "Rows inserted per table by the last run.",
+              [({"table": table}, count) for table, count in sorted(self.rows_inserted.items())])
+        gauge("stations", "Climatological stations created by the last run per variable and period.",
+              [({"variable": variable, "period": period}, count) for (variable, period), count in sorted(self.stations.items())])
+        gauge("stations_reused", "Stations shared with another variable the last run added values to, per variable and period.",
+              [({"variable": variable, "period": period}, count) for (variable, period), count in sorted(self.stations_reused.items())])
+        gauge("phase_duration_seconds", "Duration of each phase of the last run.",
+              [({"phase": phase}, round(seconds, 3)) for phase, seconds in self.phase_durations.items()])
+        gauge("files_read", "Data files of the stations written by the last run per variable.",
+              [({"variable": variable}, count) for variable, count in sorted(self.files_read.items())])
+        gauge("files_missing", "Data files missing in the last run per variable.",
+              [({"variable": variable}, count) for variable, count in sorted(self.files_missing.items())])
+        gauge("stations_quarantined", "Stations left out by the last run per variable and period, with --quarantine.",
+              [({"variable": variable, "period": period}, count) for (variable, period), count in sorted(self.stations_quarantined.items())])
+        gauge("success", "Whether the last run completed successfully.", [({}, int(self.success))])
+        if self.last_success is not None:
+            gauge("last_success_timestamp_seconds", "Unix time of the last successful run.", [({}, round(self.last_success, 3))])
+
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str) -> None:
+        """ Write the metrics to `path`, replacing it atomically so the collector never reads a partial file.
+        A failed run keeps the last success timestamp from the previous file.
+        """
+        if self.last_success is None:
+            self.last_success = read_last_success(path)
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.to_textfile())
+        os.replace(tmp_path, path)
+        logger.info(f"Metrics written to {path}")
+
+
+def read_samples(path: str) -> List[Tuple[str, Dict[str, str], float]]:
+    """ Read the (name without prefix, labels, value) samples of a previously written metrics file. """
+    pattern = re.compile(rf"^{metric_prefix}_(\w+)(?:{{(.*)}})?\s+(\S+)$")
+    label_pattern = re.compile(r'(\w+)="([^"]*)"')
+    samples = []
+    with open(path, "r") as f:
+        for line in f:
+            match = pattern.match(line.strip())
+            if match:
+                name, labels, value = match.groups()
+                samples.append((name, dict(label_pattern.findall(labels or "")), float(value)))
+    return samples
+
+
+def read_throughput(path: str) -> Optional[float]:
+    """ Rows inserted per second by the run that wrote a metrics file, if it succeeded. """
+    try:
+        samples = read_samples(path)
+    except FileNotFoundError:
+        return None
+    if ("success", {}, 1.0) not in samples:
+        return None
+    rows = sum(value for name, _, value in samples if name == "rows_inserted")
+    seconds = sum(value for name, _, value in samples if name == "phase_duration_seconds")
+    return rows / seconds if rows and seconds else None
+
+
+def read_last_success(path: str) -> Optional[float]:
+    """ Read the last success timestamp from a previously written metrics file, if any. """
+    pattern = re.compile(rf"^{metric_prefix}_last_success_timestamp_seconds\s+(\S+)$")
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                match = pattern.match(line.strip())
+                if match:
+                    return float(match.group(1))
+    except FileNotFoundError:
+        pass
+    return None
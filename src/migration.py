@@ -1,4 +1,4 @@
-# Migration script for the climatological database. There are a number of climatologies in obs raw 
+# Migration script for the climatological database. There are a number of climatologies in obs raw
 # that we want to centralize on the new structure, this script helps us do that.
 
 
@@ -6,40 +6,271 @@
 # ClimatologicalPeriod: Taken from our 3 periods, 1971_2000, 1981_2010, 1991_2020
 # ClimatologicalVariable: Taken from our 3 variables, ppt, tmax, tmin
 # ClimatologicalStation: One per unique history line, combined with each period
-# ClimatologicalStationXHistory: For each station above, this will record the joint stations. 
+# ClimatologicalStationXHistory: For each station above, this will record the joint stations.
 #   Each station will have up to 3 joint stations, histories will have to pre-exist in the database
 # ClimatologicalValue: The actual data values, linked to station, variable
-    
+
 # ClimatologicalPeriod: Existing climatologies are only available for the 1971-2000 period.
 # This script will be run after the initial insert from the CSV files, so should be populated. Start by grabbing its value.
 
-from datetime import datetime
+import argparse
+import logging
+import time
+from typing import Dict, Iterator, List, Optional
 import sqlalchemy as sa
 from sqlalchemy.orm import Session
-from pycds import ClimatologicalPeriod, ClimatologicalStation, ClimoObsCount, Obs, Variable
+from pycds import ClimatologicalStation, ClimatologicalStationXHistory, ClimatologicalValue, ClimatologicalVariable, ClimoObsCount, History, Obs, Variable # type: ignore
 from main import get_period_id_by_dates
-    
-engine = sa.create_engine("postgresql://crmp@dbtest04.pcic.uvic.ca/crmp", echo=False)
-session = Session(engine)
 
-climatology_period_1971_2000 = get_period_id_by_dates(session, "1971-01-01", "2000-12-31")
-# We can use the ClimoObsCount to find all histories that have climo data
+logger = logging.getLogger(__name__)
+
+prism_station_type = "prism"
+
+# number of histories whose obs_raw climatologies are copied per transaction
+default_value_chunk_size = 500
+# rows fetched per round trip from server-side cursors
+default_fetch_size = 1000
+
+
+def prism_basin_for_history(history_id):
+    """ Scalar subquery for the basin of a history. meta_history has no basin, so it is taken from
+    any base station already imported for that history from the composite station files.
+    """
+    return (
+        sa.select(ClimatologicalStation.basin_id)
+        .join(ClimatologicalStationXHistory, ClimatologicalStationXHistory.climo_station_id == ClimatologicalStation.id)
+        .where(
+            ClimatologicalStationXHistory.history_id == history_id,
+            ClimatologicalStationXHistory.role == "base",
+            ClimatologicalStation.basin_id.is_not(None),
+        )
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+def has_prism_station(history_id, period_id: int):
+    """ Whether a history already has a prism station for the period, so the migration can be rerun. """
+    return (
+        sa.select(ClimatologicalStationXHistory.history_id)
+        .join(ClimatologicalStation, ClimatologicalStationXHistory.climo_station_id == ClimatologicalStation.id)
+        .where(
+            ClimatologicalStationXHistory.history_id == history_id,
+            ClimatologicalStationXHistory.role == "base",
+            ClimatologicalStation.type == prism_station_type,
+            ClimatologicalStation.climo_period_id == period_id,
+        )
+        .exists()
+    )
+
+
+def build_prism_station_insert(period_id: int) -> sa.Insert:
+    """ Build a single INSERT ... SELECT creating one prism station per history with climo data
+    in ClimoObsCount, together with its base ClimatologicalStationXHistory link.
+
+    Station IDs are drawn from the station sequence up front in a materialized CTE, so the station
+    insert and the link insert can share them within one statement.
+    """
+    station_table = ClimatologicalStation.__table__
+    station_id_column = sa.inspect(ClimatologicalStation).columns["id"].name
+    station_id_seq = sa.func.pg_get_serial_sequence(station_table.fullname, station_id_column)
+
+    histories = (
+        sa.select(ClimoObsCount.history_id)
+        .join(History, History.id == ClimoObsCount.history_id)
+        .where(~has_prism_station(ClimoObsCount.history_id, period_id))
+        .distinct()
+        .subquery("histories")
+    )
+    new_ids = sa.select(
+        histories.c.history_id,
+        sa.func.nextval(station_id_seq).label("climo_station_id"),
+        prism_basin_for_history(histories.c.history_id).label("basin_id"),
+    ).cte("new_ids")
+
+    insert_stations = sa.insert(ClimatologicalStation).from_select(
+        [
+            ClimatologicalStation.id,
+            ClimatologicalStation.type,
+            ClimatologicalStation.basin_id,
+            ClimatologicalStation.comments,
+            ClimatologicalStation.climo_period_id,
+        ],
+        sa.select(
+            new_ids.c.climo_station_id,
+            sa.literal(prism_station_type, ClimatologicalStation.type.type),
+            new_ids.c.basin_id,
+            sa.literal(""),
+            sa.literal(period_id),
+        ),
+    ).cte("insert_stations")
+
+    return sa.insert(ClimatologicalStationXHistory).from_select(
+        [
+            ClimatologicalStationXHistory.climo_station_id,
+            ClimatologicalStationXHistory.history_id,
+            ClimatologicalStationXHistory.role,
+        ],
+        sa.select(new_ids.c.climo_station_id, new_ids.c.history_id, sa.literal("base", ClimatologicalStationXHistory.role.type)),
+    ).add_cte(insert_stations)
+
+
+def migrate_prism_stations(session: Session, period_id: int) -> Dict[str, int]:
+    """ Create a prism station and base history link for every history with climatologies in obs_raw.
+    Histories that already have a prism station for the period are skipped.
+
+    Returns:
+        Counts of the stations and links created
+    """
+    logger.info(f"Creating prism stations for period_id {period_id}...")
+    start = time.perf_counter()
+
+    result = session.execute(build_prism_station_insert(period_id))
+    # every new station gets exactly one base link
+    created = result.rowcount
 
-histories = session.query(ClimoObsCount).all()
+    logger.info(f"Created {created} prism stations and {created} base history links in {time.perf_counter() - start:.2f}s")
+    return {"stations": created, "links": created}
 
-# looping through each history we can grab its relevant variables
 
-def generate_base_station(session: Session, history_id: int, period_id: int):
-    station = ClimatologicalStation(
-        type="prism", # One of long-record, composite, prism 
-        basin_id=history_line.basin,
-        comments="",
-        climo_period_id=climo_period_id
+def prism_station_history_query(period_id: int) -> sa.Select:
+    """ The sorted history IDs that have a prism station for the period. """
+    return (
+        sa.select(ClimatologicalStationXHistory.history_id)
+        .join(ClimatologicalStation, ClimatologicalStationXHistory.climo_station_id == ClimatologicalStation.id)
+        .where(
+            ClimatologicalStationXHistory.role == "base",
+            ClimatologicalStation.type == prism_station_type,
+            ClimatologicalStation.climo_period_id == period_id,
+        )
+        .distinct()
+        .order_by(ClimatologicalStationXHistory.history_id)
     )
-    session.add(station)
 
-def generate_pcic_climo_stations(session: Session, history_id: int, period_id: int):
-    generate_base_station(session, history_id, period_id)
 
-for history in histories:
-    generate_pcic_climo_stations(session, history.history_id, climatology_period_1971_2000)
\ No newline at end of file
+def stream_history_id_chunks(session: Session, query: sa.Select, chunk_size: int, fetch_size: int = default_fetch_size) -> Iterator[List[int]]:
+    """ Stream the history IDs selected by `query` through a server-side cursor, `fetch_size` rows
+    per round trip, yielding them in lists of at most `chunk_size`.
+
+    The cursor is opened on its own connection: a server-side cursor only lives as long as its
+    transaction, so it has to stay out of the session that commits each chunk.
+    """
+    with session.get_bind().connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=fetch_size).execute(query)
+        for partition in result.scalars().partitions(chunk_size):
+            yield list(partition)
+
+
+def build_value_insert(period_id: int, first_history_id: int, last_history_id: int) -> sa.Insert:
+    """ Build an INSERT ... SELECT copying the obs_raw climatologies of histories in
+    [first_history_id, last_history_id] onto their prism stations.
+
+    Network variables are mapped to climatological variables by name (meta_vars.net_var_name is
+    e.g. Tx_Climatology), and values already copied are skipped so a chunk can be rerun.
+    """
+    already_copied = (
+        sa.select(ClimatologicalValue.climo_station_id)
+        .where(
+            ClimatologicalValue.climo_station_id == ClimatologicalStation.id,
+            ClimatologicalValue.climo_variable_id == ClimatologicalVariable.id,
+            ClimatologicalValue.value_time == Obs.time,
+        )
+        .exists()
+    )
+
+    values = (
+        sa.select(
+            ClimatologicalStation.id,
+            ClimatologicalVariable.id,
+            Obs.time,
+            Obs.datum,
+            # obs_raw does not record contributing years
+            sa.literal(0),
+        )
+        .select_from(Obs)
+        .join(Variable, Variable.id == Obs.vars_id)
+        .join(ClimatologicalVariable, ClimatologicalVariable.net_var_name == Variable.name)
+        .join(
+            ClimatologicalStationXHistory,
+            sa.and_(
+                ClimatologicalStationXHistory.history_id == Obs.history_id,
+                ClimatologicalStationXHistory.role == "base",
+            ),
+        )
+        .join(ClimatologicalStation, ClimatologicalStation.id == ClimatologicalStationXHistory.climo_station_id)
+        .where(
+            Obs.history_id.between(first_history_id, last_history_id),
+            ClimatologicalStation.type == prism_station_type,
+            ClimatologicalStation.climo_period_id == period_id,
+            ~already_copied,
+        )
+    )
+
+    return sa.insert(ClimatologicalValue).from_select(
+        [
+            ClimatologicalValue.climo_station_id,
+            ClimatologicalValue.climo_variable_id,
+            ClimatologicalValue.value_time,
+            ClimatologicalValue.value,
+            ClimatologicalValue.num_contributing_years,
+        ],
+        values,
+    )
+
+
+def migrate_pcic_climatology_values(session: Session, period_id: int, chunk_size: int = default_value_chunk_size, fetch_size: int = default_fetch_size) -> Dict[str, float]:
+    """ Copy the PCIC climatologies in obs_raw into ClimatologicalValue for every prism station.
+    Histories are streamed from a server-side cursor and values are copied server-side in chunks
+    of `chunk_size` histories, committing after each chunk, so memory use stays constant.
+
+    Returns:
+        The number of values copied, the time taken and the overall rows per second
+    """
+    logger.info(f"Copying obs_raw climatologies for prism station histories in chunks of {chunk_size}")
+
+    total_rows = 0
+    start = time.perf_counter()
+    chunks = stream_history_id_chunks(session, prism_station_history_query(period_id), chunk_size, fetch_size)
+    for idx, chunk in enumerate(chunks, 1):
+        chunk_start = time.perf_counter()
+        result = session.execute(build_value_insert(period_id, chunk[0], chunk[-1]))
+        session.commit()
+
+        chunk_seconds = time.perf_counter() - chunk_start
+        total_rows += result.rowcount
+        logger.info(f"Chunk {idx} (history_id {chunk[0]}-{chunk[-1]}): {result.rowcount} values "
+                    f"in {chunk_seconds:.2f}s ({result.rowcount / chunk_seconds if chunk_seconds else 0:.0f} rows/sec)")
+
+    seconds = time.perf_counter() - start
+    rows_per_second = total_rows / seconds if seconds else 0
+    logger.info(f"Copied {total_rows} climatology values in {seconds:.2f}s ({rows_per_second:.0f} rows/sec)")
+    return {"values": total_rows, "seconds": seconds, "rows_per_second": rows_per_second}
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Migrate the PCIC climatologies in obs_raw into the climatological tables.")
+    parser.add_argument("--chunk-size", type=int, default=default_value_chunk_size,
+                        help=f"Histories copied and committed per chunk (default: {default_value_chunk_size})")
+    parser.add_argument("--fetch-size", type=int, default=default_fetch_size,
+                        help=f"Rows fetched per round trip from server-side cursors (default: {default_fetch_size})")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    engine = sa.create_engine("postgresql://crmp@dbtest04.pcic.uvic.ca/crmp", echo=False)
+    session = Session(engine)
+
+    try:
+        # We can use the ClimoObsCount to find all histories that have climo data
+        climatology_period_1971_2000 = get_period_id_by_dates(session, "1971-01-01", "2000-12-31")
+        migrate_prism_stations(session, climatology_period_1971_2000)
+        session.commit()
+        # The values reference obs_raw's T_mean_Climatology etc. through the climatological variables created by main
+        migrate_pcic_climatology_values(session, climatology_period_1971_2000, chunk_size=args.chunk_size, fetch_size=args.fetch_size)
+    except Exception as e:
+        logger.error(f"Migration failed: {e}")
+        session.rollback()
+        raise
+    finally:
+        session.close()
@@ -0,0 +1,133 @@
+# Optional Parquet export of the import result for downstream analysis, enabled with
+# `main.py --export-parquet DIR`. Stations, station-history links and values are written as they are
+# imported, buffered into row groups of `batch_size` rows, so no second pass over the data or the
+# database is needed. Files are partitioned Hive style by variable and period:
+#
+#   DIR/values/variable=ppt/period=1971_2000/part-0.parquet
+#
+# and can be opened as one dataset with e.g. `pyarrow.dataset.dataset("DIR/values", partitioning="hive")`.
+#
+# Needs pyarrow, which is not a dependency of the importer: `pip install pyarrow`.
+
+import os
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+default_batch_size = 10000
+
+stations_table = "stations"
+station_histories_table = "station_histories"
+values_table = "values"
+
+
+def arrow_schemas(pa) -> Dict[str, Any]:
+    return {
+        stations_table: pa.schema([
+            ("climo_station_id", pa.int64()),
+            ("type", pa.string()),
+            ("basin_id", pa.int32()),
+        ]),
+        station_histories_table: pa.schema([
+            ("climo_station_id", pa.int64()),
+            ("history_id", pa.int64()),
+            ("role", pa.string()),
+        ]),
+        values_table: pa.schema([
+            ("climo_station_id", pa.int64()),
+            ("month", pa.int8()),
+            ("value_time", pa.string()),
+            ("value", pa.float64()),
+            ("num_contributing_years", pa.int32()),
+        ]),
+    }
+
+
+class ParquetExporter():
+    """ Streams the rows of an import into Parquet files under `directory`, one file per table,
+    variable and period. Call close() to flush the last row groups and finish the files.
+    """
+    def __init__(self, directory: str, batch_size: int = default_batch_size):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError("Parquet export needs pyarrow, install it with `pip install pyarrow`") from e
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be positive, got {batch_size}")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.schemas = arrow_schemas(pyarrow)
+        self.directory = directory
+        self.batch_size = batch_size
+        # (table, variable, period) -> buffered rows, and the open file for each
+        self.buffers: Dict[Tuple[str, str, str], List[tuple]] = {}
+        self.writers: Dict[Tuple[str, str, str], Any] = {}
+        self.rows: Dict[str, int] = {table: 0 for table in self.schemas}
+        # rows held back inside a savepoint
+        self.held: Optional[List[Tuple[str, str, str, tuple]]] = None
+
+    def __repr__(self):
+        return f"ParquetExporter(directory={self.directory}, batch_size={self.batch_size}, rows={self.rows})"
+
+    def path(self, table: str, variable: str, period: str) -> str:
+        return os.path.join(self.directory, table, f"variable={variable}", f"period={period}", "part-0.parquet")
+
+    def add_row(self, table: str, variable: str, period: str, row: tuple) -> None:
+        if self.held is not None:
+            self.held.append((table, variable, period, row))
+            return
+        partition = (table, variable, period)
+        buffer = self.buffers.setdefault(partition, [])
+        buffer.append(row)
+        self.rows[table] += 1
+        if len(buffer) >= self.batch_size:
+            self.flush(partition)
+
+    @contextmanager
+    def savepoint(self) -> Iterator[None]:
+        """ Hold back the rows added in the block, exporting them only if it completes, so a station
+        rolled back by the importer is left out of the export.
+        """
+        self.held = []
+        try:
+            yield
+        except BaseException:
+            self.held = None
+            raise
+        held, self.held = self.held, None
+        for row in held:
+            self.add_row(*row)
+
+    def add_station(self, variable: str, period: str, station_id: int, station_type: str, basin_id: Optional[int]) -> None:
+        self.add_row(stations_table, variable, period, (station_id, station_type, basin_id))
+
+    def add_station_history(self, variable: str, period: str, station_id: int, history_id: int, role: str) -> None:
+        self.add_row(station_histories_table, variable, period, (station_id, history_id, role))
+
+    def add_value(self, variable: str, period: str, station_id: int, month: int, value_time: str, value: float, num_contributing_years: int) -> None:
+        self.add_row(values_table, variable, period, (station_id, month, value_time, value, num_contributing_years))
+
+    def flush(self, partition: Tuple[str, str, str]) -> None:
+        """ Write a partition's buffered rows as one row group. """
+        buffer = self.buffers.get(partition)
+        if not buffer:
+            return
+        schema = self.schemas[partition[0]]
+        writer = self.writers.get(partition)
+        if writer is None:
+            path = self.path(*partition)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            writer = self.writers[partition] = self.pq.ParquetWriter(path, schema)
+        columns = list(zip(*buffer))
+        writer.write_table(self.pa.Table.from_arrays(
+            [self.pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+            schema=schema,
+        ))
+        buffer.clear()
+
+    def close(self) -> None:
+        for partition in list(self.buffers):
+            self.flush(partition)
+        for writer in self.writers.values():
+            writer.close()
+        self.writers.clear()
@@ -0,0 +1,148 @@
+# Planning an import before starting it. One pass over the composite station files gives the exact
+# number of stations, station-history links and values each table will receive, per variable and
+# period, with the same counting as verify.py. Values are counted from the has_data flags, 12 per
+# station and period, so no data file is opened. The run time is estimated from the rows per second of
+# the last successful run in the metrics file (see metrics.py), and a --batch-size is picked so each
+# batch writes about `rows_per_batch` rows.
+#
+#   python src/plan.py --variable tmax --metrics-file /var/lib/node_exporter/climo_import.prom
+#
+# `main.py --batch-size auto` uses the same batch size.
+
+import argparse
+import logging
+import os
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from pycds import ClimatologicalStation, ClimatologicalStationXHistory, ClimatologicalValue # type: ignore
+
+from archive import close_archives
+from main import (
+    ImportFilter,
+    add_filter_arguments,
+    climatology_periods,
+    import_filter_from_args,
+    read_station_info_file,
+    shared_station_key,
+    var_map,
+)
+from metrics import read_throughput
+from verify import Aggregates, add_expectations, new_aggregates
+
+logger = logging.getLogger(__name__)
+
+# rows written per batch with the batch size picked, small enough to keep the session's memory flat
+rows_per_batch = 20000
+
+
+class ImportPlan():
+    """ What an import will write, how long it should take, and the batch size to write it with. """
+    def __init__(self, expected: Aggregates, history_lines: int, shared_station_links: Optional[Dict[tuple, int]] = None,
+                 rows_per_second: Optional[float] = None):
+        self.expected = expected
+        self.history_lines = history_lines
+        self.values = sum(counts["values"] for counts in expected.values())
+        self.data_files = sum(counts["stations"] for counts in expected.values())
+        if shared_station_links is None:
+            self.stations = self.data_files
+            self.links = sum(counts["base_links"] + counts["joint_links"] for counts in expected.values())
+        else:
+            # one station, and one set of links, per shared key whatever the number of variables
+            self.stations = len(shared_station_links)
+            self.links = sum(shared_station_links.values())
+        self.rows_per_second = rows_per_second
+
+    def __repr__(self):
+        return (f"ImportPlan(stations={self.stations}, links={self.links}, values={self.values}, data_files={self.data_files}, "
+                f"batch_size={self.batch_size}, estimated_seconds={self.estimated_seconds})")
+
+    @property
+    def rows(self) -> int:
+        return self.stations + self.links + self.values
+
+    def table_rows(self) -> Dict[str, int]:
+        return {
+            ClimatologicalStation.__table__.name: self.stations,
+            ClimatologicalStationXHistory.__table__.name: self.links,
+            ClimatologicalValue.__table__.name: self.values,
+        }
+
+    @property
+    def estimated_seconds(self) -> Optional[float]:
+        return self.rows / self.rows_per_second if self.rows_per_second else None
+
+    @property
+    def batch_size(self) -> Optional[int]:
+        """ History lines per batch for about `rows_per_batch` rows, None if it all fits in one batch. """
+        if self.rows <= rows_per_batch:
+            return None
+        return max(1, rows_per_batch * self.history_lines // self.rows)
+
+    def report(self) -> str:
+        lines = [f"{'variable':<10}{'period':<12}{'stations':>10}{'links':>10}{'values':>12}{'data files':>12}"]
+        for (variable, period), counts in sorted(self.expected.items()):
+            lines.append(f"{variable:<10}{period:<12}{counts['stations']:>10}{counts['base_links'] + counts['joint_links']:>10}"
+                         f"{counts['values']:>12}{counts['stations']:>12}")
+        lines.append(f"{'total':<22}{self.stations:>10}{self.links:>10}{self.values:>12}{self.data_files:>12}")
+        lines.append("")
+        lines += [f"{table}: {rows} rows" for table, rows in self.table_rows().items()]
+        if self.estimated_seconds is not None:
+            lines.append(f"Estimated duration: {timedelta(seconds=round(self.estimated_seconds))} at {self.rows_per_second:.0f} rows/s, from the last successful run")
+        else:
+            lines.append("Estimated duration: unknown, no metrics from a successful run")
+        if self.batch_size is not None:
+            lines.append(f"Batch size: --batch-size {self.batch_size} (about {rows_per_batch} rows per batch)")
+        else:
+            lines.append("Batch size: not needed, the import fits in one batch")
+        return "\n".join(lines)
+
+
+def plan_import(variables: Optional[List[str]] = None, import_filter: Optional[ImportFilter] = None,
+                shared_stations: bool = False, metrics_file: Optional[str] = None) -> ImportPlan:
+    """ Plan an import of `variables` (default: all) restricted to `import_filter`, as main() would run it. """
+    if variables is None:
+        variables = list(var_map)
+    if import_filter is None:
+        import_filter = ImportFilter()
+
+    expected = new_aggregates()
+    history_lines = 0
+    # shared station key -> links of that station
+    links: Dict[tuple, int] = {}
+    # the data files are never opened: each station-period with data has 12 values
+    for variable in variables:
+        for line in read_station_info_file(variable):
+            if not import_filter.includes_history(line.history_id):
+                continue
+            history_lines += 1
+            add_expectations(expected, variable, line, import_filter)
+            if not shared_stations:
+                continue
+            for period in climatology_periods:
+                if line.has_data[period.label] and import_filter.includes_period(period.label):
+                    key = shared_station_key(line, period.label)
+                    links[key] = 1 + len(key[2])
+
+    rows_per_second = read_throughput(metrics_file) if metrics_file else None
+    return ImportPlan(expected, history_lines, links if shared_stations else None, rows_per_second)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Estimate what an import will write and how long it will take.")
+    add_filter_arguments(parser)
+    parser.add_argument("--shared-stations", action="store_true",
+                        help="Plan an import with main.py --shared-stations")
+    parser.add_argument("--metrics-file", default=os.getenv("CLIMO_METRICS_FILE"),
+                        help="Metrics file of a previous run to estimate the duration from "
+                             "(default: $CLIMO_METRICS_FILE)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        plan = plan_import(args.variables, import_filter_from_args(args), args.shared_stations, args.metrics_file)
+    finally:
+        close_archives()
+    print(plan.report())
@@ -0,0 +1,103 @@
+# The last phase of an import: refresh the planner statistics of the climatological tables and any
+# materialized views built on them, so the first queries after a reload aren't slow or stale.
+#
+# Materialized views are found through pg_depend, including those built on views over the tables,
+# and refreshed in dependency order. A view is refreshed CONCURRENTLY, without blocking its readers,
+# when PostgreSQL allows it: it is populated and has a unique index on plain columns over all rows.
+# Each step is committed on its own and timed as a phase of the import metrics.
+
+import logging
+from typing import List
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+from pycds import ClimatologicalPeriod, ClimatologicalStation, ClimatologicalStationXHistory, ClimatologicalValue, ClimatologicalVariable # type: ignore
+
+from metrics import ImportMetrics
+
+logger = logging.getLogger(__name__)
+
+analyzed_tables = [
+    ClimatologicalPeriod.__table__,
+    ClimatologicalVariable.__table__,
+    ClimatologicalStation.__table__,
+    ClimatologicalStationXHistory.__table__,
+    ClimatologicalValue.__table__,
+]
+
+
+class MaterializedView():
+    """ A materialized view depending, possibly through other views, on the climatological tables. """
+    def __init__(self, schema: str, name: str, depth: int, concurrent: bool):
+        self.schema = schema
+        self.name = name
+        # how many views away from the tables it is, views are refreshed shallowest first
+        self.depth = depth
+        self.concurrent = concurrent
+
+    def __repr__(self):
+        return f"MaterializedView(schema={self.schema}, name={self.name}, depth={self.depth}, concurrent={self.concurrent})"
+
+    def qualified_name(self) -> str:
+        preparer = postgresql.dialect().identifier_preparer
+        return f"{preparer.quote(self.schema)}.{preparer.quote(self.name)}"
+
+    def refresh_statement(self) -> str:
+        concurrently = " CONCURRENTLY" if self.concurrent else ""
+        return f"REFRESH MATERIALIZED VIEW{concurrently} {self.qualified_name()}"
+
+
+def find_dependent_materialized_views(session: Session) -> List[MaterializedView]:
+    """ The materialized views built on the climatological tables, in the order to refresh them. """
+    rows = session.execute(sa.text("""
+        WITH RECURSIVE dependents(oid, depth) AS (
+            SELECT r.ev_class, 1
+            FROM pg_depend d
+            JOIN pg_rewrite r ON r.oid = d.objid
+            WHERE d.classid = 'pg_rewrite'::regclass
+              AND d.refobjid = ANY(CAST(:tables AS regclass[]))
+              AND r.ev_class <> d.refobjid
+            UNION
+            SELECT r.ev_class, dependents.depth + 1
+            FROM dependents
+            JOIN pg_depend d ON d.refobjid = dependents.oid
+            JOIN pg_rewrite r ON r.oid = d.objid
+            WHERE d.classid = 'pg_rewrite'::regclass
+              AND r.ev_class <> dependents.oid
+        )
+        SELECT n.nspname, c.relname, max(dependents.depth),
+               c.relispopulated AND EXISTS (
+                   SELECT 1 FROM pg_index i
+                   WHERE i.indrelid = c.oid AND i.indisunique AND i.indisvalid
+                     AND i.indpred IS NULL AND i.indexprs IS NULL
+               )
+        FROM dependents
+        JOIN pg_class c ON c.oid = dependents.oid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relkind = 'm'
+        GROUP BY n.nspname, c.relname, c.oid, c.relispopulated
+        ORDER BY 3, 1, 2
+    """), {"tables": [table.fullname for table in analyzed_tables]})
+    return [MaterializedView(schema, name, depth, concurrent) for schema, name, depth, concurrent in rows]
+
+
+def analyze_tables(session: Session) -> None:
+    session.execute(sa.text(f"ANALYZE {', '.join(table.fullname for table in analyzed_tables)}"))
+    session.commit()
+
+
+def refresh_after_load(session: Session, metrics: ImportMetrics) -> None:
+    """ ANALYZE the climatological tables, then refresh and ANALYZE the materialized views depending on them. """
+    with metrics.phase("analyze"):
+        analyze_tables(session)
+
+    views = find_dependent_materialized_views(session)
+    session.commit()
+    logger.info(f"Refreshing {len(views)} dependent materialized views: {[f'{v.schema}.{v.name}' for v in views]}")
+    for view in views:
+        with metrics.phase(f"refresh {view.schema}.{view.name}"):
+            session.execute(sa.text(view.refresh_statement()))
+            session.commit()
+            session.execute(sa.text(f"ANALYZE {view.qualified_name()}"))
+            session.commit()
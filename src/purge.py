@@ -0,0 +1,168 @@
+# Purging previously imported climatology data before a clean reload, instead of deleting by hand.
+#
+#   python src/purge.py --variable tmax --period 1991_2020
+#
+# Only imported stations (see verify.imported_station_types) are touched. Rows are deleted set-based,
+# DELETE ... USING the station table, in dependency order: values, then the station-history links and
+# stations left without values. The work is split into chunks of station IDs, each committed on its
+# own, so no single transaction holds locks for long and an interrupted purge can simply be rerun.
+# Stations shared between variables (main.py --shared-stations) are kept until their last variable
+# is purged.
+#
+# A full purge with --truncate empties the station, link and value tables with one TRUNCATE instead,
+# which is far faster, but only if every station in them was imported. The periods and variables are
+# kept either way, so reload with `main.py --skip-setup`.
+
+import argparse
+import logging
+import sys
+import time
+from typing import Dict, List, Optional
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+from pycds import ClimatologicalStation, ClimatologicalStationXHistory, ClimatologicalValue # type: ignore
+
+from main import period_labels, var_map
+from verify import imported_station_types, lookup_keys
+
+logger = logging.getLogger(__name__)
+
+default_chunk_size = 5000
+
+station = ClimatologicalStation.__table__
+x_hist = ClimatologicalStationXHistory.__table__
+value = ClimatologicalValue.__table__
+
+# in the order they are deleted from
+purged_tables = [value, x_hist, station]
+
+
+class PurgeResult():
+    """ Rows deleted from each table, and seconds spent deleting from each or on the whole truncate. """
+    def __init__(self):
+        self.rows: Dict[str, int] = {table.name: 0 for table in purged_tables}
+        self.seconds: Dict[str, float] = {table.name: 0.0 for table in purged_tables}
+        self.chunks = 0
+
+    def __repr__(self):
+        return f"PurgeResult(rows={self.rows}, seconds={self.seconds}, chunks={self.chunks})"
+
+    def add(self, table, rows: int, seconds: float) -> None:
+        self.rows[table.name] += rows
+        self.seconds[table.name] += seconds
+
+
+def station_scope(period_ids: Optional[List[int]]) -> List:
+    """ Conditions selecting the imported stations, in the given periods if any. """
+    conditions = [ClimatologicalStation.type.in_(imported_station_types)]
+    if period_ids is not None:
+        conditions.append(ClimatologicalStation.climo_period_id.in_(period_ids))
+    return conditions
+
+
+def purge_chunk(session: Session, result: PurgeResult, scope: List, variable_ids: Optional[List[int]]) -> None:
+    """ Delete the values in `scope`, then the links and stations in it left without values. """
+    value_conditions = [ClimatologicalValue.climo_station_id == ClimatologicalStation.id, *scope]
+    if variable_ids is not None:
+        value_conditions.append(ClimatologicalValue.climo_variable_id.in_(variable_ids))
+    without_values = ~sa.exists().where(ClimatologicalValue.climo_station_id == ClimatologicalStation.id)
+
+    statements = [
+        (value, sa.delete(value).where(*value_conditions)),
+        (x_hist, sa.delete(x_hist).where(ClimatologicalStationXHistory.climo_station_id == ClimatologicalStation.id, *scope, without_values)),
+        (station, sa.delete(station).where(*scope, without_values)),
+    ]
+    for table, statement in statements:
+        start = time.perf_counter()
+        rows = session.execute(statement).rowcount
+        result.add(table, rows, time.perf_counter() - start)
+
+
+def truncate(session: Session, result: PurgeResult) -> None:
+    """ Empty the station, link and value tables, refusing if they hold stations that weren't imported. """
+    others = session.execute(
+        sa.select(sa.func.count()).select_from(station).where(ClimatologicalStation.type.notin_(imported_station_types))
+    ).scalar()
+    if others:
+        raise RuntimeError(f"Can't truncate, {others} stations weren't imported by this tool, purge without --truncate instead")
+
+    for table in purged_tables:
+        result.rows[table.name] = session.execute(sa.select(sa.func.count()).select_from(table)).scalar()
+    start = time.perf_counter()
+    # no CASCADE, a foreign key from any other table aborts the truncate
+    session.execute(sa.text(f"TRUNCATE {', '.join(table.fullname for table in purged_tables)}"))
+    session.commit()
+    result.seconds = {"truncate": time.perf_counter() - start}
+    result.chunks = 1
+
+
+def purge(session: Session, variables: Optional[List[str]] = None, periods: Optional[List[str]] = None,
+          chunk_size: int = default_chunk_size, use_truncate: bool = False) -> PurgeResult:
+    """ Delete the imported data for the given variables and periods (default: all), committing after
+    every `chunk_size` stations. With `use_truncate`, which needs a full purge, truncate the tables instead.
+    """
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+    if use_truncate and (variables or periods):
+        raise ValueError("Truncating purges everything, it can't be scoped by variable or period")
+
+    result = PurgeResult()
+    start = time.perf_counter()
+    if use_truncate:
+        logger.info(f"Truncating {[table.fullname for table in purged_tables]}")
+        truncate(session, result)
+    else:
+        variable_keys, period_keys = lookup_keys(session, variables or list(var_map))
+        variable_ids = list(variable_keys) if variables else None
+        period_ids = [period_id for period_id, label in period_keys.items() if label in periods] if periods else None
+        scope = station_scope(period_ids)
+        logger.info(f"Purging imported data for variables {variables or 'all'} and periods {periods or 'all'}")
+
+        first, last = session.execute(
+            sa.select(sa.func.min(ClimatologicalStation.id), sa.func.max(ClimatologicalStation.id)).where(*scope)
+        ).one()
+        if first is not None:
+            for low in range(first, last + 1, chunk_size):
+                chunk = [*scope, ClimatologicalStation.id >= low, ClimatologicalStation.id < low + chunk_size]
+                purge_chunk(session, result, chunk, variable_ids)
+                session.commit()
+                result.chunks += 1
+                logger.debug(f"Purged stations {low} to {low + chunk_size - 1}: {result.rows}")
+
+    for name, rows in result.rows.items():
+        logger.info(f"{name}: {rows} rows deleted" + (f" in {result.seconds[name]:.2f}s" if name in result.seconds else ""))
+    if "truncate" in result.seconds:
+        logger.info(f"Truncate took {result.seconds['truncate']:.2f}s")
+    logger.info(f"Purge finished in {time.perf_counter() - start:.2f}s over {result.chunks} chunks")
+    return result
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Delete previously imported climatology data.")
+    parser.add_argument("--variable", choices=list(var_map), action="append", dest="variables",
+                        help="Only purge the given variable, may be repeated (default: all)")
+    parser.add_argument("--period", choices=period_labels, action="append", dest="periods",
+                        help="Only purge the given climatology period, may be repeated (default: all)")
+    parser.add_argument("--chunk-size", type=int, default=default_chunk_size,
+                        help=f"Stations deleted per transaction (default: {default_chunk_size})")
+    parser.add_argument("--truncate", action="store_true",
+                        help="Purge everything with TRUNCATE, only if every station was imported")
+    args = parser.parse_args(argv)
+    if args.truncate and (args.variables or args.periods):
+        parser.error("--truncate purges everything, it can't be combined with --variable or --period")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    engine = sa.create_engine("postgresql://crmp@dbtest04.pcic.uvic.ca/crmp", echo=False)
+    session = Session(engine)
+    try:
+        purge(session, args.variables, args.periods, args.chunk_size, args.truncate)
+    except Exception as e:
+        logger.error(f"Purge failed: {e}")
+        session.rollback()
+        sys.exit(1)
+    finally:
+        session.close()
@@ -0,0 +1,42 @@
+# Tolerant imports, `main.py --quarantine CSV`. A station whose data file is missing or malformed, or
+# whose rows the database rejects, is rolled back on its own (to a savepoint taken before it) and
+# recorded here instead of aborting the whole import. Rows are written to the CSV as they are
+# recorded, so the report is complete up to the point a run stops, whatever the reason.
+
+import csv
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+quarantine_columns = ["variable", "period", "history_id", "reason"]
+
+
+class Quarantine():
+    """ The stations left out of a tolerant import, streamed to a CSV file. Call close() when done. """
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self.file = open(path, "w", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(quarantine_columns)
+
+    def __repr__(self):
+        return f"Quarantine(path={self.path}, count={self.count})"
+
+    def add(self, variable: str, period: str, history_id: int, reason: str) -> None:
+        logger.warning(f"Quarantined {variable} {period} history_id {history_id}: {reason}")
+        self.writer.writerow([variable, period, history_id, reason])
+        self.file.flush()
+        self.count += 1
+
+    def close(self) -> None:
+        self.file.close()
+        if self.count:
+            logger.warning(f"{self.count} stations quarantined, see {self.path}")
+
+
+def describe(error: Exception) -> str:
+    """ A one-line reason for a quarantined station. """
+    message: Optional[str] = str(error).splitlines()[0] if str(error) else None
+    return f"{type(error).__name__}: {message}" if message else type(error).__name__
@@ -0,0 +1,215 @@
+# Shadow-table loads for zero-downtime full reloads, `main.py --shadow`.
+#
+# Rather than writing into the live climatological tables in one long transaction, the import writes
+# into empty copies of them in a `<schema>_shadow` schema, built with CREATE TABLE ... (LIKE ...
+# INCLUDING ALL) plus the live tables' foreign keys, triggers and grants. The ORM is pointed at the
+# copies with a schema translate map, so the import code doesn't change. When the load has committed,
+# one short transaction moves the live tables out of the way and the copies into their place with
+# ALTER TABLE ... SET SCHEMA, then drops the old tables. Readers keep using the live tables until then.
+#
+# The swap replaces the tables whole, so anything else stored in them is copied into the shadow tables
+# before the load: all periods and variables, and the stations the importer didn't write (e.g. migrated
+# prism stations) with their links and values, keeping their IDs. Views or foreign keys elsewhere that
+# depend on the live tables would be left pointing at the old ones, so the load refuses to start if
+# there are any.
+
+import logging
+from typing import List, Optional
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Connection, Engine
+from pycds import ClimatologicalPeriod, ClimatologicalStation, ClimatologicalStationXHistory, ClimatologicalValue, ClimatologicalVariable # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# in foreign key order, referenced tables first
+swapped_tables = [
+    ClimatologicalPeriod.__table__,
+    ClimatologicalVariable.__table__,
+    ClimatologicalStation.__table__,
+    ClimatologicalStationXHistory.__table__,
+    ClimatologicalValue.__table__,
+]
+
+# how long the swap waits for readers' locks before giving up, rather than queueing everyone behind it
+default_lock_timeout = "10s"
+
+
+def live_schema() -> Optional[str]:
+    """ The schema the climatological tables live in, as the ORM knows it (None for the default). """
+    return swapped_tables[0].schema
+
+
+def schema_name() -> str:
+    return live_schema() or "public"
+
+
+def shadow_schema_name() -> str:
+    return f"{schema_name()}_shadow"
+
+
+def previous_schema_name() -> str:
+    return f"{schema_name()}_previous"
+
+
+def quote(name: str) -> str:
+    """ Quote an identifier only where needed, the same way the pg_get_*def functions do. """
+    return postgresql.dialect().identifier_preparer.quote(name)
+
+
+def qualified(schema: str, table) -> str:
+    return f"{quote(schema)}.{quote(table.name)}"
+
+
+def shadow_engine(engine: Engine) -> Engine:
+    """ An engine whose ORM statements go to the shadow tables instead of the live ones. """
+    return engine.execution_options(schema_translate_map={live_schema(): shadow_schema_name()})
+
+
+def find_dependents(connection: Connection) -> List[str]:
+    """ Views and foreign keys outside the swapped tables that depend on them. """
+    live = [qualified(schema_name(), table) for table in swapped_tables]
+    rows = connection.execute(sa.text("""
+        SELECT DISTINCT format('view %s', v.oid::regclass)
+        FROM pg_depend d
+        JOIN pg_rewrite r ON r.oid = d.objid
+        JOIN pg_class v ON v.oid = r.ev_class
+        WHERE d.classid = 'pg_rewrite'::regclass
+          AND d.refobjid = ANY(CAST(:live AS regclass[]))
+          AND v.oid <> ALL(CAST(:live AS regclass[]))
+        UNION
+        SELECT format('foreign key %s on %s', c.conname, c.conrelid::regclass)
+        FROM pg_constraint c
+        WHERE c.contype = 'f'
+          AND c.confrelid = ANY(CAST(:live AS regclass[]))
+          AND c.conrelid <> ALL(CAST(:live AS regclass[]))
+    """), {"live": live})
+    return sorted(row[0] for row in rows)
+
+
+def create_shadow_tables(connection: Connection) -> None:
+    """ (Re)create empty shadow copies of the climatological tables. """
+    shadow = shadow_schema_name()
+    # fully qualified names from pg_get_*def, whatever the caller's search_path
+    connection.execute(sa.text("SET LOCAL search_path TO pg_catalog"))
+
+    dependents = find_dependents(connection)
+    if dependents:
+        raise RuntimeError(f"Can't swap the climatological tables, other objects depend on them: {dependents}")
+
+    connection.execute(sa.text(f"DROP SCHEMA IF EXISTS {quote(shadow)} CASCADE"))
+    connection.execute(sa.text(f"CREATE SCHEMA {quote(shadow)}"))
+
+    for table in swapped_tables:
+        connection.execute(sa.text(
+            f"CREATE TABLE {qualified(shadow, table)} (LIKE {qualified(schema_name(), table)} INCLUDING ALL)"
+        ))
+
+    for table in swapped_tables:
+        live = qualified(schema_name(), table)
+        copy = qualified(shadow, table)
+
+        # foreign keys, pointed at the shadow copy when they reference another swapped table
+        foreign_keys = connection.execute(sa.text(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = CAST(:t AS regclass) AND contype = 'f'"
+        ), {"t": live})
+        for name, definition in foreign_keys:
+            for other in swapped_tables:
+                definition = definition.replace(f"REFERENCES {qualified(schema_name(), other)}(", f"REFERENCES {qualified(shadow, other)}(")
+            connection.execute(sa.text(f"ALTER TABLE {copy} ADD CONSTRAINT {quote(name)} {definition}"))
+
+        triggers = connection.execute(sa.text(
+            "SELECT pg_get_triggerdef(oid) FROM pg_trigger WHERE tgrelid = CAST(:t AS regclass) AND NOT tgisinternal"
+        ), {"t": live})
+        for (definition,) in triggers:
+            definition = definition.replace(f" ON {live} ", f" ON {copy} ")
+            connection.execute(sa.text(definition))
+
+        grants = connection.execute(sa.text("""
+            SELECT CASE WHEN a.grantee = 0 THEN 'PUBLIC' ELSE quote_ident(pg_get_userbyid(a.grantee)) END, a.privilege_type
+            FROM pg_class c, aclexplode(c.relacl) a
+            WHERE c.oid = CAST(:t AS regclass) AND a.grantee <> c.relowner
+        """), {"t": live})
+        for grantee, privilege in grants:
+            connection.execute(sa.text(f"GRANT {privilege} ON {copy} TO {grantee}"))
+
+    logger.info(f"Created empty shadow tables in schema {shadow}: {[table.name for table in swapped_tables]}")
+    copy_kept_rows(connection)
+
+
+def copy_kept_rows(connection: Connection) -> None:
+    """ Copy the rows the import doesn't write into the shadow tables, so the swap keeps them: all
+    periods and variables, and the stations of other types with their links and values.
+    """
+    # verify imports main, which imports this module
+    from verify import imported_station_types
+
+    live_name = schema_name()
+    shadow = shadow_schema_name()
+    period, variable, station, x_hist, value = swapped_tables
+    station_columns = sa.inspect(ClimatologicalStation).columns
+    station_id = quote(station_columns["id"].name)
+    kept_stations = (
+        f"SELECT {station_id} FROM {qualified(live_name, station)} "
+        f"WHERE {quote(station_columns['type'].name)}::text <> ALL(CAST(:imported AS text[]))"
+    )
+    statements = [
+        (period, ""),
+        (variable, ""),
+        (station, f"WHERE {station_id} IN ({kept_stations})"),
+        (x_hist, f"WHERE {quote(sa.inspect(ClimatologicalStationXHistory).columns['climo_station_id'].name)} IN ({kept_stations})"),
+        (value, f"WHERE {quote(sa.inspect(ClimatologicalValue).columns['climo_station_id'].name)} IN ({kept_stations})"),
+    ]
+    for table, condition in statements:
+        # the copies were made with LIKE, so their columns are in the same order
+        result = connection.execute(sa.text(
+            f"INSERT INTO {qualified(shadow, table)} SELECT * FROM {qualified(live_name, table)} {condition}"
+        ), {"imported": imported_station_types})
+        logger.info(f"Copied {result.rowcount} rows of {table.name} into the shadow tables")
+
+
+def prepare_shadow_tables(engine: Engine) -> None:
+    with engine.begin() as connection:
+        create_shadow_tables(connection)
+
+
+def swap_shadow_tables(engine: Engine, lock_timeout: str = default_lock_timeout) -> None:
+    """ Swap the loaded shadow tables in for the live ones in one short transaction, and drop the old tables. """
+    live_name = schema_name()
+    shadow = shadow_schema_name()
+    previous = previous_schema_name()
+
+    with engine.begin() as connection:
+        connection.execute(sa.text("SET LOCAL search_path TO pg_catalog"))
+        connection.execute(sa.text(f"SET LOCAL lock_timeout = '{lock_timeout}'"))
+        connection.execute(sa.text(f"DROP SCHEMA IF EXISTS {quote(previous)} CASCADE"))
+        connection.execute(sa.text(f"CREATE SCHEMA {quote(previous)}"))
+
+        # serial sequences are shared by the live and shadow tables, detach them so they stay put and
+        # survive the drop, then hand them to the new tables
+        sequences = connection.execute(sa.text("""
+            SELECT c.relname, a.attname, pg_get_serial_sequence(format('%I.%I', n.nspname, c.relname), a.attname)
+            FROM pg_attribute a
+            JOIN pg_class c ON c.oid = a.attrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = :schema AND c.relname = ANY(:tables)
+              AND a.attnum > 0 AND NOT a.attisdropped AND a.attidentity = ''
+        """), {"schema": live_name, "tables": [table.name for table in swapped_tables]})
+        sequences = [(table_name, column, sequence) for table_name, column, sequence in sequences if sequence is not None]
+        for _, _, sequence in sequences:
+            connection.execute(sa.text(f"ALTER SEQUENCE {sequence} OWNED BY NONE"))
+
+        for table in swapped_tables:
+            connection.execute(sa.text(f"ALTER TABLE {qualified(live_name, table)} SET SCHEMA {quote(previous)}"))
+            connection.execute(sa.text(f"ALTER TABLE {qualified(shadow, table)} SET SCHEMA {quote(live_name)}"))
+
+        for table_name, column, sequence in sequences:
+            connection.execute(sa.text(f"ALTER SEQUENCE {sequence} OWNED BY {quote(live_name)}.{quote(table_name)}.{quote(column)}"))
+
+        # no CASCADE, anything that still depends on the old tables aborts the swap
+        connection.execute(sa.text(f"DROP TABLE {', '.join(qualified(previous, table) for table in reversed(swapped_tables))}"))
+        connection.execute(sa.text(f"DROP SCHEMA {quote(previous)}"))
+        connection.execute(sa.text(f"DROP SCHEMA {quote(shadow)}"))
+
+    logger.info(f"Swapped the shadow tables into schema {live_name}")
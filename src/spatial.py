@@ -0,0 +1,78 @@
+# Nearest-neighbour lookups over station coordinates, shared by the location check in verify.py
+# and the neighbour QC in validation.py.
+#
+# Points are placed on the unit sphere so a plain 3-d KD-tree with straight-line (chord) distances
+# gives great-circle nearest neighbours, with no special cases at the poles or the antimeridian.
+
+import heapq
+import math
+from typing import Generic, List, Optional, Sequence, Tuple, TypeVar
+
+earth_radius_km = 6371.0088
+
+Key = TypeVar("Key")
+Point = Tuple[float, float, float]
+
+
+def to_unit_vector(lat: float, lon: float) -> Point:
+    lat_r, lon_r = math.radians(lat), math.radians(lon)
+    return (math.cos(lat_r) * math.cos(lon_r), math.cos(lat_r) * math.sin(lon_r), math.sin(lat_r))
+
+
+def chord_to_km(chord: float) -> float:
+    """ Great-circle distance for a chord of the unit sphere. """
+    return 2 * earth_radius_km * math.asin(min(chord / 2, 1.0))
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """ Great-circle (haversine) distance between two points. """
+    return chord_to_km(math.dist(to_unit_vector(lat1, lon1), to_unit_vector(lat2, lon2)))
+
+
+class KDTree(Generic[Key]):
+    """ A static KD-tree over (key, lat, lon) points, built once and queried for the k nearest keys. """
+    def __init__(self, points: Sequence[Tuple[Key, float, float]]):
+        self.size = len(points)
+        nodes = [(to_unit_vector(lat, lon), key) for key, lat, lon in points]
+        self.root = self.build(nodes, 0)
+
+    def __repr__(self):
+        return f"KDTree(size={self.size})"
+
+    def build(self, nodes: List[Tuple[Point, Key]], depth: int):
+        if not nodes:
+            return None
+        axis = depth % 3
+        nodes.sort(key=lambda node: node[0][axis])
+        median = len(nodes) // 2
+        # (point, key, axis, left, right)
+        return (nodes[median][0], nodes[median][1], axis,
+                self.build(nodes[:median], depth + 1),
+                self.build(nodes[median + 1:], depth + 1))
+
+    def nearest(self, lat: float, lon: float, k: int = 1, exclude: Optional[Key] = None) -> List[Tuple[Key, float]]:
+        """ The `k` nearest keys to (lat, lon) with their distances in km, nearest first. """
+        target = to_unit_vector(lat, lon)
+        # max-heap of (-chord, tiebreak, key) holding the best k so far
+        best: List[Tuple[float, int, Key]] = []
+        counter = 0
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            point, key, axis, left, right = node
+            if key != exclude:
+                chord = math.dist(point, target)
+                if len(best) < k:
+                    heapq.heappush(best, (-chord, counter, key))
+                elif chord < -best[0][0]:
+                    heapq.heapreplace(best, (-chord, counter, key))
+                counter += 1
+            delta = target[axis] - point[axis]
+            near, far = (left, right) if delta < 0 else (right, left)
+            # visit the near side first (pushed last), the far side only if it can still hold something closer
+            if len(best) < k or abs(delta) < -best[0][0]:
+                stack.append(far)
+            stack.append(near)
+        return [(key, chord_to_km(-neg_chord)) for neg_chord, _, key in sorted(best, reverse=True)]
@@ -0,0 +1,273 @@
+# Post-import verification. Cross-checks the composite station files against the database with a
+# handful of aggregate queries, instead of walking ORM objects, so the full dataset checks in seconds.
+#
+# Expectations are computed in one pass over the composite station files:
+#   stations:        one per history line with data for the period
+#   values:          12 per station
+#   base links:      one per station
+#   joint links:     one per non-null joint station
+#   contributing years: the sum of monthlyyears
+#
+# With --locations it also checks each composite row's lat/lon against the coordinates of the history
+# it claims, flagging rows more than a tolerance away and suggesting the nearest history instead.
+
+import argparse
+import logging
+import sys
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+from pycds import ClimatologicalPeriod, ClimatologicalStation, ClimatologicalStationXHistory, ClimatologicalValue, ClimatologicalVariable, History # type: ignore
+
+from archive import close_archives
+from main import HistoryLine, ImportFilter, climatology_periods, read_station_info_file, var_map
+from spatial import KDTree, distance_km
+
+logger = logging.getLogger(__name__)
+
+# station types written by the importer, as opposed to e.g. migrated prism stations
+imported_station_types = ["composite", "long-record"]
+
+checks = ["stations", "values", "stations_without_12_values", "base_links", "joint_links", "contributing_years"]
+
+# (variable, period label) -> check -> count
+Aggregates = Dict[Tuple[str, str], Dict[str, int]]
+
+# how far a composite row's coordinates may be from its history's before it is flagged
+default_location_tolerance_km = 1.0
+
+
+class Mismatch():
+    """ A check whose database count differs from the count expected from the input files. """
+    def __init__(self, variable: str, period: str, check: str, expected: int, actual: int):
+        self.variable = variable
+        self.period = period
+        self.check = check
+        self.expected = expected
+        self.actual = actual
+
+    def __repr__(self):
+        return f"Mismatch(variable={self.variable}, period={self.period}, check={self.check}, expected={self.expected}, actual={self.actual})"
+
+
+def compute_expectations(variables: List[str], import_filter: Optional[ImportFilter] = None) -> Aggregates:
+    """ Compute the expected aggregates in a single pass over the composite station files,
+    for the subset in `import_filter` if given.
+    """
+    if import_filter is None:
+        import_filter = ImportFilter()
+    expected: Aggregates = new_aggregates()
+    for variable in variables:
+        for line in read_station_info_file(variable):
+            if import_filter.includes_history(line.history_id):
+                add_expectations(expected, variable, line, import_filter)
+    return expected
+
+
+def new_aggregates() -> Aggregates:
+    return defaultdict(lambda: dict.fromkeys(checks, 0))
+
+
+def add_expectations(expected: Aggregates, variable: str, line: HistoryLine, import_filter: ImportFilter) -> None:
+    """ Add what the import writes for one history line, from its has_data flags alone. """
+    for period in climatology_periods:
+        if not line.has_data[period.label] or not import_filter.includes_period(period.label):
+            continue
+        counts = expected[(variable, period.label)]
+        counts["stations"] += 1
+        counts["values"] += 12
+        counts["base_links"] += 1
+        counts["joint_links"] += sum(joint_id is not None for joint_id in line.joint_stations[period.label])
+        counts["contributing_years"] += sum(line.monthlyyears[period.label])
+
+
+def lookup_keys(session: Session, variables: List[str]) -> Tuple[Dict[int, str], Dict[int, str]]:
+    """ Map climatological variable IDs to importer variable names, and period IDs to period labels. """
+    net_var_names = {var_map[v]: v for v in variables}
+    variable_keys = {
+        variable.id: net_var_names[variable.net_var_name]
+        for variable in session.query(ClimatologicalVariable).filter(ClimatologicalVariable.net_var_name.in_(net_var_names))
+    }
+    labels = {(period.start_date, period.end_date): period.label for period in climatology_periods}
+    period_keys = {}
+    for period in session.query(ClimatologicalPeriod):
+        label = labels.get((str(period.start_date)[:10], str(period.end_date)[:10]))
+        if label is not None:
+            period_keys[period.id] = label
+    return variable_keys, period_keys
+
+
+def query_database_aggregates(session: Session, variables: List[str]) -> Aggregates:
+    """ Count what the importer wrote with two grouped aggregate queries. """
+    variable_keys, period_keys = lookup_keys(session, variables)
+    actual: Aggregates = new_aggregates()
+
+    def key(variable_id, period_id) -> Optional[Tuple[str, str]]:
+        if variable_id not in variable_keys or period_id not in period_keys:
+            return None
+        return variable_keys[variable_id], period_keys[period_id]
+
+    # values per station and variable, for the imported stations only
+    per_station = (
+        sa.select(
+            ClimatologicalValue.climo_station_id.label("climo_station_id"),
+            ClimatologicalValue.climo_variable_id.label("climo_variable_id"),
+            ClimatologicalStation.climo_period_id.label("climo_period_id"),
+            sa.func.count().label("value_count"),
+            sa.func.sum(ClimatologicalValue.num_contributing_years).label("contributing_years"),
+        )
+        .join(ClimatologicalStation, ClimatologicalStation.id == ClimatologicalValue.climo_station_id)
+        .where(
+            ClimatologicalStation.type.in_(imported_station_types),
+            ClimatologicalValue.climo_variable_id.in_(variable_keys),
+        )
+        .group_by(ClimatologicalValue.climo_station_id, ClimatologicalValue.climo_variable_id, ClimatologicalStation.climo_period_id)
+        .subquery("per_station")
+    )
+
+    value_totals = sa.select(
+        per_station.c.climo_variable_id,
+        per_station.c.climo_period_id,
+        sa.func.count(),
+        sa.func.sum(per_station.c.value_count),
+        sa.func.count().filter(per_station.c.value_count != 12),
+        sa.func.coalesce(sa.func.sum(per_station.c.contributing_years), 0),
+    ).group_by(per_station.c.climo_variable_id, per_station.c.climo_period_id)
+
+    for variable_id, period_id, stations, values, without_12, years in session.execute(value_totals):
+        k = key(variable_id, period_id)
+        if k is None:
+            continue
+        actual[k]["stations"] = stations
+        actual[k]["values"] = values
+        actual[k]["stations_without_12_values"] = without_12
+        actual[k]["contributing_years"] = years
+
+    link_totals = (
+        sa.select(
+            per_station.c.climo_variable_id,
+            per_station.c.climo_period_id,
+            ClimatologicalStationXHistory.role,
+            sa.func.count(),
+        )
+        .join(ClimatologicalStationXHistory, ClimatologicalStationXHistory.climo_station_id == per_station.c.climo_station_id)
+        .group_by(per_station.c.climo_variable_id, per_station.c.climo_period_id, ClimatologicalStationXHistory.role)
+    )
+
+    for variable_id, period_id, role, count in session.execute(link_totals):
+        k = key(variable_id, period_id)
+        if k is None:
+            continue
+        actual[k][f"{role}_links"] = count
+
+    return actual
+
+
+def compare(expected: Aggregates, actual: Aggregates) -> List[Mismatch]:
+    mismatches = []
+    for k in sorted(set(expected) | set(actual)):
+        for check in checks:
+            expected_count = expected[k][check] if k in expected else 0
+            actual_count = actual[k][check] if k in actual else 0
+            if expected_count != actual_count:
+                mismatches.append(Mismatch(k[0], k[1], check, expected_count, actual_count))
+    return mismatches
+
+
+def verify(session: Session, variables: Optional[List[str]] = None) -> List[Mismatch]:
+    """ Compare the database against the composite station files, returning every mismatch. """
+    if variables is None:
+        variables = list(var_map)
+
+    logger.info(f"Computing expected counts from the composite station files for {variables}")
+    expected = compute_expectations(variables)
+    logger.info("Querying database aggregates")
+    actual = query_database_aggregates(session, variables)
+
+    mismatches = compare(expected, actual)
+    for k in sorted(expected):
+        logger.info(f"{k[0]} {k[1]}: " + ", ".join(f"{check}={expected[k][check]}" for check in checks))
+    for mismatch in mismatches:
+        logger.error(f"{mismatch.variable} {mismatch.period} {mismatch.check}: expected {mismatch.expected}, found {mismatch.actual}")
+    logger.info(f"Verification finished with {len(mismatches)} mismatches")
+    return mismatches
+
+
+class LocationMismatch():
+    """ A composite row whose coordinates don't match the history it claims. """
+    def __init__(self, variable: str, history_id: int, lat: float, lon: float, distance_km: Optional[float],
+                 nearest_history_id: Optional[int], nearest_distance_km: Optional[float]):
+        self.variable = variable
+        self.history_id = history_id
+        self.lat = lat
+        self.lon = lon
+        # None if the history doesn't exist or has no coordinates
+        self.distance_km = distance_km
+        self.nearest_history_id = nearest_history_id
+        self.nearest_distance_km = nearest_distance_km
+
+    def __repr__(self):
+        return (f"LocationMismatch(variable={self.variable}, history_id={self.history_id}, lat={self.lat}, lon={self.lon}, "
+                f"distance_km={self.distance_km}, nearest_history_id={self.nearest_history_id}, nearest_distance_km={self.nearest_distance_km})")
+
+
+def check_locations(session: Session, variables: Optional[List[str]] = None,
+                    tolerance_km: float = default_location_tolerance_km) -> List[LocationMismatch]:
+    """ Compare the composite rows' coordinates with their histories', loading every history's
+    coordinates once into a KD-tree to suggest the nearest history for each mismatch.
+    """
+    if variables is None:
+        variables = list(var_map)
+
+    histories = {
+        history_id: (float(lat), float(lon))
+        for history_id, lat, lon in session.query(History.id, History.lat, History.lon).filter(History.lat.isnot(None), History.lon.isnot(None))
+    }
+    tree = KDTree([(history_id, lat, lon) for history_id, (lat, lon) in histories.items()])
+    logger.info(f"Loaded coordinates for {len(histories)} histories")
+
+    mismatches = []
+    checked = 0
+    for variable in variables:
+        for line in read_station_info_file(variable):
+            checked += 1
+            claimed = histories.get(line.history_id)
+            distance = distance_km(line.lat, line.lon, *claimed) if claimed is not None else None
+            if distance is not None and distance <= tolerance_km:
+                continue
+            nearest = tree.nearest(line.lat, line.lon)
+            nearest_id, nearest_distance = nearest[0] if nearest else (None, None)
+            mismatches.append(LocationMismatch(variable, line.history_id, line.lat, line.lon, distance, nearest_id, nearest_distance))
+
+    for m in mismatches:
+        where = f"{m.distance_km:.2f} km from its history" if m.distance_km is not None else "history has no coordinates"
+        nearest = f", nearest history {m.nearest_history_id} at {m.nearest_distance_km:.2f} km" if m.nearest_history_id is not None else ""
+        logger.error(f"{m.variable} history_id {m.history_id} at ({m.lat}, {m.lon}): {where}{nearest}")
+    logger.info(f"Checked {checked} composite rows against history locations, {len(mismatches)} beyond {tolerance_km} km")
+    return mismatches
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Verify an import against the composite station files.")
+    parser.add_argument("--variable", choices=list(var_map), action="append", dest="variables",
+                        help="Only verify the given variable, may be repeated (default: all)")
+    parser.add_argument("--locations", action="store_true",
+                        help="Also check the composite rows' coordinates against their histories'")
+    parser.add_argument("--tolerance-km", type=float, default=default_location_tolerance_km,
+                        help=f"Distance beyond which a location is flagged (default: {default_location_tolerance_km})")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    engine = sa.create_engine("postgresql://crmp@dbtest04.pcic.uvic.ca/crmp", echo=False)
+    session = Session(engine)
+    try:
+        mismatches = verify(session, args.variables)
+        location_mismatches = check_locations(session, args.variables, args.tolerance_km) if args.locations else []
+    finally:
+        session.close()
+        close_archives()
+    sys.exit(0 if not mismatches and not location_mismatches else 1)
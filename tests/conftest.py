@@ -3,6 +3,7 @@ import sys
 import os
 import re
 import csv
+import pytest
 from typing import Callable, List
 from alembic import config as alembic_config_module
 import pycds
@@ -13,6 +14,10 @@ from sqlalchemy.schema import CreateSchema
 from sqlalchemy.orm import Session
 from pycds import Network, Station, History
 
+# main reads CLIMO_DATA_DIR when it is first imported, so point it at the test data before any test
+# module imports main, whatever order the modules are collected in
+os.environ['CLIMO_DATA_DIR'] = os.path.join(os.path.dirname(__file__), 'data') + '/'
+
 def alembic_config():
     """
     In a test config, none of the existing environments are appropriate, we want to
@@ -37,6 +42,22 @@ def init_db(postgresql: testing.postgresql.Postgresql):
     engine = sa.create_engine(postgresql.url())
     db_setup(engine)
 
+def pytest_addoption(parser):
+    parser.addoption(
+        "--runslow", action="store_true", default=False, help="run tests marked as slow"
+    )
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: long running test, only run with --runslow")
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--runslow"):
+        return
+    skip_slow = pytest.mark.skip(reason="need --runslow option to run")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip_slow)
+
 def pytest_runtest_setup():
     logging.basicConfig(level=logging.DEBUG, stream=sys.stdout)
     # logging.getLogger("tests").setLevel(logging.DEBUG)
@@ -166,6 +187,46 @@ def seed_history_records(engine: sa.Engine):
                 {"history_id": history_id, "station_id": station_id}
             )
 
+@pytest.fixture(scope="function")
+def test_db_engine():
+    """Create a temporary PostgreSQL database for testing."""
+    with testing.postgresql.Postgresql() as pg:
+        engine = sa.create_engine(pg.url())
+        db_setup(engine)
+        
+        # Run Alembic migrations to create tables
+        pycds_path = os.path.dirname(pycds.__file__)
+        alembic_dir = os.path.join(pycds_path, "alembic")
+        
+        config = alembic_config_module.Config()
+        config.set_main_option("script_location", alembic_dir)
+        config.set_main_option("sqlalchemy.url", pg.url())
+        
+        # Run migrations using alembic command
+        from alembic import command
+        command.upgrade(config, "head")
+        
+        # Set search_path so triggers can find hxtk_* functions
+        schema = pycds.get_schema_name()
+        with engine.begin() as conn:
+            conn.execute(sa.text(f"SET search_path TO {schema}, public"))
+        
+        # Seed history records from test data
+        seed_history_records(engine)
+        
+        yield engine
+        engine.dispose()
+
+@pytest.fixture(scope="function")
+def test_session(test_db_engine):
+    """Create a database session for testing."""
+    session = Session(test_db_engine)
+    # Set search_path for this session so triggers can find hxtk_* functions
+    schema = pycds.get_schema_name()
+    session.execute(sa.text(f"SET search_path TO {schema}, public"))
+    yield session
+    session.close()
+
 def split_on(sep:str) -> Callable[[str], List[str]]:
     def f(s:str) -> List[str]:
         if s == "":
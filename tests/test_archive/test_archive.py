@@ -0,0 +1,148 @@
+"""
+Tests for reading the input files out of archives.
+"""
+import gzip
+import os
+import shutil
+import sys
+import tarfile
+import zipfile
+from contextlib import nullcontext
+from unittest.mock import MagicMock
+
+import pytest
+
+test_data = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+# Set test data directory BEFORE importing main (so basedir is set correctly)
+os.environ['CLIMO_DATA_DIR'] = test_data + '/'
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import archive
+import main
+from archive import close_archives, is_archive, open_text, split_archive_path
+
+station_file = "composite_station_info/ppt_composite_station_file.csv"
+data_file = "csv/ppt/1981_2010/11622_ppt_1981_2010.csv"
+
+
+@pytest.fixture(autouse=True)
+def fresh_archives():
+    """Don't share indexed archives between tests."""
+    yield
+    close_archives()
+
+
+def build_archive(path, prefix=""):
+    """Pack the bundled test data tree into an archive, by its suffix."""
+    if str(path).endswith(".zip"):
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+            for root, _, files in os.walk(test_data):
+                for name in files:
+                    full = os.path.join(root, name)
+                    z.write(full, prefix + os.path.relpath(full, test_data))
+    else:
+        mode = "w:gz" if str(path).endswith((".tar.gz", ".tgz")) else "w"
+        with tarfile.open(path, mode) as t:
+            t.add(test_data, arcname=prefix.rstrip("/") or ".")
+    return str(path)
+
+
+def point_main_at(monkeypatch, basedir):
+    monkeypatch.setattr(main, "station_info_template", f"{basedir}composite_station_info/{{0}}_composite_station_file.csv")
+    monkeypatch.setattr(main, "data_location_template", f"{basedir}csv/{{0}}/{{1}}/{{2}}_{{0}}_{{1}}.csv")
+
+
+class TestArchivePaths:
+    """Test cases for recognising paths through archives."""
+
+    def test_split(self, tmp_path):
+        """Test that the archive and member are split where the archive file is."""
+        path = build_archive(tmp_path / "drop.zip")
+        assert split_archive_path(f"{path}/{station_file}") == (path, station_file)
+        assert split_archive_path(f"{test_data}/{station_file}") is None
+        assert is_archive(path) and is_archive(f"{path}/")
+        assert not is_archive(str(tmp_path))
+
+
+class TestOpenText:
+    """Test cases for open_text."""
+
+    @pytest.mark.parametrize("name", ["drop.zip", "drop.tar", "drop.tar.gz", "drop.tgz"])
+    def test_reads_members(self, tmp_path, name):
+        """Test that members read the same as the files on disk, for every archive format."""
+        path = build_archive(tmp_path / name)
+        for member in [station_file, data_file]:
+            with open_text(f"{path}/{member}") as f, open(os.path.join(test_data, member)) as expected:
+                assert f.read() == expected.read()
+
+    def test_indexes_once(self, tmp_path, mocker):
+        """Test that an archive is indexed on first use only."""
+        path = build_archive(tmp_path / "drop.tar.gz")
+        spy = mocker.spy(archive, "Archive")
+        for _ in range(3):
+            with open_text(f"{path}/{data_file}") as f:
+                f.read()
+        assert spy.call_count == 1
+
+    def test_logs_spool_size(self, tmp_path, caplog):
+        """Test that the size of a compressed tar's temporary copy is logged."""
+        path = build_archive(tmp_path / "drop.tar.gz")
+        with caplog.at_level("INFO", logger="archive"):
+            archive.get_archive(path)
+        assert any(record.message.startswith(f"Decompressed {path} into a ") for record in caplog.records)
+
+    def test_nested_directory(self, tmp_path):
+        """Test that a data tree under a top-level directory in the archive is found through it."""
+        path = build_archive(tmp_path / "drop.tar.gz", prefix="climo/")
+        with open_text(f"{path}/climo/{data_file}") as f:
+            assert f.readline().startswith("obs_time")
+
+    def test_gzip_file(self, tmp_path):
+        """Test that a gzip compressed file is read in place of a missing plain one."""
+        with open(os.path.join(test_data, data_file), "rb") as src, gzip.open(tmp_path / "data.csv.gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        with open_text(str(tmp_path / "data.csv")) as f, open(os.path.join(test_data, data_file)) as expected:
+            assert f.read() == expected.read()
+
+    def test_missing(self, tmp_path):
+        """Test that missing files raise FileNotFoundError, on disk and in archives."""
+        path = build_archive(tmp_path / "drop.zip")
+        with pytest.raises(FileNotFoundError):
+            open_text(f"{path}/csv/ppt/1981_2010/0_ppt_1981_2010.csv")
+        with pytest.raises(FileNotFoundError):
+            open_text(str(tmp_path / "missing.csv"))
+
+
+class TestReadFromArchive:
+    """Test cases for the importer's readers over an archive."""
+
+    def test_readers(self, tmp_path, monkeypatch):
+        """Test that the station info and data files read the same from an archive as from disk."""
+        point_main_at(monkeypatch, f"{test_data}/")
+        history_lines = main.read_station_info_file("ppt")
+        data_lines = main.read_data_file("ppt", "1981_2010", "11622")
+
+        point_main_at(monkeypatch, f"{build_archive(tmp_path / 'drop.tar.gz')}/")
+        assert [repr(line) for line in main.read_station_info_file("ppt")] == [repr(line) for line in history_lines]
+        assert [(d.obs_time, d.datum) for d in main.read_data_file("ppt", "1981_2010", "11622")] == [(d.obs_time, d.datum) for d in data_lines]
+        with pytest.raises(FileNotFoundError):
+            main.read_data_file("ppt", "1981_2010", "0")
+
+    @pytest.mark.parametrize("fails", [False, True])
+    def test_import_closes_archives(self, tmp_path, monkeypatch, mocker, fails):
+        """Test that an import closes its archives and their temporary files when done, even if it fails."""
+        point_main_at(monkeypatch, f"{build_archive(tmp_path / 'drop.tar.gz')}/")
+        spy = mocker.spy(archive.Archive, "close")
+        writer = MagicMock()
+        if fails:
+            writer.add_value.side_effect = RuntimeError("disk full")
+
+        with pytest.raises(RuntimeError) if fails else nullcontext():
+            main.main(writer=writer, variables=["ppt"])
+
+        assert archive.archives == {}
+        assert spy.call_count == 1
+        assert spy.call_args.args[0].spool.closed
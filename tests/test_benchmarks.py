@@ -0,0 +1,79 @@
+"""
+Microbenchmarks for the parsing and database write paths.
+Uses pytest-benchmark; the database benchmarks run against a temporary PostgreSQL
+instance via the same `testing.postgresql` fixtures as the end-to-end tests.
+
+Save a baseline and compare a later change against it with:
+
+    poetry run pytest tests/test_benchmarks.py --benchmark-autosave
+    poetry run pytest tests/test_benchmarks.py --benchmark-compare --benchmark-compare-fail=mean:10%
+"""
+import csv
+import os
+import sys
+
+# Set test data directory BEFORE importing main (so basedir is set correctly)
+test_dir = os.path.join(os.path.dirname(__file__), 'data')
+os.environ['CLIMO_DATA_DIR'] = test_dir + '/'
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from main import (
+    HistoryLine,
+    generate_climatological_periods,
+    generate_climatological_variables,
+    generate_station,
+    generate_base_station_history,
+    generate_station_histories,
+    generate_value_data,
+    get_period_id_by_dates,
+    read_station_info_file,
+    read_data_file,
+)
+
+
+class TestParsingBenchmarks:
+    """Benchmarks for the CSV parsing path (no database required)."""
+
+    def test_history_line_construction(self, benchmark):
+        """Time building a HistoryLine from a single composite file row."""
+        with open(os.path.join(test_dir, 'composite_station_info', 'ppt_composite_station_file.csv')) as f:
+            row = next(csv.DictReader(f))
+
+        line = benchmark(HistoryLine, row)
+        assert line.history_id == int(row['history_id'])
+
+    def test_read_station_info_file(self, benchmark):
+        """Time reading and parsing the full ppt composite station file."""
+        history_lines = benchmark(read_station_info_file, 'ppt')
+        assert len(history_lines) == 12
+
+    def test_read_data_file(self, benchmark):
+        """Time reading a single 12 month station data file."""
+        data_lines = benchmark(read_data_file, 'ppt', '1971_2000', '404')
+        assert len(data_lines) == 12
+
+
+class TestWriteBenchmarks:
+    """Benchmarks for the per-station database write sequence."""
+
+    def test_generate_station_sequence(self, benchmark, test_session):
+        """Time the station, history link and value writes for one history line and period."""
+        generate_climatological_periods(test_session)
+        generate_climatological_variables(test_session)
+        period_id = get_period_id_by_dates(test_session, "1971-01-01", "2000-12-31")
+
+        history_lines = read_station_info_file('ppt')
+        history_line = next(h for h in history_lines if h.has_1971_data)
+
+        def write_station():
+            station = generate_station(test_session, history_line, period_id)
+            generate_base_station_history(test_session, station.id, history_line.history_id)
+            generate_station_histories(test_session, station.id, history_line.joint_stations_1971)
+            generate_value_data(test_session, 'ppt', '1971_2000', station.id, str(history_line.history_id), history_line.monthlyyears_1971)
+            test_session.flush()
+            return station
+
+        station = benchmark(write_station)
+        assert station.id is not None
@@ -0,0 +1,150 @@
+"""
+Tests for the offline COPY load files.
+"""
+import pytest
+import subprocess
+import sys
+import os
+import testing.postgresql
+from sqlalchemy.orm import Session
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import main
+from emit import LoadFileWriter, copy_field
+from main import climatology_periods, climatological_variable_definitions
+from pycds import ClimatologicalPeriod, ClimatologicalStation, ClimatologicalStationXHistory, ClimatologicalValue, ClimatologicalVariable
+
+test_data = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+
+class TestCopyField:
+    """Test cases for copy_field."""
+
+    @pytest.mark.parametrize("value,expected", [
+        (None, "\\N"),
+        (12, "12"),
+        (-1.5, "-1.5"),
+        ("", ""),
+        ("a\tb\\c\nd", "a\\tb\\\\c\\nd"),
+    ])
+    def test_copy_text_format(self, value, expected):
+        """Test NULLs and special characters are written in COPY text format."""
+        assert copy_field(value) == expected
+
+
+class TestLoadFileWriter:
+    """Test cases for LoadFileWriter."""
+
+    def test_station_ids_from_offset(self, tmp_path):
+        """Test that stations are numbered from the first station ID."""
+        writer = LoadFileWriter(str(tmp_path), first_station_id=5000)
+
+        assert writer.add_station("long-record", None, climatology_periods[0]) == 5000
+        assert writer.add_station("composite", 3, climatology_periods[1]) == 5001
+        writer.close()
+
+        assert (tmp_path / "stations.tsv").read_text().splitlines() == [
+            "5000\tlong-record\t\\N\t\t1971-01-01\t2000-12-31",
+            "5001\tcomposite\t3\t\t1981-01-01\t2010-12-31",
+        ]
+
+    def test_rejects_non_positive_offset(self, tmp_path):
+        """Test that station IDs must start above zero."""
+        with pytest.raises(ValueError):
+            LoadFileWriter(str(tmp_path), first_station_id=0)
+
+    def test_links_and_values(self, tmp_path):
+        """Test links and values reference the assigned station ID and variable name."""
+        writer = LoadFileWriter(str(tmp_path))
+        station_id = writer.add_station("composite", None, climatology_periods[0])
+        writer.add_station_history(station_id, 404, "base")
+        writer.add_station_history(station_id, 405, "joint")
+        writer.add_value(station_id, "Precip_Climatology", "01-Jan-1971", 10.5, 30)
+        writer.close()
+
+        assert (tmp_path / "station_histories.tsv").read_text() == "1\t404\tbase\n1\t405\tjoint\n"
+        assert (tmp_path / "values.tsv").read_text() == "1\tPrecip_Climatology\t01-Jan-1971\t10.5\t30\n"
+        assert writer.rows == {"stations.tsv": 1, "station_histories.tsv": 2, "values.tsv": 1}
+
+    def test_load_script(self, tmp_path):
+        """Test the psql script copies every file in one transaction and moves the station sequence on."""
+        writer = LoadFileWriter(str(tmp_path), first_station_id=100)
+        writer.close()
+
+        script = (tmp_path / "load.sql").read_text()
+
+        assert script.index("BEGIN;") < script.index("\\copy load_station FROM 'stations.tsv'") < script.index("COMMIT;")
+        assert "\\copy load_value FROM 'values.tsv'" in script
+        assert "FROM 'station_histories.tsv'" in script
+        assert "setval(pg_get_serial_sequence(" in script
+        assert ">= 100" in script
+        assert "\\set ON_ERROR_STOP on" in script
+
+    def test_savepoint(self, tmp_path):
+        """Test that rows written in a failed savepoint are dropped and its station IDs reused."""
+        writer = LoadFileWriter(str(tmp_path))
+        with pytest.raises(FileNotFoundError):
+            with writer.savepoint():
+                station_id = writer.add_station("composite", None, climatology_periods[0])
+                writer.add_station_history(station_id, 404, "base")
+                raise FileNotFoundError("no data file")
+        with writer.savepoint():
+            station_id = writer.add_station("long-record", None, climatology_periods[0])
+            writer.add_value(station_id, "Precip_Climatology", "01-Jan-1971", 10.5, 30)
+        writer.close()
+
+        assert station_id == 1
+        assert writer.rows == {"stations.tsv": 1, "station_histories.tsv": 0, "values.tsv": 1}
+        assert (tmp_path / "stations.tsv").read_text().startswith("1\tlong-record\t")
+
+    def test_setup_statements(self, tmp_path):
+        """Test that periods and variables are created by the script when requested."""
+        writer = LoadFileWriter(str(tmp_path))
+        writer.add_periods(climatology_periods)
+        writer.add_variables(climatological_variable_definitions)
+        writer.close()
+
+        script = (tmp_path / "load.sql").read_text()
+
+        assert script.count("INSERT INTO") == 4
+        assert "'1991-01-01" in script
+        assert "'T_mean_Climatology'" in script
+        assert script.count("WHERE NOT (EXISTS") == 2
+
+
+class TestLoadScriptDatabase:
+    """Load scripts run with psql against a real database."""
+
+    def load(self, engine, directory):
+        url = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        psql = testing.postgresql.find_program("psql", ["bin"])
+        subprocess.run([psql, "-q", "-d", url, "-f", "load.sql"], cwd=directory, check=True, capture_output=True)
+
+    def counts(self, engine):
+        with Session(engine) as session:
+            return [session.query(model).count() for model in [
+                ClimatologicalPeriod, ClimatologicalVariable, ClimatologicalStation, ClimatologicalStationXHistory, ClimatologicalValue
+            ]]
+
+    def test_loads_next_to_an_earlier_load(self, test_db_engine, tmp_path, monkeypatch):
+        """Test that a second load script, with its own station IDs, doesn't duplicate periods and variables."""
+        monkeypatch.setattr(main, "station_info_template", f"{test_data}/composite_station_info/{{0}}_composite_station_file.csv")
+        monkeypatch.setattr(main, "data_location_template", f"{test_data}/csv/{{0}}/{{1}}/{{2}}_{{0}}_{{1}}.csv")
+        for run, first_station_id in enumerate([1, 1000]):
+            writer = LoadFileWriter(str(tmp_path / str(run)), first_station_id=first_station_id)
+            main.main(writer=writer, variables=["ppt"])
+            writer.close()
+            self.load(test_db_engine, tmp_path / str(run))
+            if run == 0:
+                first = self.counts(test_db_engine)
+
+        assert first[:2] == [len(climatology_periods), len(climatological_variable_definitions)]
+        assert first[2] == writer.rows["stations.tsv"] > 0
+        assert self.counts(test_db_engine) == first[:2] + [2 * count for count in first[2:]]
+
+        # the same script again is refused by the station ID check and leaves the database as it was
+        with pytest.raises(subprocess.CalledProcessError):
+            self.load(test_db_engine, tmp_path / "1")
+        assert self.counts(test_db_engine) == first[:2] + [2 * count for count in first[2:]]
@@ -7,10 +7,7 @@ import sys
 from datetime import date
 import pytest
 import sqlalchemy as sa
-from sqlalchemy.orm import Session
-import testing.postgresql
 from pytest_alembic import MigrationContext
-from alembic.config import Config
 
 # Set test data directory BEFORE importing main (so basedir is set correctly)
 test_dir = os.path.join(os.path.dirname(__file__), 'data')
@@ -19,8 +16,7 @@ os.environ['CLIMO_DATA_DIR'] = test_dir + '/'
 # Add src to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-# Import db_setup from the parent module
-from tests.conftest import db_setup, alembic_config
+from tests.conftest import alembic_config
 from pycds import (
     ClimatologicalPeriod,
     ClimatologicalStation,
@@ -41,50 +37,6 @@ from main import (
 )
 
 
-@pytest.fixture(scope="function")
-def test_db_engine():
-    """Create a temporary PostgreSQL database for testing."""
-    with testing.postgresql.Postgresql() as pg:
-        engine = sa.create_engine(pg.url())
-        db_setup(engine)
-        
-        # Run Alembic migrations to create tables
-        import pycds
-        pycds_path = os.path.dirname(pycds.__file__)
-        alembic_dir = os.path.join(pycds_path, "alembic")
-        
-        config = Config()
-        config.set_main_option("script_location", alembic_dir)
-        config.set_main_option("sqlalchemy.url", pg.url())
-        
-        # Run migrations using alembic command
-        from alembic import command
-        command.upgrade(config, "head")
-        
-        # Set search_path so triggers can find hxtk_* functions
-        schema = get_schema_name()
-        with engine.begin() as conn:
-            conn.execute(sa.text(f"SET search_path TO {schema}, public"))
-        
-        # Seed history records from test data
-        from tests.conftest import seed_history_records
-        seed_history_records(engine)
-        
-        yield engine
-        engine.dispose()
-
-
-@pytest.fixture(scope="function")
-def test_session(test_db_engine):
-    """Create a database session for testing."""
-    session = Session(test_db_engine)
-    # Set search_path for this session so triggers can find hxtk_* functions
-    schema = get_schema_name()
-    session.execute(sa.text(f"SET search_path TO {schema}, public"))
-    yield session
-    session.close()
-
-
 @pytest.fixture(scope="function")
 def test_data_dir():
     """Return the test data directory path."""
@@ -0,0 +1,3 @@
+"""
+Test suite for locks.py module.
+"""
@@ -0,0 +1,120 @@
+"""
+Tests for the advisory locks coordinating concurrent imports.
+"""
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import main
+import locks
+from locks import advisory_lock, lock_key, setup_lock, variable_lock
+
+
+def executed(session):
+    return [str(call.args[0]) for call in session.execute.call_args_list]
+
+
+class TestAdvisoryLock:
+    """Test cases for advisory_lock."""
+
+    def test_keys(self):
+        """Test that lock keys are stable, distinct and fit PostgreSQL's int keys."""
+        keys = [lock_key(name) for name in [setup_lock] + [variable_lock(v) for v in main.var_map]]
+        assert len(set(keys)) == len(keys)
+        assert all(0 <= key < 2**31 for key in keys + [locks.lock_namespace])
+        assert lock_key(setup_lock) == lock_key("setup")
+
+    def test_free_lock(self):
+        """Test that a free lock is taken without waiting."""
+        session = MagicMock()
+        session.execute.return_value.scalar.return_value = True
+        advisory_lock(session, setup_lock)
+        assert executed(session) == ["SELECT pg_try_advisory_xact_lock(:namespace, :key)"]
+
+    def test_waits_for_held_lock(self):
+        """Test that a held lock is waited for."""
+        session = MagicMock()
+        session.execute.return_value.scalar.return_value = False
+        advisory_lock(session, variable_lock("ppt"))
+        assert executed(session)[1] == "SELECT pg_advisory_xact_lock(:namespace, :key)"
+        assert session.execute.call_args.args[1] == {"namespace": locks.lock_namespace, "key": lock_key("variable:ppt")}
+
+
+class TestMainLocks:
+    """Test cases for the locks taken by main."""
+
+    def test_lock_order(self):
+        """Test that setup is locked and committed on its own, then the variables are locked before their stations."""
+        calls = []
+        session = MagicMock()
+        session.commit.side_effect = lambda: calls.append("commit")
+
+        with patch('main.advisory_lock', side_effect=lambda s, name: calls.append(name)):
+            with patch('main.generate_climatological_periods', side_effect=lambda s: calls.append("periods")):
+                with patch('main.generate_climatological_variables'):
+                    with patch('main.generate_climatological_stations', side_effect=lambda s, v, *args: calls.append(v)):
+                        main.main(session=session, variables=["ppt", "tmax"], analyze=False)
+
+        assert calls == ["setup", "periods", "commit", "variable:ppt", "variable:tmax", "ppt", "tmax", "commit"]
+
+    def test_variable_locks_sorted(self):
+        """Test that the variable locks are taken in the same order whatever the order of the variables."""
+        with patch('main.advisory_lock') as mock_lock, patch('main.generate_climatological_stations'):
+            main.main(session=MagicMock(), variables=["tmin", "ppt", "tmax"], analyze=False, skip_setup=True)
+
+        assert [c.args[1] for c in mock_lock.call_args_list] == [variable_lock(v) for v in ["ppt", "tmax", "tmin"]]
+
+    def test_no_locks(self):
+        """Test that locks can be turned off, keeping the import in one transaction."""
+        session = MagicMock()
+        with patch('main.advisory_lock') as mock_lock:
+            with patch('main.generate_climatological_periods'), patch('main.generate_climatological_variables'):
+                with patch('main.generate_climatological_stations'):
+                    main.main(session=session, variables=["ppt"], analyze=False, locks=False)
+
+        mock_lock.assert_not_called()
+        session.commit.assert_called_once()
+        assert not main.parse_args(["--no-locks"]).locks
+
+    def test_dry_run_takes_no_locks(self, tmp_path):
+        """Test that writing load files doesn't need a database lock."""
+        writer = MagicMock()
+        with patch('main.advisory_lock') as mock_lock, patch('main.emit_climatological_stations'):
+            main.main(writer=writer, variables=["ppt"])
+        mock_lock.assert_not_called()
+
+
+class TestLocksDatabase:
+    """Advisory locks against a real database."""
+
+    def test_variable_locks_are_independent(self, test_db_engine):
+        """Test that different variables' locks don't block each other, and the same variable's does."""
+        with Session(test_db_engine) as first, Session(test_db_engine) as second:
+            advisory_lock(first, variable_lock("ppt"))
+            advisory_lock(second, variable_lock("tmax"))
+
+            params = {"namespace": locks.lock_namespace, "key": lock_key(variable_lock("ppt"))}
+            try_lock = sa.text("SELECT pg_try_advisory_xact_lock(:namespace, :key)")
+            assert second.execute(try_lock, params).scalar() is False
+
+            first.commit()
+            assert second.execute(try_lock, params).scalar() is True
+
+    def test_setup_is_idempotent(self, test_db_engine):
+        """Test that running setup twice doesn't duplicate periods or variables."""
+        for _ in range(2):
+            with Session(test_db_engine) as session:
+                advisory_lock(session, setup_lock)
+                main.generate_climatological_periods(session)
+                main.generate_climatological_variables(session)
+                session.commit()
+
+        with Session(test_db_engine) as session:
+            assert session.query(main.ClimatologicalPeriod).count() == len(main.climatology_periods)
+            assert session.query(main.ClimatologicalVariable).count() == len(main.climatological_variable_definitions)
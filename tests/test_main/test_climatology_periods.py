@@ -0,0 +1,80 @@
+"""
+Tests for the climatology period registry.
+"""
+import pytest
+from unittest.mock import patch, mock_open, MagicMock
+import sys
+import os
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import main
+from main import HistoryLine, PeriodDefinition, generate_climatological_stations
+
+
+@pytest.fixture
+def extra_period(monkeypatch):
+    """Register a 2001_2030 period alongside the standard ones."""
+    period = PeriodDefinition("2001_2030", "2001-01-01", "2030-12-31", "2001")
+    monkeypatch.setattr(main, "climatology_periods", main.climatology_periods + [period])
+    monkeypatch.setattr(main, "period_labels", main.period_labels + [period.label])
+    return period
+
+
+class TestClimatologyPeriods:
+    """Test cases for the period registry driving parsing and station generation."""
+
+    def test_registry_matches_standard_periods(self):
+        """Test the registry holds the three standard normals periods in order."""
+        assert main.period_labels == ["1971_2000", "1981_2010", "1991_2020"]
+        assert [p.column_prefix for p in main.climatology_periods] == ["1971", "1981", "1991"]
+
+    def test_history_line_keyed_by_label(self, sample_history_dict_complete):
+        """Test that per period values are available keyed by label."""
+        line = HistoryLine(sample_history_dict_complete)
+        assert line.monthlyyears["1981_2010"] == line.monthlyyears_1981
+        assert line.joint_stations["1991_2020"] == [301, 302, 303]
+        assert line.has_data == {"1971_2000": True, "1981_2010": True, "1991_2020": True}
+
+    def test_new_period_is_a_data_change(self, extra_period, sample_history_dict_complete):
+        """Test that registering a new period is enough to parse and import it."""
+        row = {
+            **sample_history_dict_complete,
+            **{f'monthlyyears_2001_{i}': '28' for i in range(1, 13)},
+            **{f'joint_stations_2001_{i}': '' for i in range(1, 4)},
+        }
+        line = HistoryLine(row)
+        assert line.has_data["2001_2030"] is True
+        assert line.joint_stations["2001_2030"] == [None, None, None]
+
+        header = list(row.keys())
+        csv_content = ",".join(header) + "\n" + ",".join(row[k] for k in header) + "\n"
+
+        with patch("builtins.open", mock_open(read_data=csv_content)):
+            with patch('main.get_period_id_by_dates', return_value=1):
+                with patch('main.generate_station') as mock_gen_station:
+                    with patch('main.insert_station_links', return_value=0):
+                        with patch('main.generate_value_data', return_value=12) as mock_gen_value:
+                            mock_station = MagicMock()
+                            mock_station.id = 42
+                            mock_gen_station.return_value = mock_station
+
+                            generate_climatological_stations(MagicMock(), "ppt")
+
+                            assert mock_gen_station.call_count == 4
+                            assert mock_gen_value.call_args_list[-1][0][2] == "2001_2030"
+
+    def test_station_generation_does_not_query_periods_per_row(self, mock_session, sample_history_dict_complete):
+        """Test that joint stations are passed through instead of looked up by period per row."""
+        header = list(sample_history_dict_complete.keys())
+        csv_content = ",".join(header) + "\n" + ",".join(sample_history_dict_complete[k] for k in header) + "\n"
+
+        with patch("builtins.open", mock_open(read_data=csv_content)):
+            with patch('main.get_period_id_by_dates', return_value=1):
+                with patch('main.get_joint_stations_for_period') as mock_lookup:
+                    with patch('main.ClimatologicalStation'), patch('main.insert_station_links', return_value=0):
+                        with patch('main.generate_value_data', return_value=12):
+                            generate_climatological_stations(mock_session, "ppt")
+
+                            mock_lookup.assert_not_called()
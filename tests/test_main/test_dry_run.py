@@ -0,0 +1,72 @@
+"""
+Tests for the offline --dry-run --emit mode.
+"""
+import pytest
+import sys
+import os
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import main
+from emit import LoadFileWriter
+from main import ImportFilter, parse_args
+from metrics import ImportMetrics
+
+test_data = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+
+@pytest.fixture
+def test_data_dir(monkeypatch):
+    """Point main at the bundled test data."""
+    monkeypatch.setattr(main, "station_info_template", f"{test_data}/composite_station_info/{{0}}_composite_station_file.csv")
+    monkeypatch.setattr(main, "data_location_template", f"{test_data}/csv/{{0}}/{{1}}/{{2}}_{{0}}_{{1}}.csv")
+    return test_data
+
+
+class TestDryRun:
+    """Test cases for running main() with a LoadFileWriter instead of a session."""
+
+    def test_no_session_needed(self, test_data_dir, tmp_path):
+        """Test the whole pipeline writes load files without a database."""
+        writer = LoadFileWriter(str(tmp_path), first_station_id=1000)
+        metrics = ImportMetrics()
+
+        main.main(variables=["ppt"], metrics=metrics, writer=writer)
+
+        stations = (tmp_path / "stations.tsv").read_text().splitlines()
+        values = (tmp_path / "values.tsv").read_text().splitlines()
+        links = (tmp_path / "station_histories.tsv").read_text().splitlines()
+        assert len(stations) > 0
+        assert stations[0].startswith("1000\t")
+        assert len(values) == 12 * len(stations)
+        assert sum(link.endswith("\tbase") for link in links) == len(stations)
+        assert metrics.rows_inserted["climatological_station"] == len(stations)
+        assert metrics.success
+        assert "INSERT INTO" in (tmp_path / "load.sql").read_text()
+
+    def test_matches_filter(self, test_data_dir, tmp_path):
+        """Test that the subset options apply to the emitted files."""
+        writer = LoadFileWriter(str(tmp_path))
+
+        main.main(variables=["ppt"], import_filter=ImportFilter(periods=["1991_2020"]), skip_setup=True, writer=writer)
+
+        stations = (tmp_path / "stations.tsv").read_text().splitlines()
+        assert all(line.endswith("\t1991-01-01\t2020-12-31") for line in stations)
+        assert "INSERT INTO" not in (tmp_path / "load.sql").read_text().split("DO $$")[0]
+
+    def test_requires_session_or_writer(self):
+        """Test that main still refuses to run with neither."""
+        with pytest.raises(ValueError):
+            main.main(variables=["ppt"])
+
+    @pytest.mark.parametrize("argv", [["--dry-run"], ["--emit", "out"]])
+    def test_dry_run_and_emit_together(self, argv):
+        """Test that --dry-run and --emit must be given together."""
+        with pytest.raises(SystemExit):
+            parse_args(argv)
+
+    def test_parse_args(self):
+        """Test the dry run options."""
+        args = parse_args(["--dry-run", "--emit", "out", "--first-station-id", "5000"])
+        assert (args.dry_run, args.emit, args.first_station_id) == (True, "out", 5000)
@@ -29,7 +29,7 @@ class TestGenerateClimatologicalStations:
         
         with patch("builtins.open", mock_open(read_data=csv_content)):
             with patch('main.generate_station') as mock_gen_station:
-                with patch('main.generate_station_histories'):
+                with patch('main.insert_station_links'):
                     with patch('main.generate_value_data'):
                         mock_station = MagicMock()
                         mock_station.id = 42
@@ -54,7 +54,7 @@ class TestGenerateClimatologicalStations:
         
         with patch("builtins.open", mock_open(read_data=csv_content)):
             with patch('main.generate_station') as mock_gen_station:
-                with patch('main.generate_station_histories'):
+                with patch('main.insert_station_links'):
                     with patch('main.generate_value_data'):
                         mock_station = MagicMock()
                         mock_station.id = 42
@@ -80,7 +80,7 @@ class TestGenerateClimatologicalStations:
         
         with patch("builtins.open", mock_open(read_data=csv_content)):
             with patch('main.generate_station') as mock_gen_station:
-                with patch('main.generate_station_histories'):
+                with patch('main.insert_station_links'):
                     with patch('main.generate_value_data') as mock_gen_value:
                         mock_station = MagicMock()
                         mock_station.id = 42
@@ -91,3 +91,36 @@ class TestGenerateClimatologicalStations:
                         # Check that generate_value_data was called with correct variable
                         for call_args in mock_gen_value.call_args_list:
                             assert call_args[0][1] == variable
+
+
+class TestBatchedSession:
+    """Test cases for the constant-memory batch size."""
+
+    def test_expunges_every_batch(self, mock_session, sample_history_dict_complete):
+        """Test that the session is flushed and emptied every batch_size history lines."""
+        rows = [{**sample_history_dict_complete, "history_id": str(i)} for i in range(1, 8)]
+        header = list(sample_history_dict_complete.keys())
+        csv_content = ",".join(header) + "\n" + "".join(",".join(row[k] for k in header) + "\n" for row in rows)
+
+        with patch("builtins.open", mock_open(read_data=csv_content)):
+            with patch('main.get_period_id_by_dates', return_value=1):
+                with patch('main.ClimatologicalStation'), patch('main.insert_station_links', return_value=0) as mock_links:
+                    with patch('main.generate_value_data', return_value=12):
+                        generate_climatological_stations(mock_session, "ppt", batch_size=3)
+
+        assert mock_session.expunge_all.call_count == 2
+        # two full batches and the remainder, three periods per history line
+        assert [len(c[0][1]) for c in mock_links.call_args_list] == [9, 9, 3]
+
+    def test_no_expunge_by_default(self, mock_session, sample_history_dict_complete):
+        """Test that the session keeps its objects without a batch size."""
+        header = list(sample_history_dict_complete.keys())
+        csv_content = ",".join(header) + "\n" + ",".join(sample_history_dict_complete[k] for k in header) + "\n"
+
+        with patch("builtins.open", mock_open(read_data=csv_content)):
+            with patch('main.get_period_id_by_dates', return_value=1):
+                with patch('main.ClimatologicalStation'), patch('main.insert_station_links', return_value=0):
+                    with patch('main.generate_value_data', return_value=12):
+                        generate_climatological_stations(mock_session, "ppt")
+
+        mock_session.expunge_all.assert_not_called()
@@ -2,7 +2,8 @@
 Tests for generate_climatological_periods function.
 """
 import pytest
-from unittest.mock import patch
+from datetime import datetime
+from unittest.mock import patch, MagicMock
 import sys
 import os
 
@@ -42,3 +43,12 @@ class TestGenerateClimatologicalPeriods:
                 call[1] == {'start_date': '1991-01-01', 'end_date': '2020-12-31'}
                 for call in calls
             )
+
+    def test_skips_existing_periods(self, mock_session):
+        """Test that periods already in the database aren't created again."""
+        existing = MagicMock(start_date=datetime(1971, 1, 1), end_date=datetime(2000, 12, 31))
+        mock_session.query.return_value = [existing]
+        with patch('main.ClimatologicalPeriod') as mock_period_class:
+            generate_climatological_periods(mock_session)
+
+            assert [call[1]['start_date'] for call in mock_period_class.call_args_list] == ['1981-01-01', '1991-01-01']
@@ -9,7 +9,7 @@ import os
 # Add src to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
 
-from main import generate_station_histories
+from main import StationLinkBatch, build_link_rows, duplicate_histories, generate_station_histories, insert_station_links
 
 
 class TestGenerateStationHistories:
@@ -56,3 +56,51 @@ class TestGenerateStationHistories:
             # Should only create 2 records (skipping None)
             assert mock_history_class.call_count == 2
             assert mock_session.add.call_count == 2
+
+
+class TestInsertStationLinks:
+    """Test cases for the batched link writer."""
+
+    def test_build_link_rows_drops_empty_joint_slots(self):
+        """Test that base links come first and empty joint slots are dropped."""
+        rows = build_link_rows([1, 2], [404, 405], [[101, None, 103], [None, None, None]])
+
+        assert rows == [
+            {"climo_station_id": 1, "history_id": 404, "role": "base"},
+            {"climo_station_id": 2, "history_id": 405, "role": "base"},
+            {"climo_station_id": 1, "history_id": 101, "role": "joint"},
+            {"climo_station_id": 1, "history_id": 103, "role": "joint"},
+        ]
+
+    def test_one_statement_per_batch(self, mock_session):
+        """Test that a whole batch of links is inserted with a single statement."""
+        count = insert_station_links(mock_session, list(range(100)), list(range(1000, 1100)), [[1, 2, None]] * 100)
+
+        assert count == 300
+        assert mock_session.execute.call_count == 1
+        mock_session.add.assert_not_called()
+
+    def test_split_past_parameter_limit(self, mock_session):
+        """Test that very large batches are split to stay under the bind parameter limit."""
+        with patch('main.max_links_per_statement', 50):
+            insert_station_links(mock_session, list(range(60)), list(range(60)), [[1, None, None]] * 60)
+
+        assert mock_session.execute.call_count == 3
+
+    def test_batch_resets_after_write(self, mock_session):
+        """Test that StationLinkBatch writes what it collected once."""
+        batch = StationLinkBatch()
+        batch.add(1, 404, [101, None, None])
+
+        assert batch.write(mock_session) == 2
+        assert batch.write(mock_session) == 0
+        assert mock_session.execute.call_count == 1
+
+    @pytest.mark.parametrize("history_id,joint_stations,expected", [
+        (404, [101, None, 103], []),
+        (404, [101, 101, None], [101]),
+        (404, [404, None, None], [404]),
+    ])
+    def test_duplicate_histories(self, history_id, joint_stations, expected):
+        """Test that joint stations repeated or equal to the base history are found."""
+        assert duplicate_histories(history_id, joint_stations) == expected
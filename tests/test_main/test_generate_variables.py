@@ -2,7 +2,7 @@
 Tests for generate_climatological_variables function.
 """
 import pytest
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 import sys
 import os
 
@@ -48,3 +48,11 @@ class TestGenerateClimatologicalVariables:
                 }
                 for call in calls
             )
+
+    def test_skips_existing_variables(self, mock_session):
+        """Test that variables already in the database aren't created again."""
+        mock_session.query.return_value = [MagicMock(net_var_name="Precip_Climatology"), MagicMock(net_var_name="T_mean_Climatology")]
+        with patch('main.ClimatologicalVariable') as mock_var_class:
+            generate_climatological_variables(mock_session)
+
+            assert [call[1]['net_var_name'] for call in mock_var_class.call_args_list] == ["Tx_Climatology", "Tn_Climatology"]
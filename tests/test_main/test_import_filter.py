@@ -0,0 +1,88 @@
+"""
+Tests for ImportFilter and subset imports.
+"""
+import pytest
+from unittest.mock import patch, mock_open, MagicMock
+import sys
+import os
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from main import ImportFilter, generate_climatological_stations, parse_history_id_spec
+
+
+def composite_csv(*rows):
+    header = ["history_id", "lat", "lon", "elev", "basin"]
+    for period in ["1971", "1981", "1991"]:
+        header += [f"monthlyyears_{period}_{i}" for i in range(1, 13)]
+        header += [f"joint_stations_{period}_{i}" for i in range(1, 4)]
+    return ",".join(header) + "\n" + "".join(",".join(row[k] for k in header) + "\n" for row in rows)
+
+
+class TestImportFilter:
+    """Test cases for the ImportFilter class."""
+
+    def test_default_includes_everything(self):
+        """Test that the default filter includes every period and history."""
+        import_filter = ImportFilter()
+        assert import_filter.includes_period("1971_2000")
+        assert import_filter.includes_history(404)
+
+    @pytest.mark.parametrize("history_id,expected", [
+        (404, True),
+        (405, False),
+        (11000, True),
+        (11500, True),
+        (12000, False),
+    ])
+    def test_history_ids_and_ranges(self, history_id, expected):
+        """Test explicit history IDs and inclusive ranges."""
+        import_filter = ImportFilter(history_ids={404}, history_ranges=[(11000, 11999)])
+        assert import_filter.includes_history(history_id) == expected
+
+    def test_periods(self):
+        """Test that only the given periods are included."""
+        import_filter = ImportFilter(periods=["1991_2020"])
+        assert import_filter.includes_period("1991_2020")
+        assert not import_filter.includes_period("1971_2000")
+
+    def test_sample_is_deterministic(self):
+        """Test that sampling picks roughly the fraction asked for, the same way each time."""
+        first = [h for h in range(10000) if ImportFilter(sample_fraction=0.1, seed=3).includes_history(h)]
+        second = [h for h in range(10000) if ImportFilter(sample_fraction=0.1, seed=3).includes_history(h)]
+        assert first == second
+        assert 800 < len(first) < 1200
+
+    @pytest.mark.parametrize("kwargs", [
+        {"periods": ["2001_2030"]},
+        {"sample_fraction": 0},
+        {"sample_fraction": 1.5},
+    ])
+    def test_rejects_invalid(self, kwargs):
+        """Test that unknown periods and out of range fractions are rejected."""
+        with pytest.raises(ValueError):
+            ImportFilter(**kwargs)
+
+    def test_parse_history_id_spec(self):
+        """Test parsing a list of history IDs and ranges."""
+        assert parse_history_id_spec("404, 406,11000-11999,") == ({404, 406}, [(11000, 11999)])
+
+    def test_generate_stations_honours_filter(self, mock_session, sample_history_dict_complete, sample_history_dict_partial):
+        """Test that only matching histories and periods are written."""
+        csv_content = composite_csv(sample_history_dict_complete, sample_history_dict_partial)
+        import_filter = ImportFilter(periods=["1971_2000", "1981_2010"], history_ids={12345})
+
+        with patch("builtins.open", mock_open(read_data=csv_content)):
+            with patch('main.generate_station') as mock_gen_station:
+                with patch('main.insert_station_links', return_value=0):
+                    with patch('main.generate_value_data', return_value=12) as mock_gen_value:
+                        mock_station = MagicMock()
+                        mock_station.id = 42
+                        mock_gen_station.return_value = mock_station
+
+                        generate_climatological_stations(mock_session, "ppt", import_filter=import_filter)
+
+                        assert mock_gen_station.call_count == 2
+                        assert [c[0][2] for c in mock_gen_value.call_args_list] == ["1971_2000", "1981_2010"]
+                        assert all(c[0][4] == "12345" for c in mock_gen_value.call_args_list)
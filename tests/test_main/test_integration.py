@@ -9,7 +9,7 @@ import os
 # Add src to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
 
-from main import generate_climatological_stations
+from main import build_link_rows, generate_climatological_stations
 
 
 class TestIntegrationWithMocks:
@@ -88,7 +88,7 @@ class TestIntegrationWithMocks:
         
         with patch("builtins.open", side_effect=mock_open_multi):
             with patch('main.ClimatologicalStation') as mock_station_class:
-                with patch('main.ClimatologicalStationXHistory') as mock_history_class:
+                with patch('main.insert_station_links', return_value=12) as mock_links:
                     with patch('main.ClimatologicalValue') as mock_value_class:
                         mock_station = MagicMock()
                         mock_station.id = 42
@@ -99,9 +99,10 @@ class TestIntegrationWithMocks:
                         # Verify station was created 3 times (once per period)
                         assert mock_station_class.call_count == 3
                         
-                        # Verify histories were created:
+                        # Verify histories were inserted together:
                         # 3 base histories (1 per period) + 9 joint histories (3 joint × 3 periods)
-                        assert mock_history_class.call_count == 12
+                        mock_links.assert_called_once()
+                        assert len(build_link_rows(*mock_links.call_args[0][1:])) == 12
                         
                         # Verify values were created
                         assert mock_value_class.call_count >= 3  # At least one per period
@@ -0,0 +1,55 @@
+"""
+Tests for the profiling entry point and command line parsing.
+"""
+import pytest
+from unittest.mock import patch
+import sys
+import os
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from main import main, parse_args, profile_main
+
+
+class TestProfileMain:
+    """Test cases for profile_main and parse_args."""
+
+    def test_writes_profile_and_summary(self, mock_session, tmp_path):
+        """Test that a .prof file and a text summary are written."""
+        output = str(tmp_path / "import")
+
+        with patch('main.main') as mock_main:
+            profile_main(mock_session, output, variables=["tmax"])
+
+            mock_main.assert_called_once_with(session=mock_session, variables=["tmax"])
+
+        assert os.path.exists(f"{output}.prof")
+        assert "cumulative" in open(f"{output}.txt").read()
+
+    def test_writes_profile_on_failure(self, mock_session, tmp_path):
+        """Test that the profile is still written when the import fails."""
+        output = str(tmp_path / "import")
+
+        with patch('main.main', side_effect=ValueError("boom")):
+            with pytest.raises(ValueError):
+                profile_main(mock_session, output)
+
+        assert os.path.exists(f"{output}.prof")
+
+    @pytest.mark.parametrize("argv,profile,variables", [
+        ([], None, None),
+        (["--profile", "out"], "out", None),
+        (["--profile", "out", "--variable", "tmin"], "out", ["tmin"]),
+        (["--variable", "ppt", "--variable", "tmax"], None, ["ppt", "tmax"]),
+    ])
+    def test_parse_args(self, argv, profile, variables):
+        """Test command line parsing of the profile and variable options."""
+        args = parse_args(argv)
+        assert args.profile == profile
+        assert args.variables == variables
+
+    def test_rejects_unknown_variable(self, mock_session):
+        """Test that main rejects variables it does not know about."""
+        with pytest.raises(ValueError):
+            main(session=mock_session, variables=["snow"])
@@ -0,0 +1,85 @@
+"""
+Tests for sharing climatological stations across variables.
+"""
+import pytest
+from unittest.mock import patch, mock_open, MagicMock
+import sys
+import os
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import main
+from main import HistoryLine, generate_climatological_stations, shared_station_key
+from metrics import ImportMetrics
+
+
+def composite_csv(row):
+    header = list(row.keys())
+    return ",".join(header) + "\n" + ",".join(row[k] for k in header) + "\n"
+
+
+class TestSharedStations:
+    """Test cases for shared stations."""
+
+    def test_key_ignores_joint_order(self, sample_history_dict_complete):
+        """Test that the same set of joint stations gives the same key."""
+        line = HistoryLine(sample_history_dict_complete)
+        reordered = HistoryLine({**sample_history_dict_complete, "joint_stations_1971_1": "103", "joint_stations_1971_3": "101"})
+
+        assert shared_station_key(line, "1971_2000") == (12345, "1971_2000", (101, 102, 103))
+        assert shared_station_key(line, "1971_2000") == shared_station_key(reordered, "1971_2000")
+        assert shared_station_key(line, "1971_2000") != shared_station_key(line, "1981_2010")
+
+    def test_different_joint_stations_not_shared(self, sample_history_dict_complete):
+        """Test that a different joint set makes a different station."""
+        line = HistoryLine(sample_history_dict_complete)
+        other = HistoryLine({**sample_history_dict_complete, "joint_stations_1971_3": ""})
+
+        assert shared_station_key(line, "1971_2000") != shared_station_key(other, "1971_2000")
+
+    def test_second_variable_reuses_stations(self, mock_session, sample_history_dict_complete):
+        """Test that a second variable only adds values to the stations of the first."""
+        shared = {}
+        metrics = ImportMetrics()
+
+        with patch("builtins.open", mock_open(read_data=composite_csv(sample_history_dict_complete))):
+            with patch('main.get_period_id_by_dates', return_value=1):
+                with patch('main.generate_station') as mock_gen_station:
+                    with patch('main.insert_station_links', return_value=12) as mock_links:
+                        with patch('main.generate_value_data', return_value=12) as mock_gen_value:
+                            mock_gen_station.side_effect = [MagicMock(id=i) for i in (1, 2, 3)]
+
+                            generate_climatological_stations(mock_session, "tmax", metrics, shared_stations=shared)
+                            generate_climatological_stations(mock_session, "tmin", metrics, shared_stations=shared)
+
+                            assert mock_gen_station.call_count == 3
+                            assert [c[0][1] for c in mock_links.call_args_list] == [[1, 2, 3]]
+                            assert [c[0][3] for c in mock_gen_value.call_args_list] == [1, 2, 3, 1, 2, 3]
+                            assert [c[0][1] for c in mock_gen_value.call_args_list] == ["tmax"] * 3 + ["tmin"] * 3
+
+        assert metrics.rows_inserted["climatological_station"] == 3
+        assert metrics.rows_inserted["climo_stn_x_hist"] == 3 * 4
+        assert metrics.rows_inserted["climatological_value"] == 6 * 12
+        assert metrics.stations[("tmax", "1971_2000")] == 1
+        assert ("tmin", "1971_2000") not in metrics.stations
+        assert metrics.stations_reused[("tmin", "1971_2000")] == 1
+
+    def test_main_shares_across_variables(self, mock_session):
+        """Test that main passes one station map to every variable."""
+        with patch('main.generate_climatological_periods'), patch('main.generate_climatological_variables'):
+            with patch('main.generate_climatological_stations') as mock_gen:
+                main.main(session=mock_session, shared_stations=True)
+
+                maps = [c[0][6] for c in mock_gen.call_args_list]
+                assert len(maps) == 3
+                assert all(m is maps[0] for m in maps)
+                assert maps[0] == {}
+
+    def test_not_shared_by_default(self, mock_session):
+        """Test that each variable gets its own stations unless asked."""
+        with patch('main.generate_climatological_periods'), patch('main.generate_climatological_variables'):
+            with patch('main.generate_climatological_stations') as mock_gen:
+                main.main(session=mock_session)
+
+                assert all(c[0][6] is None for c in mock_gen.call_args_list)
@@ -0,0 +1,94 @@
+"""
+Tests for the ImportMetrics class and Prometheus textfile output.
+"""
+import pytest
+import sys
+import os
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from metrics import ImportMetrics, read_last_success, read_throughput
+
+
+class TestImportMetrics:
+    """Test cases for the ImportMetrics class."""
+
+    def test_record_station(self):
+        """Test that a station updates row, station and file counters."""
+        metrics = ImportMetrics()
+        metrics.record_station("ppt", "1971_2000", links=4, values=12)
+        metrics.record_station("ppt", "1971_2000", links=1, values=12)
+
+        assert metrics.stations[("ppt", "1971_2000")] == 2
+        assert metrics.rows_inserted["climatological_station"] == 2
+        assert metrics.rows_inserted["climo_stn_x_hist"] == 5
+        assert metrics.rows_inserted["climatological_value"] == 24
+        assert metrics.files_read["ppt"] == 2
+
+    def test_record_reused_station(self):
+        """Test that values added to a shared station count it as reused, not created."""
+        metrics = ImportMetrics()
+        metrics.record_station("tmax", "1971_2000", links=2, values=12)
+        metrics.record_station("tmin", "1971_2000", links=0, values=12, created=False)
+
+        assert metrics.stations == {("tmax", "1971_2000"): 1}
+        assert metrics.stations_reused == {("tmin", "1971_2000"): 1}
+        assert metrics.rows_inserted["climatological_station"] == 1
+        assert metrics.rows_inserted["climatological_value"] == 24
+        assert 'climo_import_stations_reused{variable="tmin",period="1971_2000"} 1' in metrics.to_textfile()
+
+    def test_phase_recorded_on_failure(self):
+        """Test that a failing phase still records its duration."""
+        metrics = ImportMetrics()
+        with pytest.raises(ValueError):
+            with metrics.phase("setup"):
+                raise ValueError("boom")
+
+        assert "setup" in metrics.phase_durations
+
+    def test_textfile_format(self):
+        """Test the Prometheus text exposition output."""
+        metrics = ImportMetrics()
+        metrics.record_station("tmax", "1991_2020", links=1, values=12)
+        metrics.record_missing_file("tmin")
+        metrics.mark_success()
+
+        text = metrics.to_textfile()
+
+        assert "# TYPE climo_import_rows_inserted gauge" in text
+        assert 'climo_import_rows_inserted{table="climatological_value"} 12' in text
+        assert 'climo_import_stations{variable="tmax",period="1991_2020"} 1' in text
+        assert 'climo_import_files_missing{variable="tmin"} 1' in text
+        assert "climo_import_success 1" in text
+        assert "climo_import_last_success_timestamp_seconds " in text
+
+    def test_failed_run_keeps_last_success(self, tmp_path):
+        """Test that a failed run preserves the previous last success timestamp."""
+        path = str(tmp_path / "climo_import.prom")
+
+        succeeded = ImportMetrics()
+        succeeded.mark_success()
+        succeeded.write_textfile(path)
+
+        failed = ImportMetrics()
+        failed.write_textfile(path)
+
+        assert read_last_success(path) == round(succeeded.last_success, 3)
+        assert "climo_import_success 0" in open(path).read()
+        assert not [f for f in os.listdir(tmp_path) if f.endswith(".tmp")]
+
+    def test_read_throughput(self, tmp_path):
+        """Test that rows per second are read back from a successful run only."""
+        path = str(tmp_path / "climo_import.prom")
+        assert read_throughput(path) is None
+
+        metrics = ImportMetrics()
+        metrics.record_station("ppt", "1971_2000", links=3, values=12)
+        metrics.phase_durations = {"setup": 1.0, "ppt": 3.0}
+        metrics.write_textfile(path)
+        assert read_throughput(path) is None
+
+        metrics.mark_success()
+        metrics.write_textfile(path)
+        assert read_throughput(path) == pytest.approx(16 / 4.0)
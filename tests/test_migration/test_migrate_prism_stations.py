@@ -0,0 +1,45 @@
+"""
+Tests for the set-based prism station migration.
+"""
+import pytest
+from unittest.mock import MagicMock
+import sys
+import os
+from sqlalchemy.dialects import postgresql
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from migration import build_prism_station_insert, migrate_prism_stations
+
+
+class TestMigratePrismStations:
+    """Test cases for build_prism_station_insert and migrate_prism_stations."""
+
+    def test_single_statement(self):
+        """Test that stations and links are created by one INSERT ... SELECT statement."""
+        sql = str(build_prism_station_insert(1).compile(dialect=postgresql.dialect()))
+
+        assert sql.count("INSERT INTO") == 2
+        assert sql.lstrip().startswith("WITH")
+        assert "nextval(pg_get_serial_sequence(" in sql
+        assert "NOT (EXISTS" in sql
+
+    def test_period_bound(self):
+        """Test that the period is bound into both the station insert and the rerun guard."""
+        compiled = build_prism_station_insert(7).compile(dialect=postgresql.dialect())
+
+        assert list(compiled.params.values()).count(7) == 2
+        assert "prism" in compiled.params.values()
+        assert "base" in compiled.params.values()
+
+    @pytest.mark.parametrize("rowcount", [0, 1, 2500])
+    def test_returns_counts(self, rowcount):
+        """Test that the statement row count is reported for stations and links."""
+        session = MagicMock()
+        session.execute.return_value.rowcount = rowcount
+
+        counts = migrate_prism_stations(session, 1)
+
+        assert session.execute.call_count == 1
+        assert counts == {"stations": rowcount, "links": rowcount}
@@ -0,0 +1,67 @@
+"""
+Tests for the chunked obs_raw climatology value migration.
+"""
+import pytest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+from sqlalchemy.dialects import postgresql
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from migration import build_value_insert, migrate_pcic_climatology_values, stream_history_id_chunks
+
+
+class TestMigratePcicClimatologyValues:
+    """Test cases for build_value_insert and migrate_pcic_climatology_values."""
+
+    def test_insert_select_maps_variables_in_sql(self):
+        """Test that values are copied server-side with variables mapped by name."""
+        compiled = build_value_insert(1, 100, 200).compile(dialect=postgresql.dialect())
+        sql = str(compiled)
+
+        assert sql.startswith("INSERT INTO")
+        assert "SELECT" in sql
+        assert "BETWEEN" in sql
+        assert "NOT (EXISTS" in sql
+        assert 100 in compiled.params.values()
+        assert 200 in compiled.params.values()
+
+    @pytest.mark.parametrize("chunks", [
+        [],
+        [[1, 2, 3]],
+        [[1, 2], [3, 4], [5]],
+    ])
+    def test_commits_each_chunk(self, chunks):
+        """Test that one statement is run and committed per chunk of histories."""
+        session = MagicMock()
+        session.execute.return_value.rowcount = 12
+
+        with patch('migration.stream_history_id_chunks', return_value=iter(chunks)):
+            with patch('migration.build_value_insert') as mock_build:
+                result = migrate_pcic_climatology_values(session, 1, chunk_size=2)
+
+        assert session.execute.call_count == len(chunks)
+        assert session.commit.call_count == len(chunks)
+        assert result["values"] == 12 * len(chunks)
+        for chunk in chunks:
+            mock_build.assert_any_call(1, chunk[0], chunk[-1])
+
+
+class TestStreamHistoryIdChunks:
+    """Test cases for stream_history_id_chunks."""
+
+    def test_streams_with_server_side_cursor(self):
+        """Test that the query runs with stream_results on its own connection."""
+        session = MagicMock()
+        conn = session.get_bind.return_value.connect.return_value.__enter__.return_value
+        streaming = conn.execution_options.return_value
+        streaming.execute.return_value.scalars.return_value.partitions.return_value = iter([[1, 2], [3]])
+
+        chunks = list(stream_history_id_chunks(session, "query", chunk_size=2, fetch_size=50))
+
+        assert chunks == [[1, 2], [3]]
+        conn.execution_options.assert_called_once_with(stream_results=True, yield_per=50)
+        streaming.execute.return_value.scalars.return_value.partitions.assert_called_once_with(2)
+        session.execute.assert_not_called()
@@ -0,0 +1,111 @@
+"""
+Tests for the prism station and obs_raw value migrations against a real database.
+"""
+import pytest
+import sys
+import os
+from datetime import datetime
+import sqlalchemy as sa
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import main
+from migration import migrate_pcic_climatology_values, migrate_prism_stations, prism_station_history_query, prism_station_type, stream_history_id_chunks
+from pycds import ClimatologicalStation, ClimatologicalStationXHistory, ClimatologicalValue, ClimoObsCount, Network, Obs, Variable
+
+# network variables holding PCIC climatologies, mapped to climatological variables by name
+climatology_variables = ["Precip_Climatology", "Tx_Climatology"]
+
+
+def counts(session):
+    return tuple(session.query(model).count() for model in [ClimatologicalStation, ClimatologicalStationXHistory, ClimatologicalValue])
+
+
+@pytest.fixture
+def obs_raw_climatologies(test_session):
+    """Monthly climatologies in obs_raw for three histories, plus a history with only daily obs.
+
+    Returns the histories with climatologies and the 1971-2000 period ID.
+    """
+    main.generate_climatological_periods(test_session)
+    main.generate_climatological_variables(test_session)
+    network_id = test_session.query(Network.id).scalar()
+    history_ids = [line.history_id for line in main.read_station_info_file("ppt")[:4]]
+
+    variables = [
+        Variable(name=name, unit="mm" if name.startswith("Precip") else "celsius", precision=0.1,
+                 standard_name="air_temperature", cell_method="time: mean within days time: mean over days",
+                 description=name, display_name=name, short_name=name, network_id=network_id)
+        for name in climatology_variables
+    ]
+    daily = Variable(name="MAX_TEMP", unit="celsius", precision=0.1, standard_name="air_temperature",
+                     cell_method="time: maximum", description="Daily maximum", display_name="Daily maximum",
+                     short_name="tasmax", network_id=network_id)
+    test_session.add_all(variables + [daily])
+    test_session.flush()
+
+    for history_id in history_ids[:3]:
+        for variable in variables:
+            test_session.add_all(
+                Obs(history_id=history_id, vars_id=variable.id, time=datetime(1985, month, 15), datum=float(month))
+                for month in range(1, 13)
+            )
+    test_session.add_all(
+        Obs(history_id=history_ids[3], vars_id=daily.id, time=datetime(1985, 1, day), datum=float(day)) for day in range(1, 11)
+    )
+    test_session.commit()
+    test_session.execute(sa.text(f"REFRESH MATERIALIZED VIEW {ClimoObsCount.__table__.fullname}"))
+    test_session.commit()
+
+    return history_ids[:3], main.get_period_id_by_dates(test_session, "1971-01-01", "2000-12-31")
+
+
+class TestMigrationDatabase:
+    """The migrations run against real tables."""
+
+    def test_prism_stations(self, test_session, obs_raw_climatologies):
+        """Test that each history with climatologies gets one prism station and base link, once."""
+        history_ids, period_id = obs_raw_climatologies
+
+        created = migrate_prism_stations(test_session, period_id)
+        test_session.commit()
+
+        assert created == {"stations": 3, "links": 3}
+        stations = test_session.query(ClimatologicalStation).filter(ClimatologicalStation.type == prism_station_type).all()
+        assert len(stations) == 3
+        assert {station.climo_period_id for station in stations} == {period_id}
+        links = test_session.query(ClimatologicalStationXHistory).all()
+        assert sorted(link.history_id for link in links) == sorted(history_ids)
+        assert {link.role for link in links} == {"base"}
+        assert {link.climo_station_id for link in links} == {station.id for station in stations}
+
+        assert migrate_prism_stations(test_session, period_id) == {"stations": 0, "links": 0}
+        test_session.commit()
+        assert counts(test_session) == (3, 3, 0)
+
+    def test_values(self, test_session, obs_raw_climatologies):
+        """Test that the obs_raw climatologies are copied onto the prism stations, once."""
+        history_ids, period_id = obs_raw_climatologies
+        migrate_prism_stations(test_session, period_id)
+        test_session.commit()
+
+        result = migrate_pcic_climatology_values(test_session, period_id, chunk_size=2, fetch_size=1)
+
+        assert result["values"] == len(history_ids) * len(climatology_variables) * 12
+        assert counts(test_session) == (3, 3, result["values"])
+        value_times = {value.value_time for value in test_session.query(ClimatologicalValue)}
+        assert len(value_times) == 12
+
+        assert migrate_pcic_climatology_values(test_session, period_id, chunk_size=2)["values"] == 0
+        assert counts(test_session) == (3, 3, result["values"])
+
+    def test_stream_history_id_chunks(self, test_session, obs_raw_climatologies):
+        """Test that the server-side cursor yields every prism station history, in sorted chunks."""
+        history_ids, period_id = obs_raw_climatologies
+        migrate_prism_stations(test_session, period_id)
+        test_session.commit()
+
+        chunks = list(stream_history_id_chunks(test_session, prism_station_history_query(period_id), chunk_size=2, fetch_size=1))
+
+        assert chunks == [sorted(history_ids)[:2], sorted(history_ids)[2:]]
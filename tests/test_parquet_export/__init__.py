@@ -0,0 +1,3 @@
+"""
+Test suite for parquet_export.py module.
+"""
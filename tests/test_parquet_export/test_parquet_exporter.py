@@ -0,0 +1,106 @@
+"""
+Tests for the optional Parquet export.
+"""
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.dataset as ds  # noqa: E402
+import pyarrow.parquet as pq  # noqa: E402
+
+import main  # noqa: E402
+from emit import LoadFileWriter  # noqa: E402
+from parquet_export import ParquetExporter  # noqa: E402
+
+test_data = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+
+@pytest.fixture
+def test_data_dir(monkeypatch):
+    """Point main at the bundled test data."""
+    monkeypatch.setattr(main, "station_info_template", f"{test_data}/composite_station_info/{{0}}_composite_station_file.csv")
+    monkeypatch.setattr(main, "data_location_template", f"{test_data}/csv/{{0}}/{{1}}/{{2}}_{{0}}_{{1}}.csv")
+    return test_data
+
+
+class TestParquetExporter:
+    """Test cases for ParquetExporter."""
+
+    def test_partitioned_by_variable_and_period(self, tmp_path):
+        """Test that each variable and period gets its own file."""
+        exporter = ParquetExporter(str(tmp_path))
+        exporter.add_station("ppt", "1971_2000", 1, "long-record", None)
+        exporter.add_station("tmax", "1991_2020", 2, "composite", 5)
+        exporter.close()
+
+        assert (tmp_path / "stations" / "variable=ppt" / "period=1971_2000" / "part-0.parquet").exists()
+        table = ds.dataset(str(tmp_path / "stations"), partitioning="hive").to_table()
+        rows = sorted(table.to_pylist(), key=lambda r: r["climo_station_id"])
+        assert rows[1] == {"climo_station_id": 2, "type": "composite", "basin_id": 5, "variable": "tmax", "period": "1991_2020"}
+        assert rows[0]["basin_id"] is None
+
+    def test_row_groups_per_batch(self, tmp_path):
+        """Test that rows are streamed out in batches rather than held until close."""
+        exporter = ParquetExporter(str(tmp_path), batch_size=12)
+        for station_id in range(1, 4):
+            for month in range(1, 13):
+                exporter.add_value("ppt", "1971_2000", station_id, month, "01-Jan-1971", 1.0, 30)
+        assert all(not buffer for buffer in exporter.buffers.values())
+        exporter.close()
+
+        metadata = pq.ParquetFile(str(tmp_path / "values" / "variable=ppt" / "period=1971_2000" / "part-0.parquet")).metadata
+        assert metadata.num_row_groups == 3
+        assert metadata.num_rows == 36
+        assert exporter.rows["values"] == 36
+
+    def test_savepoint(self, tmp_path):
+        """Test that rows added in a failed savepoint are left out of the export."""
+        exporter = ParquetExporter(str(tmp_path))
+        with exporter.savepoint():
+            exporter.add_value("ppt", "1971_2000", 1, 1, "1971-01-15", 1.0, 30)
+        with pytest.raises(ValueError):
+            with exporter.savepoint():
+                exporter.add_value("ppt", "1971_2000", 2, 1, "1971-01-15", 2.0, 30)
+                raise ValueError("bad station")
+        exporter.close()
+
+        table = pq.read_table(exporter.path("values", "ppt", "1971_2000"))
+        assert table.column("climo_station_id").to_pylist() == [1]
+        assert exporter.rows["values"] == 1
+
+    def test_missing_pyarrow(self, tmp_path):
+        """Test that a clear error is raised when pyarrow isn't installed."""
+        with patch.dict(sys.modules, {"pyarrow": None}):
+            with pytest.raises(ImportError, match="pip install pyarrow"):
+                ParquetExporter(str(tmp_path))
+
+    def test_import_exports_same_rows(self, test_data_dir, tmp_path):
+        """Test that a dry run exports the same stations, links and values it writes to the load files."""
+        writer = LoadFileWriter(str(tmp_path / "load"))
+        exporter = ParquetExporter(str(tmp_path / "parquet"))
+
+        main.main(variables=["ppt"], writer=writer, exporter=exporter)
+
+        for table, name in [("stations", "stations.tsv"), ("station_histories", "station_histories.tsv"), ("values", "values.tsv")]:
+            exported = ds.dataset(str(tmp_path / "parquet" / table), partitioning="hive").count_rows()
+            assert exported == writer.rows[name]
+
+    def test_database_import_exports_values(self):
+        """Test that generate_value_data passes each value to the exporter."""
+        exporter = MagicMock()
+        mock_session = MagicMock()
+        mock_session.query.return_value.filter_by.return_value.first.return_value = MagicMock(id=1)
+        data_lines = [MagicMock(obs_time=f"01-{m}-1971", datum=float(i)) for i, m in enumerate(["Jan", "Feb"])]
+
+        with patch('main.read_data_file', return_value=data_lines), patch('main.ClimatologicalValue'):
+            main.generate_value_data(mock_session, "ppt", "1971_2000", 42, "404", [30, None], exporter)
+
+        assert [c[0] for c in exporter.add_value.call_args_list] == [
+            ("ppt", "1971_2000", 42, 1, "01-Jan-1971", 0.0, 30),
+            ("ppt", "1971_2000", 42, 2, "01-Feb-1971", 1.0, 0),
+        ]
@@ -0,0 +1,132 @@
+"""
+Tests for planning an import from the composite station files.
+"""
+import pytest
+import sys
+import os
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import main
+import plan
+from main import ImportFilter
+from metrics import ImportMetrics
+from plan import ImportPlan, plan_import
+
+test_data = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+
+@pytest.fixture
+def test_data_dir(monkeypatch):
+    """Point main at the bundled test data."""
+    monkeypatch.setattr(main, "station_info_template", f"{test_data}/composite_station_info/{{0}}_composite_station_file.csv")
+    monkeypatch.setattr(main, "data_location_template", f"{test_data}/csv/{{0}}/{{1}}/{{2}}_{{0}}_{{1}}.csv")
+    return test_data
+
+
+def expected_counts(history_lines, periods=None):
+    """Count the rows an import writes by walking the history lines directly."""
+    stations = links = 0
+    for line in history_lines:
+        for label in periods or main.period_labels:
+            if line.has_data[label]:
+                stations += 1
+                links += 1 + sum(joint is not None for joint in line.joint_stations[label])
+    return stations, links
+
+
+class TestPlanImport:
+    """Test cases for plan_import."""
+
+    def test_counts_rows(self, test_data_dir):
+        """Test that the plan counts every station, link and value the import writes."""
+        history_lines = main.read_station_info_file("ppt")
+        stations, links = expected_counts(history_lines)
+
+        result = plan_import(["ppt"])
+
+        assert (result.stations, result.links, result.values) == (stations, links, 12 * stations)
+        assert result.data_files == stations
+        assert result.history_lines == len(history_lines)
+        assert result.table_rows() == {
+            plan.ClimatologicalStation.__table__.name: stations,
+            plan.ClimatologicalStationXHistory.__table__.name: links,
+            plan.ClimatologicalValue.__table__.name: 12 * stations,
+        }
+
+    def test_reads_composite_files_once(self, test_data_dir, mocker):
+        """Test that each composite file is read once and no data file is opened."""
+        read_station_info = mocker.spy(plan, "read_station_info_file")
+        read_data = mocker.spy(main, "read_data_file")
+
+        plan_import(["ppt"])
+
+        assert read_station_info.call_count == 1
+        read_data.assert_not_called()
+
+    def test_honours_filter(self, test_data_dir):
+        """Test that only the subset to import is counted."""
+        stations, _ = expected_counts(main.read_station_info_file("ppt"), ["1981_2010"])
+
+        result = plan_import(["ppt"], ImportFilter(periods=["1981_2010"]))
+
+        assert result.stations == stations
+        assert list(result.expected) == [("ppt", "1981_2010")]
+
+    def test_shared_stations(self, test_data_dir, monkeypatch):
+        """Test that shared stations are counted once across variables."""
+        monkeypatch.setattr(main, "station_info_template", f"{test_data}/composite_station_info/ppt_composite_station_file.csv")
+
+        separate = plan_import(["ppt", "tmax"])
+        shared = plan_import(["ppt", "tmax"], shared_stations=True)
+
+        assert shared.stations == separate.stations // 2
+        assert shared.links == separate.links // 2
+        assert shared.values == separate.values
+
+    def test_estimate_from_metrics(self, test_data_dir, tmp_path):
+        """Test that the duration is estimated from the last successful run's throughput."""
+        path = str(tmp_path / "climo_import.prom")
+        metrics = ImportMetrics()
+        metrics.rows_inserted["climatological_value"] = 1000
+        metrics.phase_durations = {"ppt": 10.0}
+        metrics.mark_success()
+        metrics.write_textfile(path)
+
+        result = plan_import(["ppt"], metrics_file=path)
+
+        assert result.rows_per_second == pytest.approx(100.0)
+        assert result.estimated_seconds == pytest.approx(result.rows / 100.0)
+        assert "Estimated duration: 0:00:0" in result.report()
+
+    def test_no_estimate_without_metrics(self, test_data_dir, tmp_path):
+        """Test that there is no estimate without a previous run."""
+        result = plan_import(["ppt"], metrics_file=str(tmp_path / "missing.prom"))
+        assert result.estimated_seconds is None
+        assert "unknown" in result.report()
+
+
+class TestBatchSize:
+    """Test cases for the picked batch size."""
+
+    def test_small_import_unbatched(self):
+        """Test that an import fitting in one batch isn't batched."""
+        counts = {"stations": 10, "values": 120, "base_links": 10, "joint_links": 0}
+        assert ImportPlan({("ppt", "1971_2000"): counts}, history_lines=10).batch_size is None
+
+    def test_rows_per_batch(self, monkeypatch):
+        """Test that batches hold about rows_per_batch rows."""
+        monkeypatch.setattr(plan, "rows_per_batch", 1000)
+        # 3 stations, 6 links and 36 values per history line
+        counts = {"stations": 3000, "values": 36000, "base_links": 3000, "joint_links": 3000}
+        result = ImportPlan({("ppt", "1971_2000"): counts}, history_lines=1000)
+
+        assert result.batch_size == 1000 * 1000 // 45000
+
+    def test_auto_option(self):
+        """Test that main accepts --batch-size auto as well as a number."""
+        assert main.parse_args(["--batch-size", "auto"]).batch_size == "auto"
+        assert main.parse_args(["--batch-size", "500"]).batch_size == 500
+        with pytest.raises(SystemExit):
+            main.parse_args(["--batch-size", "lots"])
@@ -0,0 +1,3 @@
+"""
+Test suite for post_load.py module.
+"""
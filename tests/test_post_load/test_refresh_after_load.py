@@ -0,0 +1,101 @@
+"""
+Tests for the post-load ANALYZE and materialized view refresh.
+"""
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import sqlalchemy as sa
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import main
+import post_load
+from metrics import ImportMetrics
+from post_load import MaterializedView, find_dependent_materialized_views, refresh_after_load
+
+test_data = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+
+@pytest.fixture
+def test_data_dir(monkeypatch):
+    """Point main at the bundled test data."""
+    monkeypatch.setattr(main, "station_info_template", f"{test_data}/composite_station_info/{{0}}_composite_station_file.csv")
+    monkeypatch.setattr(main, "data_location_template", f"{test_data}/csv/{{0}}/{{1}}/{{2}}_{{0}}_{{1}}.csv")
+    return test_data
+
+
+def executed(session):
+    return [str(call.args[0]) for call in session.execute.call_args_list]
+
+
+class TestRefreshAfterLoad:
+    """Test cases for refresh_after_load."""
+
+    def test_refresh_statement(self):
+        """Test that views are refreshed concurrently only when possible, with quoted names."""
+        assert MaterializedView("crmp", "Counts", 1, True).refresh_statement() == 'REFRESH MATERIALIZED VIEW CONCURRENTLY crmp."Counts"'
+        assert MaterializedView("crmp", "totals", 2, False).refresh_statement() == "REFRESH MATERIALIZED VIEW crmp.totals"
+
+    def test_analyzes_then_refreshes(self):
+        """Test that the tables are analyzed, then each view refreshed and analyzed, each step timed."""
+        session = MagicMock()
+        metrics = ImportMetrics()
+        views = [MaterializedView("crmp", "a", 1, True), MaterializedView("crmp", "b", 2, False)]
+
+        with patch('post_load.find_dependent_materialized_views', return_value=views):
+            refresh_after_load(session, metrics)
+
+        statements = executed(session)
+        assert statements[0].startswith("ANALYZE ")
+        assert all(table.fullname in statements[0] for table in post_load.analyzed_tables)
+        assert statements[1:] == [
+            "REFRESH MATERIALIZED VIEW CONCURRENTLY crmp.a", "ANALYZE crmp.a",
+            "REFRESH MATERIALIZED VIEW crmp.b", "ANALYZE crmp.b",
+        ]
+        assert {"analyze", "refresh crmp.a", "refresh crmp.b"} <= set(metrics.phase_durations)
+
+
+class TestMainRefresh:
+    """Test cases for the post-load phase in main."""
+
+    @pytest.mark.parametrize("analyze", [True, False])
+    def test_after_commit(self, test_data_dir, analyze):
+        """Test that main refreshes after the commit unless told not to."""
+        session = MagicMock()
+        calls = []
+        session.commit.side_effect = lambda: calls.append("commit")
+
+        with patch('main.generate_climatological_periods'), patch('main.generate_climatological_variables'):
+            with patch('main.generate_climatological_stations'):
+                with patch('main.refresh_after_load', side_effect=lambda s, m: calls.append("refresh")):
+                    main.main(session=session, analyze=analyze, locks=False)
+
+        assert calls == (["commit", "refresh"] if analyze else ["commit"])
+
+    def test_option(self):
+        """Test that --no-analyze turns the phase off."""
+        assert main.parse_args([]).analyze
+        assert not main.parse_args(["--no-analyze"]).analyze
+
+
+class TestRefreshDatabase:
+    """The post-load phase against a real database."""
+
+    def test_refreshes_dependent_views(self, test_session, test_data_dir):
+        """Test that views built on the tables, directly or through a view, are refreshed in order."""
+        value = post_load.ClimatologicalValue.__table__
+        schema = value.schema
+        test_session.execute(sa.text(f"CREATE VIEW {schema}.value_view AS SELECT * FROM {value.fullname}"))
+        test_session.execute(sa.text(f"CREATE MATERIALIZED VIEW {schema}.value_counts AS SELECT count(*) AS n FROM {schema}.value_view"))
+        test_session.execute(sa.text(f"CREATE MATERIALIZED VIEW {schema}.value_counts_2 AS SELECT n FROM {schema}.value_counts"))
+        test_session.commit()
+
+        views = find_dependent_materialized_views(test_session)
+        assert [(v.name, v.concurrent) for v in views] == [("value_counts", False), ("value_counts_2", False)]
+
+        main.main(session=test_session, variables=["ppt"])
+
+        n = test_session.execute(sa.text(f"SELECT n FROM {schema}.value_counts_2")).scalar()
+        assert n == test_session.query(post_load.ClimatologicalValue).count()
@@ -0,0 +1,99 @@
+"""
+Tests for purging imported climatology data.
+"""
+import pytest
+import sys
+import os
+import sqlalchemy as sa
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import main
+import purge
+from pycds import ClimatologicalPeriod, ClimatologicalStation, ClimatologicalStationXHistory, ClimatologicalValue
+
+test_data = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+
+@pytest.fixture
+def test_data_dir(monkeypatch):
+    """Point main at the bundled test data."""
+    monkeypatch.setattr(main, "station_info_template", f"{test_data}/composite_station_info/{{0}}_composite_station_file.csv")
+    monkeypatch.setattr(main, "data_location_template", f"{test_data}/csv/{{0}}/{{1}}/{{2}}_{{0}}_{{1}}.csv")
+    return test_data
+
+
+def counts(session):
+    return tuple(session.query(model).count() for model in [ClimatologicalStation, ClimatologicalStationXHistory, ClimatologicalValue])
+
+
+class TestPurgeOptions:
+    """Test cases for the purge options."""
+
+    def test_scoped_options(self):
+        """Test that variables and periods may be repeated."""
+        args = purge.parse_args(["--variable", "ppt", "--variable", "tmax", "--period", "1991_2020", "--chunk-size", "100"])
+        assert args.variables == ["ppt", "tmax"]
+        assert args.periods == ["1991_2020"]
+        assert args.chunk_size == 100
+        assert not args.truncate
+
+    @pytest.mark.parametrize("argv", [
+        ["--truncate", "--variable", "ppt"],
+        ["--truncate", "--period", "1971_2000"],
+    ])
+    def test_truncate_is_full(self, argv):
+        """Test that a truncate can't be scoped."""
+        with pytest.raises(SystemExit):
+            purge.parse_args(argv)
+
+    def test_rejects_bad_chunk_size(self):
+        """Test that the chunk size must be positive."""
+        with pytest.raises(ValueError):
+            purge.purge(session=None, chunk_size=0)
+
+
+class TestPurgeDatabase:
+    """Purges against a real database."""
+
+    def test_purge_period(self, test_session, test_data_dir):
+        """Test that a scoped purge deletes only that period's stations, links and values."""
+        main.main(session=test_session, variables=["ppt"])
+        before = counts(test_session)
+        period_stations = test_session.query(ClimatologicalStation).join(
+            ClimatologicalPeriod, ClimatologicalPeriod.id == ClimatologicalStation.climo_period_id
+        ).filter(sa.func.extract("year", ClimatologicalPeriod.start_date) == 1981).count()
+
+        result = purge.purge(test_session, variables=["ppt"], periods=["1981_2010"], chunk_size=3)
+
+        assert result.rows[purge.station.name] == period_stations
+        assert result.chunks > 1
+        after = counts(test_session)
+        assert after[0] == before[0] - period_stations
+        assert after[2] == before[2] - 12 * period_stations
+
+    def test_other_variable_untouched(self, test_session, test_data_dir):
+        """Test that purging a variable that wasn't imported deletes nothing."""
+        main.main(session=test_session, variables=["ppt"])
+        before = counts(test_session)
+
+        result = purge.purge(test_session, variables=["tmax"])
+
+        assert sum(result.rows.values()) == 0
+        assert counts(test_session) == before
+
+    def test_full_purge_and_truncate(self, test_session, test_data_dir):
+        """Test that a full purge, chunked or truncated, leaves the periods and variables for a reload."""
+        main.main(session=test_session, variables=["ppt"])
+        before = counts(test_session)
+
+        purge.purge(test_session, chunk_size=2)
+        assert counts(test_session) == (0, 0, 0)
+
+        main.main(session=test_session, variables=["ppt"], skip_setup=True)
+        assert counts(test_session) == before
+
+        result = purge.purge(test_session, use_truncate=True)
+        assert result.rows[purge.station.name] == before[0]
+        assert counts(test_session) == (0, 0, 0)
@@ -0,0 +1,235 @@
+"""
+Tests for tolerant imports, which quarantine failing stations instead of aborting.
+"""
+import csv
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import main
+from emit import LoadFileWriter, stations_file, values_file
+from metrics import ImportMetrics
+from quarantine import Quarantine, describe, quarantine_columns
+from pycds import ClimatologicalStation, ClimatologicalStationXHistory, ClimatologicalValue
+
+test_data = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+
+@pytest.fixture
+def test_data_dir(monkeypatch):
+    """Point main at the bundled test data."""
+    monkeypatch.setattr(main, "station_info_template", f"{test_data}/composite_station_info/{{0}}_composite_station_file.csv")
+    monkeypatch.setattr(main, "data_location_template", f"{test_data}/csv/{{0}}/{{1}}/{{2}}_{{0}}_{{1}}.csv")
+    return test_data
+
+
+def read_rows(path):
+    with open(path, newline="") as f:
+        return list(csv.reader(f))
+
+
+def first_history(variable="ppt"):
+    """The first history line included in the test data and a period it has data for."""
+    line = main.read_station_info_file(variable)[0]
+    label = next(label for label in main.period_labels if line.has_data[label])
+    return line.history_id, label
+
+
+class TestQuarantine:
+    """Test cases for the Quarantine report."""
+
+    def test_writes_rows_as_added(self, tmp_path):
+        """Test that the header and every row are on disk as soon as they are added."""
+        path = tmp_path / "quarantine.csv"
+        quarantine = Quarantine(str(path))
+        quarantine.add("ppt", "1981_2010", 42, "ValueError: bad value")
+        assert read_rows(path) == [quarantine_columns, ["ppt", "1981_2010", "42", "ValueError: bad value"]]
+        assert quarantine.count == 1
+        quarantine.close()
+
+    def test_describe(self):
+        """Test that reasons are one line, naming the error type."""
+        assert describe(ValueError("could not convert\nmore detail")) == "ValueError: could not convert"
+        assert describe(KeyError()) == "KeyError"
+
+
+class TestTolerantImport:
+    """Test cases for generate_climatological_stations with a quarantine."""
+
+    def run(self, tmp_path, side_effect, batch_size=None, quarantine=True):
+        session = MagicMock()
+        metrics = ImportMetrics()
+        report = Quarantine(str(tmp_path / "quarantine.csv")) if quarantine else None
+        with patch('main.get_period_id_by_dates', return_value=1), patch('main.generate_station') as mock_station:
+            with patch('main.insert_station_links'), patch('main.find_histories', side_effect=lambda s, lines: {
+                history_id for line in lines for history_id in [line.history_id, *sum(line.joint_stations.values(), [])]
+            }):
+                with patch('main.generate_value_data', side_effect=side_effect) as mock_values:
+                    mock_station.return_value.id = 7
+                    main.generate_climatological_stations(session, "ppt", metrics, batch_size=batch_size, quarantine=report)
+        return session, metrics, report, mock_values
+
+    def test_continues_past_failing_station(self, tmp_path, test_data_dir):
+        """Test that a failing station is rolled back to its savepoint, recorded and skipped."""
+        history_id, label = first_history()
+        calls = []
+
+        def values(session, variable, period, station_id, history, monthlyyears, exporter):
+            calls.append((period, history))
+            if len(calls) == 1:
+                raise FileNotFoundError(f"No data file for {history}")
+            return 12
+
+        session, metrics, report, mock_values = self.run(tmp_path, values)
+        report.close()
+
+        assert read_rows(tmp_path / "quarantine.csv")[1] == ["ppt", label, str(history_id), f"FileNotFoundError: No data file for {history_id}"]
+        assert len(calls) > 1
+        assert session.begin_nested.call_count == len(calls)
+        assert metrics.stations_quarantined == {("ppt", label): 1}
+        assert metrics.files_missing["ppt"] == 1
+        assert sum(metrics.stations.values()) == metrics.files_read["ppt"] == len(calls) - 1
+
+    def test_raises_without_quarantine(self, tmp_path, test_data_dir):
+        """Test that without a quarantine the first failure still aborts, without savepoints."""
+        with pytest.raises(ValueError):
+            self.run(tmp_path, ValueError("bad value"), quarantine=False)
+
+    def test_unexpected_errors_abort(self, tmp_path, test_data_dir):
+        """Test that errors which aren't about the data still abort a tolerant import."""
+        with pytest.raises(RuntimeError):
+            self.run(tmp_path, RuntimeError("bug"))
+
+    def test_batch_quarantines_missing_histories(self, tmp_path, test_data_dir):
+        """Test that in batch mode stations linking to unknown histories are quarantined before creation."""
+        history_id, label = first_history()
+        with patch('main.find_histories', return_value=set()):
+            session = MagicMock()
+            metrics = ImportMetrics()
+            report = Quarantine(str(tmp_path / "quarantine.csv"))
+            with patch('main.get_period_id_by_dates', return_value=1), patch('main.generate_station') as mock_station:
+                with patch('main.insert_station_links') as mock_links, patch('main.generate_value_data'):
+                    main.generate_climatological_stations(session, "ppt", metrics, batch_size=2, quarantine=report)
+            report.close()
+
+        mock_station.assert_not_called()
+        mock_links.assert_not_called()
+        rows = read_rows(tmp_path / "quarantine.csv")
+        assert rows[1][:3] == ["ppt", label, str(history_id)]
+        assert rows[1][3].startswith(f"ValueError: histories not found: [{history_id}")
+        assert report.count == sum(metrics.stations_quarantined.values())
+
+    @pytest.mark.parametrize("batch_size", [None, 2])
+    def test_quarantines_duplicate_links(self, tmp_path, test_data_dir, batch_size):
+        """Test that a station linking a history twice is quarantined before its batch's link insert."""
+        history_id, label = first_history()
+        history_lines = main.read_station_info_file("ppt")
+        history_lines[0].joint_stations[label] = [history_id, None, None]
+
+        with patch('main.read_station_info_file', return_value=history_lines):
+            _, metrics, report, _ = self.run(tmp_path, lambda *args: 12, batch_size=batch_size)
+        report.close()
+
+        rows = read_rows(tmp_path / "quarantine.csv")
+        assert rows[1:] == [["ppt", label, str(history_id), f"ValueError: histories linked more than once: [{history_id}]"]]
+        assert metrics.stations_quarantined == {("ppt", label): 1}
+
+    def test_emit_quarantines_unreadable_files(self, tmp_path, test_data_dir):
+        """Test that writing load files leaves out and records stations whose data file can't be read."""
+        writer = LoadFileWriter(str(tmp_path / "load"), first_station_id=10)
+        metrics = ImportMetrics()
+        report = Quarantine(str(tmp_path / "quarantine.csv"))
+        read_data_file = main.read_data_file
+        history_id, label = first_history()
+
+        def failing(variable, period, history):
+            if (period, history) == (label, str(history_id)):
+                raise FileNotFoundError("gone")
+            return read_data_file(variable, period, history)
+
+        with patch('main.read_data_file', side_effect=failing):
+            main.emit_climatological_stations(writer, "ppt", metrics, quarantine=report)
+        writer.close()
+        report.close()
+
+        assert report.count == sum(metrics.stations_quarantined.values()) == metrics.files_missing["ppt"] == 1
+        assert writer.rows[stations_file] == sum(metrics.stations.values())
+        station_ids = [int(row.split("\t")[0]) for row in (tmp_path / "load" / stations_file).read_text().splitlines()]
+        assert station_ids == list(range(10, 10 + len(station_ids)))
+        assert writer.rows[values_file] == 12 * len(station_ids)
+
+    def test_arguments(self):
+        """Test the --quarantine option and its metric."""
+        assert main.parse_args(["--quarantine", "bad.csv"]).quarantine == "bad.csv"
+        assert main.parse_args([]).quarantine is None
+
+        metrics = ImportMetrics()
+        metrics.record_quarantined("ppt", "1981_2010")
+        assert 'climo_import_stations_quarantined{variable="ppt",period="1981_2010"} 1' in metrics.to_textfile()
+
+
+class TestQuarantineDatabase:
+    """Tolerant imports against a real database."""
+
+    def test_bad_station_rolled_back_alone(self, test_session, test_data_dir, tmp_path):
+        """Test that only the failing station's rows are rolled back, the rest of the import commits."""
+        history_id, label = first_history()
+        read_data_file = main.read_data_file
+
+        def failing(variable, period, history):
+            if (period, history) == (label, str(history_id)):
+                raise ValueError("could not convert string to float: 'abc'")
+            return read_data_file(variable, period, history)
+
+        main.main(session=test_session, variables=["ppt"], analyze=False)
+        expected = [test_session.query(model).count() for model in [ClimatologicalStation, ClimatologicalStationXHistory, ClimatologicalValue]]
+        test_session.query(ClimatologicalValue).delete()
+        test_session.query(ClimatologicalStationXHistory).delete()
+        test_session.query(ClimatologicalStation).delete()
+        test_session.commit()
+
+        report = Quarantine(str(tmp_path / "quarantine.csv"))
+        with patch('main.read_data_file', side_effect=failing):
+            main.main(session=test_session, variables=["ppt"], analyze=False, quarantine=report)
+        report.close()
+
+        assert report.count == 1
+        stations, links, values = [test_session.query(model).count() for model in [ClimatologicalStation, ClimatologicalStationXHistory, ClimatologicalValue]]
+        assert stations == expected[0] - 1
+        assert links < expected[1] and values < expected[2]
+
+    def test_bad_station_left_out_of_export(self, test_session, test_data_dir, tmp_path):
+        """Test that a station rolled back to its savepoint is left out of the Parquet export."""
+        pytest.importorskip("pyarrow")
+        import pyarrow.dataset as ds
+        from parquet_export import ParquetExporter
+
+        history_id, label = first_history()
+        read_data_file = main.read_data_file
+
+        def bad_date(variable, period, history):
+            data_lines = read_data_file(variable, period, history)
+            if (period, history) == (label, str(history_id)):
+                # only rejected by the database when the station's savepoint is flushed
+                data_lines[-1].obs_time = "not a date"
+            return data_lines
+
+        report = Quarantine(str(tmp_path / "quarantine.csv"))
+        exporter = ParquetExporter(str(tmp_path / "parquet"))
+        metrics = ImportMetrics()
+        with patch('main.read_data_file', side_effect=bad_date):
+            main.main(session=test_session, variables=["ppt"], metrics=metrics, analyze=False, quarantine=report, exporter=exporter)
+        report.close()
+
+        assert report.count == 1
+        # the bad station's file was read, but the station was rolled back
+        assert metrics.files_read["ppt"] == sum(metrics.stations.values()) == test_session.query(ClimatologicalStation).count()
+        for table, model in [("stations", ClimatologicalStation), ("station_histories", ClimatologicalStationXHistory), ("values", ClimatologicalValue)]:
+            exported = ds.dataset(str(tmp_path / "parquet" / table), partitioning="hive").to_table()
+            assert exported.num_rows == test_session.query(model).count()
+        station_ids = {station_id for station_id, in test_session.query(ClimatologicalStation.id)}
+        assert set(exported.column("climo_station_id").to_pylist()) == station_ids
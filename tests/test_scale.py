@@ -0,0 +1,197 @@
+"""
+Scale regression test for the full import through main().
+Imports two synthetic datasets of different sizes into a real PostgreSQL database and
+fails if wall time or memory exceeds a budget, or grows superlinearly between the sizes.
+
+Only runs with `--runslow`. Sizes and budgets are configurable via environment variables:
+    CLIMO_SCALE_SMALL          number of histories in the small dataset (default 100)
+    CLIMO_SCALE_LARGE          number of histories in the large dataset (default 400)
+    CLIMO_SCALE_TIME_BUDGET    maximum seconds for the large import (default 600)
+    CLIMO_SCALE_MEMORY_BUDGET  maximum peak traced/resident memory in MB (default 1024)
+    CLIMO_SCALE_GROWTH         allowed growth factor over linear between sizes (default 1.5)
+    CLIMO_SCALE_BATCH_GROWTH   allowed memory growth between --batch-size batches (default 0.05)
+"""
+import os
+import sys
+import csv
+import time
+import resource
+import tracemalloc
+import pytest
+import sqlalchemy as sa
+
+# Set test data directory BEFORE importing main (so basedir is set correctly)
+test_dir = os.path.join(os.path.dirname(__file__), 'data')
+os.environ['CLIMO_DATA_DIR'] = test_dir + '/'
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import main
+from pycds import (
+    ClimatologicalPeriod,
+    ClimatologicalStation,
+    ClimatologicalStationXHistory,
+    ClimatologicalValue,
+    ClimatologicalVariable,
+)
+
+SMALL = int(os.getenv("CLIMO_SCALE_SMALL", "100"))
+LARGE = int(os.getenv("CLIMO_SCALE_LARGE", "400"))
+TIME_BUDGET = float(os.getenv("CLIMO_SCALE_TIME_BUDGET", "600"))
+MEMORY_BUDGET = float(os.getenv("CLIMO_SCALE_MEMORY_BUDGET", "1024")) * 1024 * 1024
+GROWTH = float(os.getenv("CLIMO_SCALE_GROWTH", "1.5"))
+BATCH_GROWTH = float(os.getenv("CLIMO_SCALE_BATCH_GROWTH", "0.05"))
+
+# Synthetic history ids start well above the ids seeded from the test data
+FIRST_HISTORY_ID = 100000
+PERIODS = {"1971": "1971_2000", "1981": "1981_2010", "1991": "1991_2020"}
+
+
+def write_synthetic_dataset(root, count: int):
+    """Write composite station files and data files for `count` histories and all variables.
+    Every history has data in every period, and uses the previous history as a joint station.
+    """
+    header = ["history_id", "lat", "lon", "elev", "basin"]
+    for prefix in PERIODS:
+        header += [f"monthlyyears_{prefix}_{i}" for i in range(1, 13)]
+        header += [f"joint_stations_{prefix}_{i}" for i in range(1, 4)]
+
+    os.makedirs(os.path.join(root, "composite_station_info"), exist_ok=True)
+    for variable in main.var_map:
+        with open(os.path.join(root, "composite_station_info", f"{variable}_composite_station_file.csv"), "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            for offset in range(count):
+                history_id = FIRST_HISTORY_ID + offset
+                row = [history_id, 49.0 + offset * 0.001, -123.0, 100.0, "NaN"]
+                for _ in PERIODS:
+                    row += [30] * 12
+                    row += [history_id - 1 if offset > 0 else "", "", ""]
+                writer.writerow(row)
+
+        for prefix, period in PERIODS.items():
+            period_dir = os.path.join(root, "csv", variable, period)
+            os.makedirs(period_dir, exist_ok=True)
+            lines = "obs_time,datum\n" + "".join(
+                f"01-{month}-{prefix},{10.0 + i}\n"
+                for i, month in enumerate(["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"])
+            )
+            for offset in range(count):
+                with open(os.path.join(period_dir, f"{FIRST_HISTORY_ID + offset}_{variable}_{period}.csv"), "w") as f:
+                    f.write(lines)
+
+
+def seed_synthetic_histories(engine: sa.Engine, count: int):
+    """Create the history records referenced by the synthetic dataset."""
+    with engine.begin() as conn:
+        network_id = conn.execute(
+            sa.text("INSERT INTO crmp.meta_network (network_name) VALUES ('Scale Network') RETURNING network_id")
+        ).scalar()
+        station_id = conn.execute(
+            sa.text("INSERT INTO crmp.meta_station (native_id, network_id) VALUES ('SCALE001', :network_id) RETURNING station_id"),
+            {"network_id": network_id}
+        ).scalar()
+        conn.execute(
+            sa.text(
+                "INSERT INTO crmp.meta_history (history_id, station_id, freq) "
+                "SELECT generate_series(:first, :last), :station_id, 'daily'"
+            ),
+            {"first": FIRST_HISTORY_ID, "last": FIRST_HISTORY_ID + count - 1, "station_id": station_id}
+        )
+
+
+def clear_climatologies(session):
+    """Remove everything main() created so the next run starts from an empty structure."""
+    for model in [ClimatologicalValue, ClimatologicalStationXHistory, ClimatologicalStation, ClimatologicalVariable, ClimatologicalPeriod]:
+        session.execute(sa.delete(model))
+    session.commit()
+
+
+def measure_import(session, monkeypatch, root) -> tuple[float, int]:
+    """Run main() against the dataset in `root` and return (seconds, peak traced bytes)."""
+    root = str(root) + "/"
+    monkeypatch.setattr(main, "station_info_template", f"{root}composite_station_info/{{0}}_composite_station_file.csv")
+    monkeypatch.setattr(main, "data_location_template", f"{root}csv/{{0}}/{{1}}/{{2}}_{{0}}_{{1}}.csv")
+
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        main.main(session=session)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return elapsed, peak
+
+
+@pytest.mark.slow
+class TestImportScale:
+    """Time and memory budgets for the full import."""
+
+    def test_import_scales_linearly(self, test_db_engine, test_session, tmp_path, monkeypatch):
+        """Import a small and a large synthetic dataset and compare their cost."""
+        seed_synthetic_histories(test_db_engine, LARGE)
+        write_synthetic_dataset(tmp_path / "small", SMALL)
+        write_synthetic_dataset(tmp_path / "large", LARGE)
+
+        small_time, small_peak = measure_import(test_session, monkeypatch, tmp_path / "small")
+        assert test_session.query(ClimatologicalStation).count() == SMALL * len(PERIODS) * len(main.var_map)
+        clear_climatologies(test_session)
+
+        large_time, large_peak = measure_import(test_session, monkeypatch, tmp_path / "large")
+        assert test_session.query(ClimatologicalStation).count() == LARGE * len(PERIODS) * len(main.var_map)
+        assert test_session.query(ClimatologicalValue).count() == LARGE * len(PERIODS) * len(main.var_map) * 12
+
+        # ru_maxrss is reported in kilobytes on Linux
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+        print(f"small ({SMALL}): {small_time:.1f}s, {small_peak / 2**20:.1f} MB traced; "
+              f"large ({LARGE}): {large_time:.1f}s, {large_peak / 2**20:.1f} MB traced; "
+              f"peak RSS {peak_rss / 2**20:.1f} MB")
+
+        assert large_time <= TIME_BUDGET, f"Import of {LARGE} histories took {large_time:.1f}s (budget {TIME_BUDGET}s)"
+        assert large_peak <= MEMORY_BUDGET, f"Peak traced memory {large_peak / 2**20:.1f} MB over budget"
+        assert peak_rss <= MEMORY_BUDGET, f"Peak RSS {peak_rss / 2**20:.1f} MB over budget"
+
+        linear = LARGE / SMALL
+        assert large_time / small_time <= linear * GROWTH, \
+            f"Import time grew {large_time / small_time:.1f}x for {linear:.1f}x more data"
+        assert large_peak / small_peak <= linear * GROWTH, \
+            f"Peak memory grew {large_peak / small_peak:.1f}x for {linear:.1f}x more data"
+
+
+@pytest.mark.slow
+class TestConstantMemory:
+    """Memory stays flat with a batch size, whatever the dataset size."""
+
+    def test_memory_flat_between_batches(self, test_db_engine, test_session, tmp_path, monkeypatch):
+        """Sample traced memory after every batch of a large import and check it doesn't grow."""
+        seed_synthetic_histories(test_db_engine, LARGE)
+        write_synthetic_dataset(tmp_path, LARGE)
+        monkeypatch.setattr(main, "station_info_template", f"{tmp_path}/composite_station_info/{{0}}_composite_station_file.csv")
+        monkeypatch.setattr(main, "data_location_template", f"{tmp_path}/csv/{{0}}/{{1}}/{{2}}_{{0}}_{{1}}.csv")
+
+        samples = []
+        expunge_batch = main.expunge_batch
+
+        def sampled_expunge_batch(session):
+            expunge_batch(session)
+            assert len(session.identity_map) == 0
+            samples.append(tracemalloc.get_traced_memory()[0])
+
+        monkeypatch.setattr(main, "expunge_batch", sampled_expunge_batch)
+        batch_size = max(LARGE // 20, 1)
+
+        tracemalloc.start()
+        try:
+            main.main(session=test_session, batch_size=batch_size)
+        finally:
+            tracemalloc.stop()
+
+        assert test_session.query(ClimatologicalValue).count() == LARGE * len(PERIODS) * len(main.var_map) * 12
+        # the first batch includes one-off allocations (compiled statements, caches)
+        baseline = samples[1]
+        print(f"traced memory per batch of {batch_size}: {[round(s / 2**10) for s in samples]} KB")
+        assert max(samples[1:]) <= baseline * (1 + BATCH_GROWTH), \
+            f"Memory grew from {baseline / 2**20:.2f} MB to {max(samples[1:]) / 2**20:.2f} MB across batches"
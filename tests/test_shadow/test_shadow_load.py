@@ -0,0 +1,139 @@
+"""
+Tests for shadow-table loads and the swap.
+"""
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import main
+import shadow
+from pycds import ClimatologicalStation, ClimatologicalStationXHistory, ClimatologicalValue, ClimatologicalVariable
+
+test_data = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+
+@pytest.fixture
+def test_data_dir(monkeypatch):
+    """Point main at the bundled test data."""
+    monkeypatch.setattr(main, "station_info_template", f"{test_data}/composite_station_info/{{0}}_composite_station_file.csv")
+    monkeypatch.setattr(main, "data_location_template", f"{test_data}/csv/{{0}}/{{1}}/{{2}}_{{0}}_{{1}}.csv")
+    return test_data
+
+
+class TestShadowOptions:
+    """Test cases for the shadow load options and wiring."""
+
+    def test_shadow_engine_translates_schema(self):
+        """Test the ORM is pointed at the shadow schema."""
+        engine = sa.create_engine("postgresql://")
+        translated = shadow.shadow_engine(engine)
+        assert translated.get_execution_options()["schema_translate_map"] == {shadow.live_schema(): shadow.shadow_schema_name()}
+
+    @pytest.mark.parametrize("argv", [
+        ["--shadow", "--variable", "ppt"],
+        ["--shadow", "--skip-setup"],
+        ["--shadow", "--sample", "0.1"],
+        ["--shadow", "--dry-run", "--emit", "out"],
+    ])
+    def test_rejects_partial_reloads(self, argv):
+        """Test that a shadow load must be a full reload."""
+        with pytest.raises(SystemExit):
+            main.parse_args(argv)
+
+    def test_swap_after_commit(self, test_data_dir):
+        """Test that main swaps the tables in only after the load has committed."""
+        session = MagicMock()
+        engine = MagicMock()
+        calls = []
+        session.commit.side_effect = lambda: calls.append("commit")
+
+        with patch('main.generate_climatological_periods'), patch('main.generate_climatological_variables'):
+            with patch('main.generate_climatological_stations'):
+                with patch('main.swap_shadow_tables', side_effect=lambda e: calls.append(("swap", e))):
+                    with patch('main.refresh_after_load', side_effect=lambda s, m: calls.append("refresh")):
+                        main.main(session=session, swap_engine=engine, locks=False)
+
+        assert calls == ["commit", ("swap", engine), "refresh"]
+
+    def test_no_swap_on_failure(self, test_data_dir):
+        """Test that a failed load leaves the live tables alone."""
+        with patch('main.generate_climatological_periods'), patch('main.generate_climatological_variables'):
+            with patch('main.generate_climatological_stations', side_effect=ValueError("bad data")):
+                with patch('main.swap_shadow_tables') as mock_swap:
+                    with pytest.raises(ValueError):
+                        main.main(session=MagicMock(), swap_engine=MagicMock())
+
+                    mock_swap.assert_not_called()
+
+
+class TestShadowDatabase:
+    """Shadow loads against a real database."""
+
+    def test_reload_is_swapped_in(self, test_db_engine, test_session, test_data_dir):
+        """Test that the live tables are untouched until the swap, then hold the new load."""
+        main.main(session=test_session, variables=["ppt"])
+        live_values = test_session.query(ClimatologicalValue).count()
+        first_ids = {s.id for s in test_session.query(ClimatologicalStation)}
+        test_session.close()
+
+        shadow.prepare_shadow_tables(test_db_engine)
+        shadow_session = Session(shadow.shadow_engine(test_db_engine))
+        main.main(session=shadow_session, variables=["ppt"])
+        shadow_session.close()
+
+        with Session(test_db_engine) as session:
+            assert {s.id for s in session.query(ClimatologicalStation)} == first_ids
+
+        shadow.swap_shadow_tables(test_db_engine)
+
+        with Session(test_db_engine) as session:
+            station_ids = {s.id for s in session.query(ClimatologicalStation)}
+            assert session.query(ClimatologicalValue).count() == live_values
+            assert station_ids.isdisjoint(first_ids)
+            schemas = session.execute(sa.text("SELECT nspname FROM pg_namespace WHERE nspname IN (:a, :b)"),
+                                      {"a": shadow.shadow_schema_name(), "b": shadow.previous_schema_name()}).all()
+            assert schemas == []
+
+    def test_keeps_stations_not_imported(self, test_db_engine, test_session, test_data_dir):
+        """Test that a station the importer didn't write survives the swap with its links and values."""
+        main.main(session=test_session, variables=["ppt"])
+        history_id = main.read_station_info_file("ppt")[0].history_id
+        period_id = main.get_period_id_by_dates(test_session, "1971-01-01", "2000-12-31")
+        variable_id = test_session.query(ClimatologicalVariable.id).filter_by(net_var_name=main.var_map["ppt"]).scalar()
+        prism = ClimatologicalStation(type="prism", basin_id=None, comments="", climo_period_id=period_id)
+        test_session.add(prism)
+        test_session.flush()
+        test_session.add(ClimatologicalStationXHistory(climo_station_id=prism.id, history_id=history_id, role="base"))
+        test_session.add(ClimatologicalValue(climo_station_id=prism.id, climo_variable_id=variable_id, value_time="1985-01-15",
+                                             value=1.5, num_contributing_years=0))
+        test_session.commit()
+        prism_id = prism.id
+        test_session.close()
+
+        shadow.prepare_shadow_tables(test_db_engine)
+        shadow_session = Session(shadow.shadow_engine(test_db_engine))
+        main.main(session=shadow_session, variables=["ppt"])
+        shadow_session.close()
+        shadow.swap_shadow_tables(test_db_engine)
+
+        with Session(test_db_engine) as session:
+            kept = session.get(ClimatologicalStation, prism_id)
+            assert kept.type == "prism" and kept.climo_period_id == period_id
+            assert [link.history_id for link in session.query(ClimatologicalStationXHistory).filter_by(climo_station_id=prism_id)] == [history_id]
+            assert [(v.climo_variable_id, v.value) for v in session.query(ClimatologicalValue).filter_by(climo_station_id=prism_id)] == [(variable_id, 1.5)]
+            assert session.query(ClimatologicalStation).filter(ClimatologicalStation.type != "prism").count() > 0
+
+    def test_refuses_with_dependent_view(self, test_db_engine):
+        """Test that a view on the live tables stops the load before anything is written."""
+        station = ClimatologicalStation.__table__
+        with test_db_engine.begin() as connection:
+            connection.execute(sa.text(f"CREATE VIEW {shadow.schema_name()}.station_view AS SELECT * FROM {shadow.qualified(shadow.schema_name(), station)}"))
+
+        with pytest.raises(RuntimeError, match="station_view"):
+            shadow.prepare_shadow_tables(test_db_engine)
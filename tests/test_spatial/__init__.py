@@ -0,0 +1,3 @@
+"""
+Test suite for spatial.py module.
+"""
@@ -0,0 +1,55 @@
+"""
+Tests for the KD-tree nearest-neighbour lookups.
+"""
+import pytest
+import random
+import sys
+import os
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from spatial import KDTree, distance_km
+
+
+class TestDistance:
+    """Test cases for distance_km."""
+
+    def test_known_distance(self):
+        """Test Victoria to Vancouver is about 95 km."""
+        assert distance_km(48.4284, -123.3656, 49.2827, -123.1207) == pytest.approx(96.7, abs=1.0)
+
+    def test_zero_distance(self):
+        """Test a point is no distance from itself."""
+        assert distance_km(49.0, -123.0, 49.0, -123.0) == pytest.approx(0.0, abs=1e-9)
+
+
+class TestKDTree:
+    """Test cases for KDTree."""
+
+    def test_matches_brute_force(self):
+        """Test the k nearest keys agree with an exhaustive search."""
+        rng = random.Random(42)
+        points = [(i, rng.uniform(48, 60), rng.uniform(-139, -114)) for i in range(2000)]
+        tree = KDTree(points)
+
+        for _ in range(100):
+            lat, lon = rng.uniform(48, 60), rng.uniform(-139, -114)
+            expected = sorted(points, key=lambda p: distance_km(lat, lon, p[1], p[2]))[:3]
+            found = tree.nearest(lat, lon, k=3)
+            assert [key for key, _ in found] == [p[0] for p in expected]
+            assert found[0][1] == pytest.approx(distance_km(lat, lon, expected[0][1], expected[0][2]))
+
+    def test_across_antimeridian(self):
+        """Test neighbours on the other side of the antimeridian are found."""
+        tree = KDTree([("east", 50.0, 179.9), ("far", 50.0, 170.0)])
+        assert tree.nearest(50.0, -179.9)[0][0] == "east"
+
+    def test_exclude(self):
+        """Test that a key can be left out, e.g. a station looking for its neighbours."""
+        tree = KDTree([(1, 49.0, -123.0), (2, 49.1, -123.0), (3, 50.0, -123.0)])
+        assert [key for key, _ in tree.nearest(49.0, -123.0, k=2, exclude=1)] == [2, 3]
+
+    def test_empty(self):
+        """Test an empty tree finds nothing."""
+        assert KDTree([]).nearest(49.0, -123.0) == []
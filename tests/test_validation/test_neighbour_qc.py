@@ -0,0 +1,73 @@
+"""
+Tests for the neighbour-based spatial QC in the validation pass.
+"""
+import sys
+import os
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from validation import ValidationReport, neighbour_outliers
+
+
+def grid(values_for, elev_for=lambda i: 100.0):
+    """Nine stations about 10 km apart, keyed 1..9, with values and elevations by index."""
+    return {
+        i + 1: (49.0 + 0.09 * (i // 3), -123.0 + 0.14 * (i % 3), elev_for(i), values_for(i))
+        for i in range(9)
+    }
+
+
+class TestNeighbourOutliers:
+    """Test cases for neighbour_outliers."""
+
+    def test_consistent_neighbours(self):
+        """Test that stations agreeing with their neighbours are not flagged."""
+        report = ValidationReport()
+        neighbour_outliers(report, "tmax", "1971_2000", grid(lambda i: [10.0 + 0.1 * i] * 12))
+        assert report.ok
+
+    def test_flags_outlying_months(self):
+        """Test that a station far from its neighbours' consensus is flagged with its months."""
+        def values(i):
+            v = [10.0] * 12
+            if i == 4:
+                v[6] = 25.0
+            return v
+
+        report = ValidationReport()
+        neighbour_outliers(report, "tmax", "1971_2000", grid(values))
+
+        assert [(issue.history_id, issue.check) for issue in report.issues] == [(5, "neighbour_outlier")]
+        assert "[7]" in report.issues[0].message
+
+    def test_elevation_adjusted(self):
+        """Test that a high station that is colder by the lapse rate is not flagged."""
+        # station 5 is 2 km higher and 13 degrees colder
+        report = ValidationReport()
+        neighbour_outliers(report, "tmin", "1971_2000", grid(
+            lambda i: [-3.0 if i == 4 else 10.0] * 12,
+            lambda i: 2100.0 if i == 4 else 100.0,
+        ))
+        assert report.ok
+
+    def test_precipitation_relative(self):
+        """Test that precipitation is compared relative to its amount."""
+        report = ValidationReport()
+        neighbour_outliers(report, "ppt", "1971_2000", grid(lambda i: [200.0 + 20 * (i % 3)] * 12))
+        assert report.ok
+
+        report = ValidationReport()
+        neighbour_outliers(report, "ppt", "1971_2000", grid(lambda i: [2000.0 if i == 4 else 200.0] * 12))
+        assert [issue.history_id for issue in report.issues] == [5]
+
+    def test_too_few_neighbours(self):
+        """Test that isolated stations are not judged."""
+        stations = {
+            1: (49.0, -123.0, 100.0, [10.0] * 12),
+            2: (49.1, -123.0, 100.0, [10.0] * 12),
+            3: (55.0, -130.0, 100.0, [40.0] * 12),
+        }
+        report = ValidationReport()
+        neighbour_outliers(report, "tmax", "1971_2000", stations)
+        assert report.ok
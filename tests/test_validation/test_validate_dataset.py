@@ -0,0 +1,137 @@
+"""
+Tests for the pre-import validation pass.
+"""
+import pytest
+import sys
+import os
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import main
+from main import ImportFilter
+from validation import validate_dataset
+
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Point main at an empty data directory under tmp_path."""
+    monkeypatch.setattr(main, "station_info_template", f"{tmp_path}/composite_station_info/{{0}}_composite_station_file.csv")
+    monkeypatch.setattr(main, "data_location_template", f"{tmp_path}/csv/{{0}}/{{1}}/{{2}}_{{0}}_{{1}}.csv")
+    return tmp_path
+
+
+def write_station_file(root, variable, rows):
+    """Write a composite file; each row is (history_id, monthlyyears for 1971) with other periods empty."""
+    header = ["history_id", "lat", "lon", "elev", "basin"]
+    for prefix in ["1971", "1981", "1991"]:
+        header += [f"monthlyyears_{prefix}_{i}" for i in range(1, 13)]
+        header += [f"joint_stations_{prefix}_{i}" for i in range(1, 4)]
+    os.makedirs(root / "composite_station_info", exist_ok=True)
+    with open(root / "composite_station_info" / f"{variable}_composite_station_file.csv", "w") as f:
+        f.write(",".join(header) + "\n")
+        for history_id, monthlyyears in rows:
+            values = [str(history_id), "49.0", "-123.0", "10", "NaN"]
+            values += [str(y) if y is not None else "" for y in monthlyyears] + [""] * 3
+            values += [""] * 30
+            f.write(",".join(values) + "\n")
+
+
+def write_data_file(root, variable, history_id, values, months=MONTHS, year=1971):
+    period_dir = root / "csv" / variable / "1971_2000"
+    os.makedirs(period_dir, exist_ok=True)
+    with open(period_dir / f"{history_id}_{variable}_1971_2000.csv", "w") as f:
+        f.write("obs_time,datum\n")
+        for month, value in zip(months, values):
+            f.write(f"01-{month}-{year},{value}\n")
+
+
+class TestValidateDataset:
+    """Test cases for validate_dataset."""
+
+    def test_clean_data(self, data_dir):
+        """Test that valid files produce no issues."""
+        write_station_file(data_dir, "ppt", [(1, [30] * 12)])
+        write_data_file(data_dir, "ppt", 1, [10.0] * 12)
+
+        report = validate_dataset(["ppt"])
+
+        assert report.ok
+        assert report.files_checked == 1
+
+    def test_collects_every_issue(self, data_dir):
+        """Test that all violations are reported together rather than stopping at the first."""
+        write_station_file(data_dir, "ppt", [
+            (1, [30] * 12),
+            (2, [30] * 12),
+            (3, [30] * 12),
+            (4, [30] * 6 + [None] * 6),
+            (5, [30] * 12),
+        ])
+        write_data_file(data_dir, "ppt", 1, [10.0] * 11)
+        write_data_file(data_dir, "ppt", 2, [10.0] * 12, months=MONTHS[1:] + MONTHS[:1])
+        write_data_file(data_dir, "ppt", 3, [-1.0] + [10.0] * 11, year=2005)
+
+        report = validate_dataset(["ppt"])
+
+        assert report.counts() == {
+            "month_count": 1,
+            "month_order": 1,
+            "obs_time_period": 1,
+            "value_range": 1,
+            "monthlyyears_partial": 1,
+            "missing_file": 1,
+        }
+        assert {i.history_id for i in report.issues if i.check == "missing_file"} == {5}
+
+    def test_malformed_rows(self, data_dir):
+        """Test that composite rows that can't be parsed are reported and the other rows still validated."""
+        write_station_file(data_dir, "ppt", [(1, [30] * 12), (2, [30] * 12), (3, [30] * 12)])
+        station_file = data_dir / "composite_station_info" / "ppt_composite_station_file.csv"
+        lines = station_file.read_text().splitlines()
+        lines[2] = lines[2].replace("49.0", "north", 1)
+        lines[3] = ",".join(lines[3].split(",")[:10])
+        station_file.write_text("\n".join(lines) + "\n")
+        write_data_file(data_dir, "ppt", 1, [10.0] * 12)
+
+        report = validate_dataset(["ppt"])
+
+        assert report.counts() == {"malformed_row": 2}
+        assert [(i.history_id, i.message.split(":")[0]) for i in report.issues] == [(2, "line 3"), (3, "line 4")]
+        assert report.files_checked == 1
+        with pytest.raises(ValueError):
+            main.read_station_info_file("ppt")
+
+    def test_tmax_below_tmin(self, data_dir):
+        """Test that tmax below tmin for the same station and month is flagged."""
+        for variable in ["tmax", "tmin"]:
+            write_station_file(data_dir, variable, [(1, [30] * 12)])
+        write_data_file(data_dir, "tmax", 1, [5.0] * 11 + [-5.0])
+        write_data_file(data_dir, "tmin", 1, [0.0] * 12)
+
+        report = validate_dataset(["tmax", "tmin"])
+
+        assert report.counts() == {"tmax_below_tmin": 1}
+        assert "[12]" in report.issues[0].message
+
+    def test_honours_filter(self, data_dir):
+        """Test that filtered out histories are not checked."""
+        write_station_file(data_dir, "ppt", [(1, [30] * 12), (2, [30] * 12)])
+        write_data_file(data_dir, "ppt", 1, [10.0] * 12)
+
+        report = validate_dataset(["ppt"], ImportFilter(history_ids={1}))
+
+        assert report.ok
+
+    def test_write_csv(self, data_dir, tmp_path):
+        """Test that the report is written as CSV."""
+        write_station_file(data_dir, "ppt", [(1, [30] * 12)])
+
+        report = validate_dataset(["ppt"])
+        report.write_csv(str(tmp_path / "report.csv"))
+
+        lines = open(tmp_path / "report.csv").read().splitlines()
+        assert lines[0] == "variable,period,history_id,check,message"
+        assert lines[1].startswith("ppt,1971_2000,1,missing_file,")
@@ -0,0 +1,164 @@
+"""
+Tests for the post-import aggregate verification.
+"""
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import main
+from main import ImportFilter
+from verify import check_locations, compare, compute_expectations, verify
+
+test_data = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Point main at an empty data directory under tmp_path."""
+    monkeypatch.setattr(main, "station_info_template", f"{tmp_path}/composite_station_info/{{0}}_composite_station_file.csv")
+    return tmp_path
+
+
+@pytest.fixture
+def test_data_dir(monkeypatch):
+    """Point main at the bundled test data regardless of import order."""
+    monkeypatch.setattr(main, "station_info_template", f"{test_data}/composite_station_info/{{0}}_composite_station_file.csv")
+    monkeypatch.setattr(main, "data_location_template", f"{test_data}/csv/{{0}}/{{1}}/{{2}}_{{0}}_{{1}}.csv")
+    return test_data
+
+
+def write_station_file(root, variable, rows):
+    """Write a composite file; each row is (history_id, {prefix: (monthlyyears, joint_stations)})."""
+    header = ["history_id", "lat", "lon", "elev", "basin"]
+    for prefix in ["1971", "1981", "1991"]:
+        header += [f"monthlyyears_{prefix}_{i}" for i in range(1, 13)]
+        header += [f"joint_stations_{prefix}_{i}" for i in range(1, 4)]
+    os.makedirs(root / "composite_station_info", exist_ok=True)
+    with open(root / "composite_station_info" / f"{variable}_composite_station_file.csv", "w") as f:
+        f.write(",".join(header) + "\n")
+        for history_id, periods in rows:
+            values = [str(history_id), "49.0", "-123.0", "10", "NaN"]
+            for prefix in ["1971", "1981", "1991"]:
+                monthlyyears, joint_stations = periods.get(prefix, ([""] * 12, [""] * 3))
+                values += [str(v) for v in monthlyyears] + [str(v) for v in joint_stations]
+            f.write(",".join(values) + "\n")
+
+
+class TestComputeExpectations:
+    """Test cases for compute_expectations."""
+
+    def test_counts_from_station_file(self, data_dir):
+        """Test stations, values, links and contributing years are derived from the composite file."""
+        write_station_file(data_dir, "ppt", [
+            (1, {"1971": ([30] * 12, [11, 12, ""]), "1991": ([20] * 12, ["", "", ""])}),
+            (2, {"1971": ([25] * 12, [13, "", ""])}),
+        ])
+
+        expected = compute_expectations(["ppt"])
+
+        assert expected[("ppt", "1971_2000")] == {
+            "stations": 2,
+            "values": 24,
+            "stations_without_12_values": 0,
+            "base_links": 2,
+            "joint_links": 3,
+            "contributing_years": 30 * 12 + 25 * 12,
+        }
+        assert expected[("ppt", "1991_2020")]["stations"] == 1
+        assert ("ppt", "1981_2010") not in expected
+
+    def test_honours_filter(self, data_dir):
+        """Test that only the histories and periods in the filter are counted."""
+        write_station_file(data_dir, "ppt", [
+            (1, {"1971": ([30] * 12, ["", "", ""]), "1991": ([20] * 12, ["", "", ""])}),
+            (2, {"1971": ([25] * 12, ["", "", ""])}),
+        ])
+
+        expected = compute_expectations(["ppt"], ImportFilter(periods=["1971_2000"], history_ids={2}))
+
+        assert list(expected) == [("ppt", "1971_2000")]
+        assert expected[("ppt", "1971_2000")]["stations"] == 1
+
+
+class TestCompare:
+    """Test cases for compare."""
+
+    def test_reports_differences_only(self):
+        """Test that only differing checks are reported."""
+        expected = {("ppt", "1971_2000"): {"stations": 2, "values": 24}}
+        actual = {("ppt", "1971_2000"): {"stations": 2, "values": 23}}
+
+        with patch("verify.checks", ["stations", "values"]):
+            mismatches = compare(expected, actual)
+
+        assert len(mismatches) == 1
+        assert (mismatches[0].check, mismatches[0].expected, mismatches[0].actual) == ("values", 24, 23)
+
+    def test_missing_period_in_database(self):
+        """Test that a period absent from the database is reported against zero."""
+        expected = {("ppt", "1971_2000"): {"stations": 2}}
+
+        with patch("verify.checks", ["stations"]):
+            mismatches = compare(expected, {})
+
+        assert [(m.period, m.expected, m.actual) for m in mismatches] == [("1971_2000", 2, 0)]
+
+    def test_verify_uses_aggregates(self, data_dir):
+        """Test that verify compares the file expectations against the aggregate queries."""
+        write_station_file(data_dir, "ppt", [(1, {"1971": ([30] * 12, ["", "", ""])})])
+        actual = compute_expectations(["ppt"])
+
+        with patch("verify.query_database_aggregates", return_value=actual) as mock_query:
+            assert verify(MagicMock(), ["ppt"]) == []
+            mock_query.assert_called_once()
+
+
+class TestVerifyDatabase:
+    """Verification against a real database."""
+
+    def test_clean_import_verifies(self, test_session, test_data_dir):
+        """Test that a fresh import of the test data verifies without mismatches."""
+        main.generate_climatological_periods(test_session)
+        main.generate_climatological_variables(test_session)
+        main.generate_climatological_stations(test_session, "ppt")
+        test_session.flush()
+
+        assert verify(test_session, ["ppt"]) == []
+
+    def test_detects_missing_value(self, test_session, test_data_dir):
+        """Test that a deleted value shows up as a station without 12 values."""
+        main.generate_climatological_periods(test_session)
+        main.generate_climatological_variables(test_session)
+        main.generate_climatological_stations(test_session, "ppt")
+        test_session.flush()
+        test_session.delete(test_session.query(main.ClimatologicalValue).first())
+        test_session.flush()
+
+        checks = {m.check for m in verify(test_session, ["ppt"])}
+
+        assert checks == {"values", "stations_without_12_values", "contributing_years"}
+
+
+class TestCheckLocations:
+    """Test cases for check_locations."""
+
+    def test_flags_and_suggests_nearest(self, data_dir):
+        """Test that rows far from their history are flagged with the nearest history suggested."""
+        write_station_file(data_dir, "ppt", [(1, {}), (2, {}), (3, {})])
+        session = MagicMock()
+        # the composite rows are all at (49.0, -123.0)
+        session.query.return_value.filter.return_value = [
+            (1, 49.0, -123.0),
+            (2, 50.0, -123.0),
+            (4, 49.001, -123.0),
+        ]
+
+        mismatches = check_locations(session, ["ppt"], tolerance_km=1.0)
+
+        assert [(m.history_id, m.nearest_history_id) for m in mismatches] == [(2, 1), (3, 1)]
+        assert mismatches[0].distance_km == pytest.approx(111.2, abs=0.5)
+        assert mismatches[1].distance_km is None